@@ -0,0 +1,105 @@
+"""Throughput benchmark of our custom LSTM against the native Keras LSTM.
+
+Compares, on random data, the forward (predict) and training (train_on_batch) throughputs of :
+the original MinimalLSTMCell (implementation 1, 8 matrix products per step), the fused one (implementation 2),
+the fused one with the input projection done once per sequence (ProjectedRNN), and Keras' LSTM.
+
+Example
+-------
+How to use this code : launch it from the root folder.
+The optional arguments are the sequence length and the number of input features
+(100 and 1 for the Sherlock text, 10 and 128 for our midi dataset).
+
+	$ python code/benchmarks/bench_lstm.py 100 1
+	$ python code/benchmarks/bench_lstm.py 10 128
+
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from keras.models import Sequential
+from keras.layers import Dense, LSTM, RNN
+from custom_rnns import MinimalLSTMCell, ProjectedRNN
+
+units = 256
+batch_size = 128
+n_batches = 20
+
+
+def lstm_layer(variant, input_shape, n_units=units):
+	# The recurrent layer of one LSTM variant
+	if variant == 'custom':
+		return RNN(MinimalLSTMCell(n_units), input_shape=input_shape)
+	elif variant == 'custom fused':
+		return RNN(MinimalLSTMCell(n_units, implementation=2), input_shape=input_shape)
+	elif variant == 'custom fused projected':
+		return ProjectedRNN(MinimalLSTMCell(n_units, implementation=2), input_shape=input_shape)
+	elif variant == 'native':
+		return LSTM(n_units, input_shape=input_shape)
+	raise ValueError('Unknown LSTM variant : ' + variant)
+
+
+def build_model(recurrent_layer, n_outputs):
+	# The same architecture as in ex2_keras, with the recurrent layer to benchmark
+	model = Sequential()
+	model.add(recurrent_layer)
+	model.add(Dense(n_outputs, activation='softmax'))
+	model.compile(loss='categorical_crossentropy', optimizer='adam')
+	return model
+
+
+def first_call_and_throughput(function, batches):
+	# The duration of a first warm-up call, then the samples per second of a pass over the batches
+	start = time.time()
+	function(*batches[0])
+	first = time.time() - start
+	start = time.time()
+	for batch in batches:
+		function(*batch)
+	return first, sum(len(batch[0]) for batch in batches) / (time.time() - start)
+
+
+def throughput(function, batches):
+	# Samples per second, after a first warm-up call
+	return first_call_and_throughput(function, batches)[1]
+
+
+def compare_lstms(timesteps, features):
+	""" Prints the forward and training throughputs of each LSTM variant.
+
+	Parameters
+	----------
+	timesteps : int
+		The length of the sequences.
+	features : int
+		The number of input features per timestep.
+
+	Returns
+	-------
+	None.
+		Prints the throughputs, in samples per second.
+
+	"""
+
+	rs = np.random.RandomState(0)
+	n_outputs = features if features > 1 else 60
+	X = rs.rand(n_batches, batch_size, timesteps, features).astype(np.float32)
+	y = np.eye(n_outputs, dtype=np.float32)[rs.randint(n_outputs, size=(n_batches, batch_size))]
+
+	print('%d timesteps, %d features, %d units, batches of %d' % (timesteps, features, units, batch_size))
+	print('%-24s %14s %14s' % ('', 'predict (/s)', 'train (/s)'))
+	for variant in ['custom', 'custom fused', 'custom fused projected', 'native']:
+		model = build_model(lstm_layer(variant, (timesteps, features)), n_outputs)
+		forward = throughput(model.predict_on_batch, [(x,) for x in X])
+		train = throughput(model.train_on_batch, list(zip(X, y)))
+		print('%-24s %14.0f %14.0f' % (variant, forward, train))
+
+
+if __name__ == '__main__':
+	timesteps = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+	features = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+	compare_lstms(timesteps, features)
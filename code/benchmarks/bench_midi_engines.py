@@ -0,0 +1,72 @@
+"""Benchmark of the midi engines of midi_to_data.importMIDI.
+
+Decodes the files of the toy dataset with both music21 and our native reader (midi_reader),
+checks that the pianorolls are identical and compares the decoding times.
+
+Example
+-------
+How to use this code : first build the dataset, then launch the benchmark from the root folder.
+The optional argument is the number of files to decode (all of them by default).
+
+	$ python toy/scripts/main.py
+	$ python code/benchmarks/bench_midi_engines.py 500
+
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+import midi_to_data as md
+
+
+def time_engine(filenames, engine):
+	# Decodes all the files with the given engine, returns the pianorolls and the elapsed time
+	start = time.time()
+	rolls = [md.importMIDI(f, engine) for f in filenames]
+	return rolls, time.time() - start
+
+
+def compare_engines(directory, n_files=None):
+	""" Decodes the midi files of a directory with both engines and prints the comparison.
+
+	Parameters
+	----------
+	directory : str
+		The location of the directory containing the midi files.
+	n_files : int
+		The number of files to decode. All of them by default.
+
+	Returns
+	-------
+	None.
+		Prints the timings.
+
+	"""
+
+	filenames = sorted(directory + f for f in os.listdir(directory) if f.endswith('.mid'))
+	filenames = filenames[:n_files]
+
+	music21_rolls, music21_time = time_engine(filenames, 'music21')
+	native_rolls, native_time = time_engine(filenames, 'native')
+
+	mismatches = 0
+	for f, a, b in zip(filenames, music21_rolls, native_rolls):
+		same = sorted(a) == sorted(b) and all(
+			a[k].shape == b[k].shape and np.array_equal(a[k], b[k]) for k in a)
+		if not same:
+			mismatches += 1
+			print('Mismatch :', f)
+
+	n = len(filenames)
+	print(n, 'files,', mismatches, 'mismatches')
+	print('music21 : %.2f s (%.1f files/s)' % (music21_time, n / music21_time))
+	print('native  : %.2f s (%.1f files/s)' % (native_time, n / native_time))
+	print('speedup : x%.1f' % (music21_time / native_time))
+
+
+if __name__ == '__main__':
+	n_files = int(sys.argv[1]) if len(sys.argv) > 1 else None
+	compare_engines('toy/dataset/progressions/', n_files)
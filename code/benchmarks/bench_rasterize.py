@@ -0,0 +1,104 @@
+"""Microbenchmark of the pianoroll rasterization.
+
+Compares the drawing of the notes one slice at a time (as get_pianoroll_part used to do)
+with the vectorized midi_reader.rasterize_notes, on long multi-minute midi files generated on the fly.
+
+Example
+-------
+How to use this code : launch it from the root folder.
+The optional argument is the length of the generated pieces, in minutes.
+
+	$ python code/benchmarks/bench_rasterize.py 10
+
+"""
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from midiutil.MidiFile import MIDIFile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+import midi_reader as mr
+
+# tempo : 120 bpm
+global_tempo = 120
+
+
+def generate_long_midi(minutes, output_name, seed=0):
+	# Two voices of random sixteenth notes over a bass held for two beats.
+	# The voices use separate ranges, so that no note overlaps another one of the same pitch.
+	rs = np.random.RandomState(seed)
+	mf = MIDIFile(1)
+	mf.addTrackName(0, 0, "Sample Track")
+	mf.addTempo(0, 0, global_tempo)
+	n_beats = int(minutes * global_tempo)
+	for beat in range(n_beats):
+		for sixteenth in range(4):
+			mf.addNote(0, 0, int(rs.randint(60, 84)), beat + sixteenth / 4.0, 0.25, 100)
+			mf.addNote(0, 0, int(rs.randint(48, 60)), beat + sixteenth / 4.0, 0.25, 100)
+		if beat % 2 == 0:
+			mf.addNote(0, 0, int(rs.randint(24, 48)), beat, 2, 100)
+	with open(output_name, 'wb') as outf:
+		mf.writeFile(outf)
+
+
+def rasterize_loop(pitches, starts, ends, duration):
+	# The reference : one slice per note
+	piano_roll_part = np.zeros((128, duration))
+	for pitch, note_start, note_end in zip(pitches, starts, ends):
+		piano_roll_part[pitch, note_start:note_end] = 1
+	return piano_roll_part
+
+
+def best_time(function, args, repeat=5):
+	# The best of several runs is the least noisy measure
+	times = []
+	for _ in range(repeat):
+		start = time.time()
+		result = function(*args)
+		times.append(time.time() - start)
+	return result, min(times)
+
+
+def compare_rasterizations(minutes):
+	""" Rasterizes a generated midi file of the given length with both methods and prints the comparison.
+
+	Parameters
+	----------
+	minutes : float
+		The length of the generated piece.
+
+	Returns
+	-------
+	None.
+		Prints the timings.
+
+	"""
+
+	with tempfile.TemporaryDirectory() as folder:
+		f = os.path.join(folder, 'long.mid')
+		generate_long_midi(minutes, f)
+		ticks_per_quarter, tracks = mr.read_midi_notes(f)
+		_, read_time = best_time(mr.read_pianorolls, (f, 16))
+
+	notes = np.concatenate([notes for name, notes in tracks])
+	starts = np.ceil(notes[:, 1] * 16.0 / ticks_per_quarter).astype(int)
+	ends = np.ceil(notes[:, 2] * 16.0 / ticks_per_quarter).astype(int)
+	args = (notes[:, 0], starts, ends, ends.max())
+
+	loop_roll, loop_time = best_time(rasterize_loop, args)
+	vectorized_roll, vectorized_time = best_time(mr.rasterize_notes, args)
+
+	print('%g minutes, %d notes, %d columns' % (minutes, len(notes), ends.max()))
+	print('identical pianorolls :', np.array_equal(loop_roll, vectorized_roll))
+	print('slice loop : %.1f ms' % (1000 * loop_time))
+	print('vectorized : %.1f ms' % (1000 * vectorized_time))
+	print('speedup    : x%.1f' % (loop_time / vectorized_time))
+	print('whole native read of the file : %.1f ms' % (1000 * read_time))
+
+
+if __name__ == '__main__':
+	minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+	compare_rasterizations(minutes)
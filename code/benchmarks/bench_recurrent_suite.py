@@ -0,0 +1,209 @@
+"""Benchmark suite of our custom recurrent layers against the native Keras ones, on CPU.
+
+Each layer type is run over a grid of sequence lengths, batch sizes and numbers of units, on random data.
+For each configuration are measured :
+the time to build and compile the model, the latency of the first predict and train steps
+(which include the construction of the Keras functions), the forward (predict_on_batch)
+and training (train_on_batch) throughputs in samples per second, and the peak memory of the process.
+The LSTM layer types are those of bench_lstm : our MinimalLSTMCell with implementation 1 (minimal_lstm),
+with implementation 2 (minimal_lstm_fused), with implementation 2 and ProjectedRNN (minimal_lstm_projected),
+and Keras' LSTM.
+Each configuration runs in its own process, so that the memory and first-step measures do not depend on the
+previous ones. The results are written to a JSON file, which can be compared with a previous run.
+
+Example
+-------
+How to use this code : launch it from the root folder.
+
+	$ python code/benchmarks/bench_recurrent_suite.py
+	$ python code/benchmarks/bench_recurrent_suite.py --layers minimal_lstm lstm --timesteps 10 100 --units 256
+	$ python code/benchmarks/bench_recurrent_suite.py --compare code/benchmarks/results/recurrent-20171222-120000.json
+
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib')
+
+layer_types = ['minimal_rnn', 'minimal_rnn_projected', 'simple_rnn',
+			   'minimal_lstm', 'minimal_lstm_fused', 'minimal_lstm_projected', 'lstm']
+
+# The LSTM layer types, as variants of bench_lstm : MinimalLSTMCell with implementation 1, then 2
+lstm_variants = {'minimal_lstm': 'custom', 'minimal_lstm_fused': 'custom fused',
+				 'minimal_lstm_projected': 'custom fused projected', 'lstm': 'native'}
+
+
+def build_model(layer_type, timesteps, features, units):
+	# The model of bench_lstm, with the recurrent layer to benchmark
+	sys.path.insert(0, lib_path)
+	import bench_lstm
+	from keras.layers import RNN, SimpleRNN
+	from custom_rnns import MinimalRNNCell, ProjectedRNN
+
+	input_shape = (timesteps, features)
+	if layer_type in lstm_variants:
+		layer = bench_lstm.lstm_layer(lstm_variants[layer_type], input_shape, units)
+	elif layer_type == 'minimal_rnn':
+		layer = RNN(MinimalRNNCell(units), input_shape=input_shape)
+	elif layer_type == 'minimal_rnn_projected':
+		layer = ProjectedRNN(MinimalRNNCell(units), input_shape=input_shape)
+	elif layer_type == 'simple_rnn':
+		layer = SimpleRNN(units, input_shape=input_shape)
+	return bench_lstm.build_model(layer, features)
+
+
+def peak_memory_mb():
+	# The peak resident memory of this process (ru_maxrss is in kilobytes on Linux, in bytes on macOS)
+	import resource
+	maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return maxrss / (1024. * 1024.) if sys.platform == 'darwin' else maxrss / 1024.
+
+
+def run_configuration(config):
+	""" Measures one configuration, in the current process.
+
+	Parameters
+	----------
+	config : dict
+		The layer type, timesteps, features, units, batch_size, n_batches and seed.
+
+	Returns
+	-------
+	measures : dict
+		The configuration, with build_seconds, first_predict_seconds, first_train_seconds,
+		predict_samples_per_second, train_samples_per_second and peak_memory_mb.
+
+	"""
+
+	rs = np.random.RandomState(config['seed'])
+	n_batches, batch_size = config['n_batches'], config['batch_size']
+	X = rs.rand(n_batches, batch_size, config['timesteps'], config['features']).astype(np.float32)
+	y = np.eye(config['features'], dtype=np.float32)[rs.randint(config['features'], size=(n_batches, batch_size))]
+
+	start = time.time()
+	model = build_model(config['layer'], config['timesteps'], config['features'], config['units'])
+	build = time.time() - start
+
+	# Imported by build_model, with Keras
+	import bench_lstm
+	first_predict, predict = bench_lstm.first_call_and_throughput(model.predict_on_batch, [(x,) for x in X])
+	first_train, train = bench_lstm.first_call_and_throughput(model.train_on_batch, list(zip(X, y)))
+	return dict(config, build_seconds=build, first_predict_seconds=first_predict, first_train_seconds=first_train,
+				predict_samples_per_second=predict, train_samples_per_second=train,
+				peak_memory_mb=peak_memory_mb())
+
+
+def run_in_subprocess(config):
+	# Runs a configuration in a fresh process, on CPU only
+	env = dict(os.environ, CUDA_VISIBLE_DEVICES='')
+	output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--configuration', json.dumps(config)],
+									 env=env, universal_newlines=True)
+	# Keras may print before the results, which are on the last line
+	return json.loads(output.strip().split('\n')[-1])
+
+
+def environment():
+	# What the results depend on, besides the configuration
+	info = {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+			'processor': platform.processor(), 'cpu_count': os.cpu_count(), 'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+	try:
+		versions = subprocess.check_output(
+			[sys.executable, '-c', 'import keras, tensorflow; print(keras.__version__, tensorflow.__version__)'],
+			universal_newlines=True, stderr=subprocess.DEVNULL).split()
+		info['keras'], info['tensorflow'] = versions[-2:]
+	except (subprocess.CalledProcessError, ValueError):
+		pass
+	return info
+
+
+def compare(results, previous):
+	# Prints the throughput ratios to a previous run, for the configurations they share
+	keys = ['layer', 'timesteps', 'features', 'units', 'batch_size']
+	previous = dict((tuple(r[k] for k in keys), r) for r in previous['results'])
+	print('\nRatios to the previous run (> 1 is faster) :')
+	for result in results:
+		old = previous.get(tuple(result[k] for k in keys))
+		if old is not None:
+			print('%-24s %4d %4d %4d  predict x%.2f  train x%.2f' % (
+				result['layer'], result['timesteps'], result['units'], result['batch_size'],
+				result['predict_samples_per_second'] / old['predict_samples_per_second'],
+				result['train_samples_per_second'] / old['train_samples_per_second']))
+
+
+def run_suite(layers, timesteps, batch_sizes, units, features=60, n_batches=10, seed=0):
+	""" Runs each layer type over the grid of configurations, each in its own process.
+
+	Parameters
+	----------
+	layers : str list
+		The layer types (see layer_types).
+	timesteps, batch_sizes, units : int lists
+		The grid of sequence lengths, batch sizes and numbers of units.
+	features : int
+		The number of input features and of outputs.
+	n_batches : int
+		The number of batches timed, for each step.
+	seed : int
+		The seed of the random data.
+
+	Returns
+	-------
+	results : dict list
+		The measures of each configuration (see run_configuration).
+
+	"""
+
+	results = []
+	print('%-24s %4s %5s %4s %10s %10s %8s %8s %8s %8s' % (
+		'layer', 'len', 'batch', 'units', 'predict/s', 'train/s', 'build s', '1st pred', '1st trn', 'peak MB'))
+	for layer, length, batch_size, n_units in itertools.product(layers, timesteps, batch_sizes, units):
+		config = {'layer': layer, 'timesteps': length, 'features': features, 'units': n_units,
+				  'batch_size': batch_size, 'n_batches': n_batches, 'seed': seed}
+		result = run_in_subprocess(config)
+		results.append(result)
+		print('%-24s %4d %5d %4d %10.0f %10.0f %8.2f %8.2f %8.2f %8.0f' % (
+			layer, length, batch_size, n_units, result['predict_samples_per_second'],
+			result['train_samples_per_second'], result['build_seconds'], result['first_predict_seconds'],
+			result['first_train_seconds'], result['peak_memory_mb']))
+	return results
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmarks our custom recurrent layers against the native ones.')
+	parser.add_argument('--layers', nargs='+', default=layer_types, choices=layer_types)
+	parser.add_argument('--timesteps', type=int, nargs='+', default=[10, 100])
+	parser.add_argument('--batch-sizes', type=int, nargs='+', default=[32, 128])
+	parser.add_argument('--units', type=int, nargs='+', default=[64, 256])
+	parser.add_argument('--features', type=int, default=60)
+	parser.add_argument('--n-batches', type=int, default=10)
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--output', help='the JSON file of the results (in code/benchmarks/results/ by default)')
+	parser.add_argument('--compare', help='the JSON file of a previous run')
+	parser.add_argument('--configuration', help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.configuration is not None:
+		# In the subprocess of one configuration
+		print(json.dumps(run_configuration(json.loads(args.configuration))))
+		sys.exit()
+
+	results = run_suite(args.layers, args.timesteps, args.batch_sizes, args.units, args.features,
+						args.n_batches, args.seed)
+	output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+										 time.strftime('recurrent-%Y%m%d-%H%M%S.json'))
+	if not os.path.exists(os.path.dirname(os.path.abspath(output))):
+		os.makedirs(os.path.dirname(os.path.abspath(output)))
+	with open(output, 'w') as f:
+		json.dump({'environment': environment(), 'results': results}, f, indent=1)
+	print('Results written to', output)
+	if args.compare is not None:
+		with open(args.compare) as f:
+			compare(results, json.load(f))
@@ -0,0 +1,370 @@
+"""Module chord_server.
+
+A local HTTP server predicting the next chord of 10-chord sequences, to call our models interactively
+(e.g. from a sequencer). The models are loaded once and stay in memory. Concurrent requests to the same model
+are grouped into micro-batches, so that a single model.predict call serves all of them.
+
+Requests
+--------
+	POST /predict
+		Either a JSON body : {"model": "MidiCNNModel2", "chords": [[60, 64, 67], ...], "threshold": 0.5}
+		where "chords" holds the midi pitches of the 10 chords,
+		or the bytes of a midi file (Content-Type: audio/midi), with the model given in the query string.
+		The predicted chord is returned as JSON ({"model": ..., "pitches": [...]}),
+		or as a midi file with format=midi (in the JSON body or the query string).
+	GET /metrics
+		The number of requests and batches, and the p50 / p99 latencies, per model and overall.
+
+Example
+-------
+How to use this code
+
+	$ python code/lib/chord_server.py --port 8000 --models MidiCNNModel2
+	$ curl -d '{"model": "MidiCNNModel2", "chords": [[60, 64, 67], [60, 65, 69], ...]}' localhost:8000/predict
+	$ curl --data-binary @xEiffel_p0_t0.mid -H 'Content-Type: audio/midi' \
+		'localhost:8000/predict?model=MidiCNNModel2&format=midi' > pred.mid
+	$ curl localhost:8000/metrics
+
+"""
+
+import argparse
+import collections
+import io
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+
+import midi_reader as mr
+import model_registry as reg
+import numpy_rnn as nr
+
+# The pianoroll columns of the 10 chords of a sequence, as midi_to_data.columns_to_keep
+columns_to_keep = [16 * i for i in range(10)]
+
+
+class ModelWorker:
+	""" Keeps a model in memory and predicts the queued sequences by batches, in a dedicated thread.
+	The model is loaded and called from this thread only, as Keras expects.
+
+	Attributes
+	----------
+	name : str
+		The name of the model, i.e. its file name without extension.
+	max_batch_size : int
+		The maximum number of sequences predicted at once.
+	max_delay : float
+		How long (in seconds) the first request of a batch waits for other ones.
+
+	Example
+	-------
+	How to use this class
+
+			worker = ModelWorker('MidiCNNModel2', 'code/models/MidiCNNModel2.h5')
+			y = worker.predict(x)
+
+	"""
+
+	def __init__(self, name, path, max_batch_size=256, max_delay=0.002):
+		self.name = name
+		self.path = path
+		self.max_batch_size = max_batch_size
+		self.max_delay = max_delay
+		self.requests = queue.Queue()
+		self.n_batches = 0
+		self.n_sequences = 0
+		self.error = None
+		self.loaded = threading.Event()
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def load(self):
+		if self.path.endswith('.npz'):
+			return nr.NumpyModel.load(self.path)
+		# Keras is only imported for Keras models, by the registry
+		return reg.models.get(self.path)
+
+	def run(self):
+		try:
+			model = self.load()
+		except Exception as e:
+			self.error = e
+		self.loaded.set()
+		if self.error is not None:
+			return
+		input_shape = getattr(model, 'input_shape', None)
+
+		while True:
+			batch = [self.requests.get()]
+			deadline = time.time() + self.max_delay
+			while len(batch) < self.max_batch_size:
+				try:
+					batch.append(self.requests.get(timeout=max(deadline - time.time(), 0)))
+				except queue.Empty:
+					break
+
+			# Any error fails the requests of the batch, and the worker goes on with the next one
+			try:
+				X = np.stack([x for (x, result, done) in batch])
+				if input_shape is not None:
+					X = np.reshape(X, (len(X),) + tuple(input_shape[1:]))
+				y = model.predict(X, batch_size=len(X))
+			except Exception as e:
+				y = [e] * len(batch)
+			self.n_batches += 1
+			self.n_sequences += len(batch)
+			for (x, result, done), y_predicted in zip(batch, y):
+				result.append(y_predicted)
+				done.set()
+
+	def predict(self, x):
+		""" Predicts the next chord of one sequence, waiting for the batch it is part of.
+
+		Parameters
+		----------
+		x : np array
+			The (10, 128) chords of the sequence.
+
+		Returns
+		-------
+		y_predicted : np array
+			The 128 outputs of the model.
+
+		"""
+
+		self.loaded.wait()
+		if self.error is not None:
+			raise self.error
+		result = []
+		done = threading.Event()
+		self.requests.put((x, result, done))
+		done.wait()
+		if isinstance(result[0], Exception):
+			raise result[0]
+		return result[0]
+
+
+class ChordServer(ThreadingMixIn, HTTPServer):
+	""" The HTTP server : one thread per connection, and one ModelWorker per model.
+
+	Attributes
+	----------
+	model_dir : str
+		The directory of the models, served by file name ('.h5' Keras models or '.npz' numpy_rnn models).
+	workers : dict of str -> ModelWorker
+		The models loaded so far.
+
+	"""
+
+	daemon_threads = True
+	# Many clients may connect at once, waiting for the same batch
+	request_queue_size = 128
+
+	def __init__(self, address, model_dir='code/models/', models=(), max_batch_size=256, max_delay=0.002):
+		HTTPServer.__init__(self, address, ChordRequestHandler)
+		self.model_dir = model_dir
+		self.max_batch_size = max_batch_size
+		self.max_delay = max_delay
+		self.workers = {}
+		self.lock = threading.Lock()
+		# The latencies of the last requests, per model
+		self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=10000))
+		for name in models:
+			self.get_worker(name)
+
+	def get_worker(self, name):
+		""" Finds the worker of a model, loading the model on first use.
+
+		Parameters
+		----------
+		name : str
+			The file name of the model, without extension.
+
+		Returns
+		-------
+		worker : ModelWorker
+			Its worker, or None if there is no such model.
+
+		"""
+
+		with self.lock:
+			if name in self.workers:
+				return self.workers[name]
+			if os.path.basename(name) != name:
+				return None
+			for extension in ('.npz', '.h5'):
+				path = os.path.join(self.model_dir, name + extension)
+				if os.path.exists(path):
+					self.workers[name] = ModelWorker(name, path, self.max_batch_size, self.max_delay)
+					return self.workers[name]
+		return None
+
+	def record(self, name, latency):
+		with self.lock:
+			self.latencies[name].append(latency)
+
+	def metrics(self):
+		""" Summarizes the requests served so far.
+
+		Returns
+		-------
+		metrics : dict
+			The number of requests and the p50 / p99 latencies (in milliseconds), overall and per model,
+			with the number of batches and their mean size.
+
+		"""
+
+		def summary(latencies):
+			if not latencies:
+				return {'requests': 0, 'p50_ms': None, 'p99_ms': None}
+			p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+			return {'requests': len(latencies), 'p50_ms': round(p50, 3), 'p99_ms': round(p99, 3)}
+
+		with self.lock:
+			latencies = dict((name, list(values)) for name, values in self.latencies.items())
+			workers = list(self.workers.values())
+		metrics = summary(sum(latencies.values(), []))
+		metrics['models'] = {}
+		for worker in workers:
+			model_metrics = summary(latencies.get(worker.name, []))
+			model_metrics['batches'] = worker.n_batches
+			model_metrics['mean_batch_size'] = round(worker.n_sequences / float(max(worker.n_batches, 1)), 3)
+			metrics['models'][worker.name] = model_metrics
+		return metrics
+
+
+def chords_from_pitches(chords):
+	# The (10, 128) pianoroll of a list of 10 lists of midi pitches
+	if len(chords) != len(columns_to_keep):
+		raise ValueError('Expected %d chords, got %d.' % (len(columns_to_keep), len(chords)))
+	x = np.zeros((len(columns_to_keep), 128), dtype=np.float32)
+	for t, pitches in enumerate(chords):
+		pitches = np.asarray(pitches, dtype=int)
+		if np.any((pitches < 0) | (pitches > 127)):
+			raise ValueError('Midi pitches must lie between 0 and 127.')
+		x[t, pitches] = 1
+	return x
+
+
+def midi_from_pitches(pitches):
+	# The bytes of a midi file playing one chord for one beat, as written by predict_chords.data_to_midi.
+	# MIDIUtil is only needed for this output format
+	from midiutil.MidiFile import MIDIFile
+	mf = MIDIFile(1)
+	mf.addTrackName(0, 0, "Sample Track")
+	mf.addTempo(0, 0, 60)
+	for pitch in pitches:
+		mf.addNote(0, 0, int(pitch), 0, 1, 100)
+	midi_file = io.BytesIO()
+	mf.writeFile(midi_file)
+	return midi_file.getvalue()
+
+
+def chords_from_midi(data):
+	# The (10, 128) pianoroll of a midi file, read like midi_to_data.decode_data
+	all_parts = mr.read_pianorolls(data, 16)
+	if not all_parts:
+		raise ValueError('The midi data contains no notes.')
+	piano_roll = all_parts['None']
+	if piano_roll.shape[1] <= columns_to_keep[-1]:
+		raise ValueError('The midi data must contain %d chords.' % len(columns_to_keep))
+	return np.transpose(piano_roll[:, columns_to_keep]).astype(np.float32)
+
+
+class ChordRequestHandler(BaseHTTPRequestHandler):
+
+	def log_message(self, format, *args):
+		# No line per request on stderr
+		pass
+
+	def send(self, code, body, content_type='application/json'):
+		if content_type == 'application/json':
+			body = json.dumps(body).encode('utf-8')
+		self.send_response(code)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		if urlsplit(self.path).path == '/metrics':
+			self.send(200, self.server.metrics())
+		else:
+			self.send(404, {'error': 'Unknown path : ' + self.path})
+
+	def do_POST(self):
+		start = time.time()
+		url = urlsplit(self.path)
+		if url.path != '/predict':
+			self.send(404, {'error': 'Unknown path : ' + self.path})
+			return
+		options = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+
+		try:
+			length = int(self.headers.get('Content-Length', 0))
+			if length < 0:
+				raise ValueError('Negative Content-Length.')
+			body = self.rfile.read(length)
+			if self.headers.get('Content-Type') == 'audio/midi' or body[:4] == b'MThd':
+				x = chords_from_midi(body)
+			else:
+				request = json.loads(body.decode('utf-8'))
+				if not isinstance(request, dict):
+					raise ValueError('The JSON body must be an object.')
+				options.update((key, value) for key, value in request.items() if key != 'chords')
+				x = chords_from_pitches(request['chords'])
+			if not isinstance(options.get('model', ''), str):
+				raise ValueError('The model must be given by its name.')
+			threshold = float(options.get('threshold', 0.5))
+			n_notes = int(options['n_notes']) if 'n_notes' in options else None
+		except (ValueError, KeyError, TypeError, IndexError) as e:
+			self.send(400, {'error': 'Invalid request : ' + str(e)})
+			return
+
+		name = options.get('model')
+		worker = self.server.get_worker(name) if name else None
+		if worker is None:
+			self.send(404, {'error': 'Unknown model : ' + str(name)})
+			return
+		try:
+			y_predicted = worker.predict(x)
+		except Exception as e:
+			self.send(500, {'error': 'Prediction failed : ' + str(e)})
+			return
+
+		if n_notes is None:
+			pitches = np.nonzero(y_predicted > threshold)[0]
+		else:
+			pitches = np.sort(np.argsort(y_predicted)[len(y_predicted) - n_notes:])
+
+		if options.get('format') == 'midi':
+			try:
+				body, content_type = midi_from_pitches(pitches), 'audio/midi'
+			except Exception as e:
+				self.send(500, {'error': 'Midi output failed : ' + str(e)})
+				return
+		else:
+			body, content_type = {'model': name, 'pitches': pitches.tolist()}, 'application/json'
+		# Recorded before the response, so that a client reading /metrics right after it sees this request
+		self.server.record(name, time.time() - start)
+		self.send(200, body, content_type)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Serves the next chord predictions of our models over HTTP.')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8000)
+	parser.add_argument('--model-dir', default='code/models/')
+	parser.add_argument('--models', nargs='*', default=[], help='the models to load at startup')
+	parser.add_argument('--max-batch-size', type=int, default=256)
+	parser.add_argument('--max-delay', type=float, default=0.002, help='in seconds')
+	args = parser.parse_args()
+	server = ChordServer((args.host, args.port), args.model_dir, args.models, args.max_batch_size, args.max_delay)
+	print('Serving on http://%s:%d' % server.server_address[:2])
+	server.serve_forever()
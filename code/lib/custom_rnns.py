@@ -5,7 +5,7 @@ Example
 -------
 How to use this code
 
-	from custom_rnns import MinimalLSTMCell, MinimalRNNCell
+	from custom_rnns import MinimalLSTMCell, MinimalRNNCell, ProjectedRNN
 
 """
 
@@ -23,12 +23,16 @@ class MinimalRNNCell(keras.layers.Layer):
 		The number of hidden units in the layer.
 	state_size : int
 		In such a  single state RNN, it is the size of the cell output.
+	inputs_projected : bool
+		Set by ProjectedRNN : the inputs are already multiplied by the forward kernel.
 
 	Example
 	-------
 	How to use this class
 
 			model.add(RNN(MinimalRNNCell(256), input_shape=(X.shape[1], X.shape[2])))
+			# Faster :
+			model.add(ProjectedRNN(MinimalRNNCell(256), input_shape=(X.shape[1], X.shape[2])))
 
 	"""
 
@@ -36,6 +40,7 @@ class MinimalRNNCell(keras.layers.Layer):
 
 		self.units = units
 		self.state_size = units
+		self.inputs_projected = False
 		super(MinimalRNNCell, self).__init__(**kwargs)
 
 	def build(self, input_shape):
@@ -54,12 +59,20 @@ class MinimalRNNCell(keras.layers.Layer):
 	def call(self, inputs, states):
 		# Get the state of the previous iteration
 		prev_output = states[0]
-		# First apply the forward kernel
-		h = K.dot(inputs, self.kernel)
+		# First apply the forward kernel (unless ProjectedRNN already did)
+		if self.inputs_projected:
+			h = inputs
+		else:
+			h = K.dot(inputs, self.kernel)
 		# Then the recurrent kernel.
 		output = h + K.dot(prev_output, self.recurrent_kernel)
 		return output, [output]
 
+	def get_config(self):
+		config = {'units': self.units}
+		base_config = super(MinimalRNNCell, self).get_config()
+		return dict(list(base_config.items()) + list(config.items()))
+
 
 class MinimalLSTMCell(keras.layers.Layer):
 	""" Basic LSTM Cell.
@@ -70,20 +83,30 @@ class MinimalLSTMCell(keras.layers.Layer):
 		The number of hidden units in the layer.
 	state_size : (int, int)
 		The sizes of the outputs [h, c] of both states
+	implementation : int
+		Like in Keras' LSTM : 1 computes each gate with its own matrix products (8 per step),
+		2 computes all the gates at once with a single product by each kernel, then splits the result.
+		Both give the same results, up to floating point rounding : use 1 to reproduce our trainings exactly.
+	inputs_projected : bool
+		Set by ProjectedRNN : the inputs are already multiplied by the forward kernel.
 
 	Example
 	-------
 	How to use this class
 
 			model.add(RNN(MinimalLSTMCell(256), input_shape=(X.shape[1], X.shape[2])))
+			# Faster :
+			model.add(ProjectedRNN(MinimalLSTMCell(256, implementation=2), input_shape=(X.shape[1], X.shape[2])))
 
 	"""
 
-	def __init__(self, units, **kwargs):
+	def __init__(self, units, implementation=1, **kwargs):
 
 		super(MinimalLSTMCell, self).__init__(**kwargs)
 		self.units = units
 		self.state_size = (self.units, self.units)
+		self.implementation = implementation
+		self.inputs_projected = False
 
 	def build(self, input_shape):
 
@@ -117,16 +140,111 @@ class MinimalLSTMCell(keras.layers.Layer):
 		h_tm1 = states[0]  # previous memory state
 		c_tm1 = states[1]  # previous carry state
 
-		x_i = K.dot(inputs, self.kernel_i)
-		x_f = K.dot(inputs, self.kernel_f)
-		x_c = K.dot(inputs, self.kernel_c)
-		x_o = K.dot(inputs, self.kernel_o)
-
-		i = K.hard_sigmoid(x_i + K.dot(h_tm1, self.recurrent_kernel_i))
-		f = K.hard_sigmoid(x_f + K.dot(h_tm1, self.recurrent_kernel_f))
-		c = f * c_tm1 + i * K.tanh(x_c + K.dot(h_tm1, self.recurrent_kernel_c))
-		o = K.hard_sigmoid(x_o + K.dot(h_tm1, self.recurrent_kernel_o))
+		if self.implementation == 2:
+			# All the gates at once
+			if self.inputs_projected:
+				x = inputs
+			else:
+				x = K.dot(inputs, self.kernel)
+			z = x + K.dot(h_tm1, self.recurrent_kernel)
+			z_i = z[:, :self.units]
+			z_f = z[:, self.units: self.units * 2]
+			z_c = z[:, self.units * 2: self.units * 3]
+			z_o = z[:, self.units * 3:]
+		else:
+			if self.inputs_projected:
+				x_i = inputs[:, :self.units]
+				x_f = inputs[:, self.units: self.units * 2]
+				x_c = inputs[:, self.units * 2: self.units * 3]
+				x_o = inputs[:, self.units * 3:]
+			else:
+				x_i = K.dot(inputs, self.kernel_i)
+				x_f = K.dot(inputs, self.kernel_f)
+				x_c = K.dot(inputs, self.kernel_c)
+				x_o = K.dot(inputs, self.kernel_o)
+			z_i = x_i + K.dot(h_tm1, self.recurrent_kernel_i)
+			z_f = x_f + K.dot(h_tm1, self.recurrent_kernel_f)
+			z_c = x_c + K.dot(h_tm1, self.recurrent_kernel_c)
+			z_o = x_o + K.dot(h_tm1, self.recurrent_kernel_o)
+
+		i = K.hard_sigmoid(z_i)
+		f = K.hard_sigmoid(z_f)
+		c = f * c_tm1 + i * K.tanh(z_c)
+		o = K.hard_sigmoid(z_o)
 
 		h = o * K.tanh(c)
 
 		return h, [h, c]
+
+	def get_config(self):
+		config = {'units': self.units, 'implementation': self.implementation}
+		base_config = super(MinimalLSTMCell, self).get_config()
+		return dict(list(base_config.items()) + list(config.items()))
+
+
+class ProjectedRNN(keras.layers.RNN):
+	""" RNN layer computing the forward projection of the whole sequence before the recurrence.
+	The product of the inputs by the forward kernel of the cell is done in one large matrix product over
+	all the timesteps, instead of one small product per step : only the recurrent product stays in the loop.
+	The weights are the same as those of RNN(cell), so a trained RNN can be converted with
+	projected_model.set_weights(model.get_weights()).
+
+	Attributes
+	----------
+	cell : MinimalRNNCell or MinimalLSTMCell
+		The recurrent cell. Its inputs_projected attribute is set by the layer.
+
+	Example
+	-------
+	How to use this class
+
+			model.add(ProjectedRNN(MinimalRNNCell(256), input_shape=(X.shape[1], X.shape[2])))
+			model.add(ProjectedRNN(MinimalLSTMCell(256, implementation=2), input_shape=(X.shape[1], X.shape[2])))
+
+	"""
+
+	def __init__(self, cell, **kwargs):
+
+		if not hasattr(cell, 'inputs_projected'):
+			raise ValueError('ProjectedRNN needs a cell accepting projected inputs, not ' + type(cell).__name__)
+		cell.inputs_projected = True
+		super(ProjectedRNN, self).__init__(cell, **kwargs)
+
+	def call(self, inputs, mask=None, training=None, initial_state=None, **kwargs):
+		# (batch, timesteps, features) . (features, units * gates) for the whole sequence at once
+		if isinstance(inputs, list):
+			inputs = [K.dot(inputs[0], self.cell.kernel)] + inputs[1:]
+		else:
+			inputs = K.dot(inputs, self.cell.kernel)
+		return super(ProjectedRNN, self).call(
+			inputs, mask=mask, training=training, initial_state=initial_state, **kwargs)
+
+
+def project_model(model):
+	""" Converts a trained Sequential model, replacing its RNN layers over our cells by ProjectedRNN ones.
+	The weights are copied as they are : no retraining is needed.
+
+	Parameters
+	----------
+	model : keras.models.Sequential
+		The model, for instance loaded with keras.models.load_model.
+
+	Returns
+	-------
+	projected_model : keras.models.Sequential
+		The same network, with the input projections computed once per sequence.
+
+	"""
+
+	config = model.get_config()
+	# Depending on the version of Keras, a list of layers or a dict containing it
+	layers = config['layers'] if isinstance(config, dict) else config
+	for layer in layers:
+		cell = layer['config'].get('cell')
+		if layer['class_name'] == 'RNN' and cell['class_name'] in ('MinimalRNNCell', 'MinimalLSTMCell'):
+			layer['class_name'] = 'ProjectedRNN'
+	custom_objects = {'MinimalRNNCell': MinimalRNNCell, 'MinimalLSTMCell': MinimalLSTMCell,
+					  'ProjectedRNN': ProjectedRNN}
+	projected_model = keras.models.Sequential.from_config(config, custom_objects=custom_objects)
+	projected_model.set_weights(model.get_weights())
+	return projected_model
@@ -0,0 +1,276 @@
+"""Module embedding_index.
+
+A nearest neighbour index over the embedding space of our models (see visualize_embedding) :
+it finds the progressions (or chords) whose embeddings are the most similar to those of a query,
+e.g. a midi file. The search is exact : the cosine similarities are computed by blocked matrix products,
+which takes milliseconds for our datasets. The index can be saved to disk, and grown incrementally.
+
+Example
+-------
+How to use this code
+
+	import embedding_index as ei
+	import model_registry as reg
+	model = reg.models.get('MidiCNNModel3')
+	index = ei.build_index(model, 'toy/dataset/progressions/')
+	index.save('toy/dataset/progressions.index.npz')
+
+	index = ei.EmbeddingIndex.load('toy/dataset/progressions.index.npz')
+	names, similarities = ei.query_midi(index, model, ['toy/dataset/progressions/xEiffel_p0_t0.mid'], k=5)
+
+"""
+
+import numpy as np
+
+import read_write_helpers as rw
+
+
+def normalize(vectors):
+	# Scales each vector to unit norm (zero vectors stay zero), so that dot products are cosine similarities
+	vectors = np.asarray(vectors, dtype=np.float32)
+	norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+	return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingIndex:
+	""" An exact cosine similarity index over embedding vectors, each with a name.
+
+	Attributes
+	----------
+	names : str np array
+		The name of each vector, e.g. the midi file of the progression.
+	vectors : np array
+		The (n, dim) normalized vectors.
+	block_size : int
+		The number of vectors compared to the queries at once, which bounds the memory of a search.
+
+	Example
+	-------
+	How to use this class
+
+			index = EmbeddingIndex()
+			index.add(embeddings, names)
+			names, similarities = index.query(embeddings[:3], k=5)
+
+	"""
+
+	def __init__(self, block_size=65536):
+		self.block_size = block_size
+		self.n = 0
+		# The vectors are stored with some spare capacity, so that adding a few ones does not copy all of them
+		self.storage = np.zeros((0, 0), dtype=np.float32)
+		self.name_storage = np.zeros(0, dtype=str)
+
+	@property
+	def vectors(self):
+		return self.storage[:self.n]
+
+	@property
+	def names(self):
+		return self.name_storage[:self.n]
+
+	def __len__(self):
+		return self.n
+
+	def add(self, embeddings, names):
+		""" Adds vectors to the index.
+
+		Parameters
+		----------
+		embeddings : np array
+			The (n, dim) embeddings, or (n, timesteps, features) ones, which are flattened.
+		names : str list
+			The name of each embedding.
+
+		Returns
+		-------
+		None.
+
+		"""
+
+		vectors = normalize(np.reshape(embeddings, (len(embeddings), -1)))
+		names = np.asarray(names, dtype=str)
+		if len(names) != len(vectors):
+			raise ValueError('%d names given for %d embeddings.' % (len(names), len(vectors)))
+		if self.n > 0 and vectors.shape[1] != self.storage.shape[1]:
+			raise ValueError('Embeddings of dimension %d added to an index of dimension %d.'
+							 % (vectors.shape[1], self.storage.shape[1]))
+
+		n_total = self.n + len(vectors)
+		if n_total > len(self.storage) or self.n == 0:
+			capacity = max(n_total, 2 * len(self.storage))
+			storage = np.zeros((capacity, vectors.shape[1]), dtype=np.float32)
+			if self.n > 0:
+				storage[:self.n] = self.vectors
+			self.storage = storage
+		if n_total > len(self.name_storage) or names.dtype.itemsize > self.name_storage.dtype.itemsize:
+			name_storage = np.zeros(len(self.storage), dtype=np.result_type(self.name_storage, names))
+			name_storage[:self.n] = self.names
+			self.name_storage = name_storage
+		self.storage[self.n:n_total] = vectors
+		self.name_storage[self.n:n_total] = names
+		self.n = n_total
+
+	def search(self, queries, k=10):
+		""" Finds the k most similar vectors to each query.
+
+		Parameters
+		----------
+		queries : np array
+			The (q, dim) query embeddings (flattened like in add).
+		k : int
+			The number of neighbours.
+
+		Returns
+		-------
+		rows : int np array
+			The (q, k) rows of the neighbours in the index, from the most similar.
+		similarities : np array
+			The (q, k) cosine similarities.
+
+		"""
+
+		queries = normalize(np.reshape(queries, (len(queries), -1)))
+		k = min(k, self.n)
+		all_queries = np.arange(len(queries))[:, None]
+		best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+		best_similarities = np.zeros((len(queries), 0), dtype=np.float32)
+		for start in range(0, self.n, self.block_size):
+			block = self.vectors[start:start + self.block_size]
+			# The best neighbours so far, and the ones of this block
+			similarities = np.concatenate([best_similarities, queries.dot(block.T)], axis=1)
+			rows = np.concatenate([best_rows, np.broadcast_to(
+				np.arange(start, start + len(block)), (len(queries), len(block)))], axis=1)
+			top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+			best_rows = rows[all_queries, top]
+			best_similarities = similarities[all_queries, top]
+		order = np.argsort(-best_similarities, axis=1, kind='mergesort')
+		return best_rows[all_queries, order], best_similarities[all_queries, order]
+
+	def query(self, queries, k=10):
+		""" Same as search, returning the names of the neighbours.
+
+		Returns
+		-------
+		names : str np array
+			The (q, k) names of the neighbours, from the most similar.
+		similarities : np array
+			The (q, k) cosine similarities.
+
+		"""
+
+		rows, similarities = self.search(queries, k)
+		return self.names[rows], similarities
+
+	def save(self, filename):
+		# An interrupted save leaves the previous index intact
+		rw.atomic_write(filename, lambda f: np.savez(f, names=self.names, vectors=self.vectors))
+
+	@classmethod
+	def load(cls, filename, block_size=65536):
+		index = cls(block_size)
+		with np.load(filename, allow_pickle=False) as archive:
+			index.add(archive['vectors'], archive['names'])
+		return index
+
+
+def embed_midi_files(model, filenames, engine='music21', timesteps=None, layer=6):
+	""" Computes the embeddings of midi files, as visualize_embedding does for the dataset.
+
+	Parameters
+	----------
+	model : keras.models.Model
+		The model that defines the embedding space.
+	filenames : str list
+		The midi files, whose first 10 chords are embedded (see midi_to_data.decode_data).
+	engine : str
+		The midi decoder : 'music21' or 'native' (see midi_to_data.importMIDI).
+	timesteps : int list
+		The chords whose embeddings are kept (all by default : one vector per progression).
+	layer : int
+		The index of the layer whose output is the embedding.
+
+	Returns
+	-------
+	embeddings : np array
+		The embeddings of the files.
+
+	"""
+
+	# Keras is only needed to compute embeddings, not to search the index
+	import midi_to_data as md
+	import visualize_embedding as vis
+	X = np.array([md.decode_data(f, engine) for f in filenames])
+	return vis.extract_embeddings(X, model, timesteps=timesteps, layer=layer)
+
+
+def build_index(model, directory, engine='music21', workers=1, timesteps=None, layer=6, batch_size=256,
+				index=None):
+	""" Indexes the progressions of a dataset directory, or the ones missing from an existing index.
+
+	Parameters
+	----------
+	model : keras.models.Model
+		The model that defines the embedding space.
+	directory : str
+		The location of the directory containing the midi files.
+	engine, workers :
+		The midi decoder and the number of processes decoding the files (see midi_to_data.load_pianorolls).
+	timesteps : int list
+		The chords whose embeddings are kept (all by default : one vector per progression).
+	layer : int
+		The index of the layer whose output is the embedding.
+	batch_size : int
+		The number of progressions embedded at once.
+	index : EmbeddingIndex
+		An index to complete, e.g. when progressions were added to the dataset. A new one by default.
+
+	Returns
+	-------
+	index : EmbeddingIndex
+		The index, whose names are the sample names of midi_to_data.list_samples (e.g. 'Eiffel_p0_t0.mid').
+
+	"""
+
+	import midi_to_data as md
+	import visualize_embedding as vis
+	if index is None:
+		index = EmbeddingIndex()
+	indexed = set(index.names)
+	filenames = md.list_samples(directory)
+	rows = [i for i, f in enumerate(filenames) if f not in indexed]
+	if rows:
+		# The whole directory goes through the pianoroll cache, which is rewritten with the samples it is given
+		X, y = md.load_pianorolls(directory, filenames, engine=engine, workers=workers, packed=True)
+		embeddings = vis.extract_embeddings(X[rows], model, batch_size=batch_size, timesteps=timesteps, layer=layer,
+											packed=True)
+		index.add(embeddings, [filenames[i] for i in rows])
+	return index
+
+
+def query_midi(index, model, filenames, k=10, engine='music21', timesteps=None, layer=6):
+	""" Finds the k progressions of the index that are the most similar to midi files.
+
+	Parameters
+	----------
+	index : EmbeddingIndex
+		The index, built with the same model, timesteps and layer.
+	model : keras.models.Model
+		The model that defines the embedding space.
+	filenames : str list
+		The midi files to query.
+	k : int
+		The number of neighbours.
+	engine, timesteps, layer :
+		See embed_midi_files.
+
+	Returns
+	-------
+	names : str np array
+		The (files, k) names of the neighbours, from the most similar.
+	similarities : np array
+		The (files, k) cosine similarities.
+
+	"""
+
+	return index.query(embed_midi_files(model, filenames, engine, timesteps, layer), k)
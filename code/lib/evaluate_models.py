@@ -0,0 +1,173 @@
+"""Module evaluate_models.
+
+Compares our trained models on the validation set, for any metrics and thresholds of frame_metrics.
+Each model is run once : its raw outputs are cached on disk, keyed by the hash of the model file
+and the hash of the validation data, so that changing a metric or a threshold does not run the models again.
+The cache is in 'toy/dataset/outputs.cache/'. A model or dataset that changes gets new outputs automatically.
+The samples are listed in a sorted order (see midi_to_data.list_samples), so that the hash of the validation data,
+hence the cache, is the same from one run to the next.
+
+Example
+-------
+How to use this code
+
+	$ python code/lib/evaluate_models.py MidiCNNModel MidiCNNModel2 MidiCNNModel3 --thresholds 0.3 0.5 0.7
+
+	-- or, from python --
+	import evaluate_models as ev
+	results = ev.evaluate_models(['MidiCNNModel', 'MidiCNNModel2'], thresholds=[0.3, 0.5])
+	print(ev.comparison_table(results, [0.3, 0.5]))
+
+"""
+
+import argparse
+import hashlib
+import os
+import time
+import numpy as np
+
+import frame_metrics as fm
+import midi_to_data as md
+import model_registry as reg
+import predict_chords as pc
+import read_write_helpers as rw
+
+# The metrics of frame_metrics shown by default
+default_metrics = ['frame_loss', 'precision', 'recall', 'f1']
+
+
+def file_hash(filename):
+	# The SHA-1 of the content of a file, read by blocks
+	sha = hashlib.sha1()
+	with open(filename, 'rb') as f:
+		for block in iter(lambda: f.read(1 << 20), b''):
+			sha.update(block)
+	return sha.hexdigest()
+
+
+def arrays_hash(*arrays):
+	# The SHA-1 of the shapes and contents of arrays
+	sha = hashlib.sha1()
+	for array in arrays:
+		array = np.ascontiguousarray(array)
+		sha.update(str((array.shape, array.dtype.str)).encode('utf-8'))
+		sha.update(array.data)
+	return sha.hexdigest()
+
+
+def model_outputs(name, X, data_hash=None, cache_dir='toy/dataset/outputs.cache/', registry=reg.models,
+				  batch_size=1024):
+	""" The raw outputs of a model on packed sequences, predicted once then read from the cache.
+
+	Parameters
+	----------
+	name : str
+		The name of the model in the registry (e.g. 'MidiCNNModel3'), or the path of its file.
+	X : np array
+		The (samples, 10, 16) packed sequences (see midi_to_data.pack_rolls).
+	data_hash : str
+		The hash of the sequences, if already computed (see arrays_hash).
+	cache_dir : str
+		The directory of the cached outputs.
+	registry : model_registry.ModelRegistry
+		The registry loading the model, when it has to be run.
+	batch_size : int
+		The number of sequences predicted at once.
+
+	Returns
+	-------
+	y_pred : np array
+		The (samples, 128) outputs of the model.
+
+	"""
+
+	path = registry.model_path(name)
+	if data_hash is None:
+		data_hash = arrays_hash(X)
+	key = '%s_%s_%s.npy' % (os.path.splitext(os.path.basename(path))[0], file_hash(path)[:16], data_hash[:16])
+	cache_path = os.path.join(cache_dir, key)
+	if os.path.exists(cache_path):
+		return np.load(cache_path)
+
+	start = time.time()
+	y_pred = pc.predict_packed(registry.get(name), X, batch_size)
+	print('%s : %d sequences predicted in %.2f s' % (name, len(X), time.time() - start))
+	rw.atomic_write(cache_path, lambda f: np.save(f, y_pred))
+	return y_pred
+
+
+def evaluate_models(names, thresholds=(0.5,), by=None, directory='toy/dataset/progressions/',
+					cache_dir='toy/dataset/outputs.cache/', registry=reg.models):
+	""" Computes the frame metrics of several models on the validation set.
+
+	Parameters
+	----------
+	names : str list
+		The names of the models in the registry (e.g. ['MidiCNNModel', 'MidiCNNModel2']).
+	thresholds : float list
+		The output values above which a pitch is predicted.
+	by : str
+		None for metrics over the whole set, 'sample' or 'pitch' (see frame_metrics.frame_metrics).
+	directory : str
+		The location of the midi dataset, split as in midi_to_data.load_midi_prediction.
+	cache_dir : str
+		The directory of the cached outputs.
+	registry : model_registry.ModelRegistry
+		The registry loading the models.
+
+	Returns
+	-------
+	results : dict of str -> dict
+		For each model, the metrics of frame_metrics.frame_metrics.
+
+	"""
+
+	[X, y, Xval, yval] = md.load_midi_prediction(directory, packed=True)
+	data_hash = arrays_hash(Xval, yval)
+	y_true = md.unpack_rolls(yval, np.uint8)
+	results = {}
+	for name in names:
+		y_pred = model_outputs(name, Xval, data_hash, cache_dir, registry)
+		results[name] = fm.frame_metrics(y_true, y_pred, thresholds, by)
+	return results
+
+
+def comparison_table(results, thresholds, metrics=default_metrics):
+	""" Formats the overall metrics of several models as a text table, one row per model and threshold.
+
+	Parameters
+	----------
+	results : dict of str -> dict
+		The metrics of each model, as returned by evaluate_models (with by=None).
+	thresholds : float list
+		The thresholds the metrics were computed for.
+	metrics : str list
+		The metrics to show.
+
+	Returns
+	-------
+	table : str
+		The table.
+
+	"""
+
+	width = max([len('model')] + [len(name) for name in results])
+	lines = ['%-*s  %9s' % (width, 'model', 'threshold') + ''.join('  %10s' % metric for metric in metrics)]
+	for name in sorted(results):
+		for k, threshold in enumerate(thresholds):
+			values = ''.join('  %10.4f' % results[name][metric][k] for metric in metrics)
+			lines.append('%-*s  %9.2f' % (width, name, threshold) + values)
+	return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Compares the frame metrics of our models on the validation set.')
+	parser.add_argument('models', nargs='*', help='the names of the models (all the models of code/models/ by default)')
+	parser.add_argument('--thresholds', type=float, nargs='+', default=[0.5])
+	parser.add_argument('--metrics', nargs='+', default=default_metrics,
+						choices=['tp', 'fp', 'fn', 'precision', 'recall', 'f1', 'frame_loss'])
+	parser.add_argument('--directory', default='toy/dataset/progressions/')
+	args = parser.parse_args()
+	names = args.models or reg.models.list_models()
+	results = evaluate_models(names, args.thresholds, directory=args.directory)
+	print(comparison_table(results, args.thresholds, args.metrics))
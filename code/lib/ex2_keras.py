@@ -5,57 +5,52 @@
 import keras
 from keras.models import Sequential
 from keras.layers import Dense, Dropout
-from keras.layers import LSTM, SimpleRNN, RNN
+from keras.layers import LSTM, SimpleRNN
 import numpy as np
 import pickle
 
 import load_sherlock as sh
-import read_write_helpers as rw
-import midi_to_data as md
-from custom_rnns import MinimalLSTMCell, MinimalRNNCell
+import training_helpers as tr
+import midi_sequence as ms
+from custom_rnns import MinimalLSTMCell, MinimalRNNCell, ProjectedRNN
 
 # First, the comparisons will be done using a character prediction task on
 # a text file : The Adventures of Sherlock Holmes.
 
-[X, y, Xval, yval] = sh.load()
+# The text is memory-mapped, and the batches are normalized and one-hot encoded on the fly.
+(train_seq, val_seq, n_vocab) = sh.load_lazy(batch_size=128)
 
 # 1a. Custom RNN layer
 
 print('-------------------- Hand-written RNN ---------------------')
+# The input projection is done once for the whole sequence (see ProjectedRNN).
 model = Sequential()
-model.add(RNN(MinimalRNNCell(256), input_shape=(X.shape[1], X.shape[2])))
+model.add(ProjectedRNN(MinimalRNNCell(256), input_shape=train_seq.input_shape))
 model.add(Dropout(0.2))
-model.add(Dense(y.shape[1], activation='softmax'))
+model.add(Dense(n_vocab, activation='softmax'))
 model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
-history = model.fit(
-	X,
-	y,
+# The metrics of each epoch are logged as soon as it ends (see training_helpers.EpochLogger)
+model.fit_generator(
+	train_seq,
 	epochs=10,
-	batch_size=128,
-	validation_data=(
-		Xval,
-		yval))
-
-rw.save(history.history, 'minimalRNN')
+	validation_data=val_seq,
+	callbacks=[tr.EpochLogger('minimalRNN')])
 
 # 1b. Custom LSTM layer
 
 print('-------------------- Hand-written LSTM ---------------------')
+# The gates are fused, and the input projection is done once for the whole sequence (see ProjectedRNN).
+# Same equations as RNN(MinimalLSTMCell(256)), which trained the saved history, up to the rounding of the sums.
 model = Sequential()
-model.add(RNN(MinimalLSTMCell(256), input_shape=(X.shape[1], X.shape[2])))
+model.add(ProjectedRNN(MinimalLSTMCell(256, implementation=2), input_shape=train_seq.input_shape))
 model.add(Dropout(0.2))
-model.add(Dense(y.shape[1], activation='softmax'))
+model.add(Dense(n_vocab, activation='softmax'))
 model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
-history = model.fit(
-	X,
-	y,
+model.fit_generator(
+	train_seq,
 	epochs=10,
-	batch_size=128,
-	validation_data=(
-		Xval,
-		yval))
-
-rw.save(history.history, 'minimalLSTM')
+	validation_data=val_seq,
+	callbacks=[tr.EpochLogger('minimalLSTM')])
 
 # 2.  Compare your models to the RNN and LSTM already provided in Keras
 
@@ -63,117 +58,91 @@ rw.save(history.history, 'minimalLSTM')
 
 print('-------------------- Keras native RNN ---------------------')
 model = Sequential()
-model.add(SimpleRNN(256, input_shape=(X.shape[1], X.shape[2])))
+model.add(SimpleRNN(256, input_shape=train_seq.input_shape))
 model.add(Dropout(0.2))
-model.add(Dense(y.shape[1], activation='softmax'))
+model.add(Dense(n_vocab, activation='softmax'))
 model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
-history = model.fit(
-	X,
-	y,
+model.fit_generator(
+	train_seq,
 	epochs=10,
-	batch_size=128,
-	validation_data=(
-		Xval,
-		yval))
-
-rw.save(history.history, 'nativeRNN')
+	validation_data=val_seq,
+	callbacks=[tr.EpochLogger('nativeRNN')])
 
 # 2b. LSTM
 
 print('-------------------- Keras native LSTM ---------------------')
 model = Sequential()
-model.add(LSTM(256, input_shape=(X.shape[1], X.shape[2])))
+model.add(LSTM(256, input_shape=train_seq.input_shape))
 model.add(Dropout(0.2))
-model.add(Dense(y.shape[1], activation='softmax'))
+model.add(Dense(n_vocab, activation='softmax'))
 model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
-history = model.fit(
-	X,
-	y,
+model.fit_generator(
+	train_seq,
 	epochs=10,
-	batch_size=128,
-	validation_data=(
-		Xval,
-		yval))
-
-rw.save(history.history, 'nativeLSTM')
+	validation_data=val_seq,
+	callbacks=[tr.EpochLogger('nativeLSTM')])
 
 #%% 
 # 3.  Train all models on your toy datasets and compare performance
 
-[X, y, Xval, yval] = md.load_midi_prediction('toy/dataset/progressions/')
+# The midi dataset is streamed batch by batch, so that its size is not bounded by the memory.
+(train_seq, val_seq) = ms.load_midi_sequences('toy/dataset/progressions/', batch_size=128)
 
 # 3a. Custom RNN layer
 
 print('-------------------- Hand-written RNN ---------------------')
+# The input projection is done once for the whole sequence (see ProjectedRNN).
 model = Sequential()
-model.add(RNN(MinimalRNNCell(256), input_shape=(X.shape[1], X.shape[2])))
+model.add(ProjectedRNN(MinimalRNNCell(256), input_shape=train_seq.input_shape))
 model.add(Dropout(0.2))
-model.add(Dense(y.shape[1], activation='softmax'))
+model.add(Dense(128, activation='softmax'))
 model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
-history = model.fit(
-	X,
-	y,
+model.fit_generator(
+	train_seq,
 	epochs=100,
-	batch_size=128,
-	validation_data=(
-		Xval,
-		yval))
-
-rw.save(history.history, 'minimalRNNmidi')
+	validation_data=val_seq,
+	callbacks=[tr.EpochLogger('minimalRNNmidi')])
 
 # 3b. Custom LSTM layer
 
 print('-------------------- Hand-written LSTM ---------------------')
+# The gates are fused, and the input projection is done once for the whole sequence (see ProjectedRNN).
+# Same equations as RNN(MinimalLSTMCell(256)), which trained the saved history, up to the rounding of the sums.
 model = Sequential()
-model.add(RNN(MinimalLSTMCell(256), input_shape=(X.shape[1], X.shape[2])))
+model.add(ProjectedRNN(MinimalLSTMCell(256, implementation=2), input_shape=train_seq.input_shape))
 model.add(Dropout(0.2))
-model.add(Dense(y.shape[1], activation='softmax'))
+model.add(Dense(128, activation='softmax'))
 model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
-history = model.fit(
-	X,
-	y,
+model.fit_generator(
+	train_seq,
 	epochs=100,
-	batch_size=128,
-	validation_data=(
-		Xval,
-		yval))
-
-rw.save(history.history, 'minimalLSTMmidi')
+	validation_data=val_seq,
+	callbacks=[tr.EpochLogger('minimalLSTMmidi')])
 
 # 3c. Standard RNN
 
 print('-------------------- Keras native RNN ---------------------')
 model = Sequential()
-model.add(SimpleRNN(256, input_shape=(X.shape[1], X.shape[2])))
+model.add(SimpleRNN(256, input_shape=train_seq.input_shape))
 model.add(Dropout(0.2))
-model.add(Dense(y.shape[1], activation='softmax'))
+model.add(Dense(128, activation='softmax'))
 model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
-history = model.fit(
-	X,
-	y,
+model.fit_generator(
+	train_seq,
 	epochs=100,
-	batch_size=128,
-	validation_data=(
-		Xval,
-		yval))
-
-rw.save(history.history, 'nativeRNNmidi')
+	validation_data=val_seq,
+	callbacks=[tr.EpochLogger('nativeRNNmidi')])
 
 # 3d. Standard LSTM
 
 print('-------------------- Keras native LSTM ---------------------')
 model = Sequential()
-model.add(LSTM(256, input_shape=(X.shape[1], X.shape[2])))
+model.add(LSTM(256, input_shape=train_seq.input_shape))
 model.add(Dropout(0.2))
-model.add(Dense(y.shape[1], activation='softmax'))
+model.add(Dense(128, activation='softmax'))
 model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
-history = model.fit(
-	X,
-	y,
+model.fit_generator(
+	train_seq,
 	epochs=100,
-	batch_size=128,
-	validation_data=(
-		Xval,
-		yval))
-
-rw.save(history.history, 'nativeLSTMmidi')
+	validation_data=val_seq,
+	callbacks=[tr.EpochLogger('nativeLSTMmidi')])
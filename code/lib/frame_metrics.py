@@ -0,0 +1,120 @@
+"""Module frame_metrics.
+
+The frame-wise metrics of our chord predictions, computed with numpy on saved outputs :
+the frame_loss of training_helpers, and the precision, recall and F1 score of the predicted pitches.
+They are computed for the whole validation set at once, per sample or per pitch,
+and for several thresholds at once : sweeping the 0.5 cut-off does not need to run the model again.
+
+Example
+-------
+How to use this code
+
+	import frame_metrics as fm
+	y_pred = model.predict(Xval)
+	print(fm.frame_loss(yval, y_pred))
+	metrics = fm.frame_metrics(yval, y_pred, thresholds=[0.3, 0.4, 0.5], by='pitch')
+	print(metrics['f1'])  # (3, 128) : for each threshold, the F1 score of each pitch
+
+"""
+
+import numpy as np
+
+# The reductions of frame_metrics, as the axes summed over (samples, pitches)
+reduction_axes = {None: (1, 2), 'sample': 2, 'pitch': 1}
+
+
+def confusion_counts(y_true, y_pred, thresholds=(0.5,), by=None):
+	""" Counts the true positives, false positives and false negatives of binarized predictions.
+
+	Parameters
+	----------
+	y_true : np array
+		The (samples, 128) expected chords, equal to 1 for the played pitches.
+	y_pred : np array
+		The (samples, 128) outputs of the network.
+	thresholds : float list
+		The output values above which a pitch is predicted.
+	by : str
+		None to count over the whole set, 'sample' to count per sample, 'pitch' per pitch.
+
+	Returns
+	-------
+	tp, fp, fn : int np arrays
+		The counts, of shape (thresholds,), (thresholds, samples) or (thresholds, 128).
+
+	"""
+
+	y_true = np.asarray(y_true) > 0.5
+	y_pred = np.asarray(y_pred)
+	thresholds = np.asarray(thresholds, dtype=y_pred.dtype if y_pred.dtype.kind == 'f' else float)
+	# (thresholds, samples, 128) : all the thresholds in one pass
+	predicted = y_pred[None] > thresholds[:, None, None]
+	axis = reduction_axes[by]
+	tp = np.sum(predicted & y_true, axis=axis)
+	fp = np.sum(predicted, axis=axis) - tp
+	fn = np.sum(y_true[None], axis=axis) - tp
+	return tp, fp, fn
+
+
+def ratio(numerator, denominator):
+	# numerator / denominator, and 0 where the denominator is 0
+	numerator = np.asarray(numerator, dtype=float)
+	return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=np.asarray(denominator) > 0)
+
+
+def frame_metrics(y_true, y_pred, thresholds=(0.5,), by=None):
+	""" Computes the frame-wise metrics of binarized predictions, for several thresholds at once.
+
+	Parameters
+	----------
+	y_true : np array
+		The (samples, 128) expected chords, equal to 1 for the played pitches.
+	y_pred : np array
+		The (samples, 128) outputs of the network.
+	thresholds : float list
+		The output values above which a pitch is predicted.
+	by : str
+		None to compute the metrics over the whole set, 'sample' per sample, 'pitch' per pitch.
+
+	Returns
+	-------
+	metrics : dict of str -> np array
+		'tp', 'fp', 'fn', 'precision', 'recall', 'f1' and 'frame_loss',
+		of shape (thresholds,), (thresholds, samples) or (thresholds, 128).
+		Precision, recall and F1 are 0 when undefined (e.g. no predicted pitch).
+
+	"""
+
+	tp, fp, fn = confusion_counts(y_true, y_pred, thresholds, by)
+	# Same definition as training_helpers.frame_loss : the true positives are at least 0.1, in both terms
+	tp_clamped = np.maximum(tp, 0.1)
+	precision = ratio(tp, tp + fp)
+	recall = ratio(tp, tp + fn)
+	return {'tp': tp, 'fp': fp, 'fn': fn,
+			'precision': precision,
+			'recall': recall,
+			'f1': ratio(2 * tp, 2 * tp + fp + fn),
+			'frame_loss': (fp + fn + tp_clamped) / tp_clamped}
+
+
+def frame_loss(y_true, y_pred, threshold=0.5):
+	""" The frame_loss of training_helpers, over the whole set.
+	Keras reports the mean of this measure over the batches instead : both are equal with a single batch.
+
+	Parameters
+	----------
+	y_true : np array
+		The (samples, 128) expected chords, equal to 1 for the played pitches.
+	y_pred : np array
+		The (samples, 128) outputs of the network.
+	threshold : float
+		The output value above which a pitch is predicted.
+
+	Returns
+	-------
+	score : float
+		The frame_loss between the two inputs : 1 for a perfect prediction, more otherwise.
+
+	"""
+
+	return float(frame_metrics(y_true, y_pred, [threshold])['frame_loss'][0])
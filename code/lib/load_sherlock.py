@@ -8,17 +8,77 @@ Example
 How to use this code
 
 	import load_sherlock as sh
+	[X, y, Xval, yval] = sh.load()
+
+	# Or, to stream batches from a memory-mapped version of the text :
+	(train_seq, val_seq, n_vocab) = sh.load_lazy()
 
 """
 
 # The code framework to load the data was taken at :
 # https://machinelearningmastery.com/text-generation-lstm-recurrent-neural-networks-python-keras/
 
+import json
+import os
 import numpy as np
+import keras
 from keras.utils import np_utils
+import read_write_helpers as rw
+
+
+def encode_text(raw_text):
+	""" Encodes a text as an array of character indices.
+
+	Parameters
+	----------
+	raw_text : str
+		The text to encode.
+
+	Returns
+	-------
+	encoded : np array
+		The uint8 index of each character of the text in chars.
+	chars : str list
+		The sorted vocabulary of the text.
+
+	"""
+
+	chars = sorted(list(set(raw_text)))
+	if len(chars) > 256:
+		raise ValueError('The vocabulary is too large to be encoded on 8 bits : ' + str(len(chars)))
+	# The code points of the text, then their rank in the sorted vocabulary
+	code_points = np.frombuffer(raw_text.encode('utf-32-le'), dtype=np.uint32)
+	chars_code_points = np.array([ord(c) for c in chars], dtype=np.uint32)
+	encoded = np.searchsorted(chars_code_points, code_points).astype(np.uint8)
+	return encoded, chars
+
+
+def sliding_windows(encoded, seq_length):
+	""" Creates all the sequences of seq_length consecutive characters, without copying the data.
+	Each row is a view on the encoded text, shifted by one character from the previous row.
+
+	Parameters
+	----------
+	encoded : np array
+		The encoded text.
+	seq_length : int
+		The length of the sequences.
 
+	Returns
+	-------
+	windows : np array
+		A read-only (n_chars - seq_length, seq_length) view : the input sequences,
+		the character following row i being encoded[i + seq_length].
+
+	"""
+
+	n_windows = len(encoded) - seq_length
+	stride = encoded.strides[0]
+	return np.lib.stride_tricks.as_strided(
+		encoded, shape=(n_windows, seq_length), strides=(stride, stride), writeable=False)
 
-def load():
+
+def load(filename="code/lib/sherlock.txt"):
 	""" Loads the text file and creates a trainable dataset from it.
 
 	Parameters
@@ -34,13 +94,11 @@ def load():
 	"""
 
 	# load ascii text and covert to lowercase
-	filename = "code/lib/sherlock.txt"
 	raw_text = open(filename).read()
 	raw_text = raw_text.lower()
 	n_chars = len(raw_text)
 	# create mapping of unique chars to integers
-	chars = sorted(list(set(raw_text)))
-	char_to_int = dict((c, i) for i, c in enumerate(chars))
+	encoded, chars = encode_text(raw_text)
 	n_vocab = len(chars)
 	print("Total Characters: ", n_chars)
 	print("Total Vocab: ", n_vocab)
@@ -49,13 +107,8 @@ def load():
 	idx_train = int(ratio * n_chars)
 	# prepare the dataset of input to output pairs encoded as integers
 	seq_length = 100
-	dataX = []
-	dataY = []
-	for i in range(0, n_chars - seq_length, 1):
-		seq_in = raw_text[i:i + seq_length]
-		seq_out = raw_text[i + seq_length]
-		dataX.append([char_to_int[char] for char in seq_in])
-		dataY.append(char_to_int[seq_out])
+	dataX = sliding_windows(encoded, seq_length)
+	dataY = encoded[seq_length:]
 	n_patterns = len(dataX)
 	print("Total Patterns: ", n_patterns)
 	# now spilt into training and validation data
@@ -64,14 +117,154 @@ def load():
 	dataYtrain = dataY[:idx_train]
 	dataYval = dataY[idx_train:]
 	# reshape data to be [samples, time steps, features] expected by an LSTM
-	# network.
-	Xtrain = np.reshape(dataXtrain, (len(dataXtrain), seq_length, 1))
-	Xval = np.reshape(dataXval, (len(dataXval), seq_length, 1))
-	# normalize
-	Xtrain = Xtrain / float(n_vocab)
-	Xval = Xval / float(n_vocab)
+	# network, and normalize. The windows are only copied at this point.
+	Xtrain = np.reshape(dataXtrain, (len(dataXtrain), seq_length, 1)) / float(n_vocab)
+	Xval = np.reshape(dataXval, (len(dataXval), seq_length, 1)) / float(n_vocab)
 	# ONE HOT encoding for the OUPTUT variable
 	ytrain = np_utils.to_categorical(dataYtrain)
 	yval = np_utils.to_categorical(dataYval)
 
 	return Xtrain, ytrain, Xval, yval
+
+
+def encode_to_memmap(filename="code/lib/sherlock.txt"):
+	""" Encodes the text file once, and stores it next to it as a memory-mappable uint8 array.
+	The array is only encoded again when the text file is modified.
+
+	Parameters
+	----------
+	filename : str
+		The location of the text file.
+
+	Returns
+	-------
+	encoded : np memmap
+		The encoded lower-case text (see encode_text), memory-mapped from disk.
+	chars : str list
+		The sorted vocabulary of the text.
+
+	"""
+
+	base = os.path.splitext(filename)[0]
+	encoded_path = base + '.encoded.npy'
+	vocab_path = base + '.vocab.json'
+
+	up_to_date = os.path.exists(encoded_path) and os.path.exists(vocab_path) and \
+		os.path.getmtime(encoded_path) >= os.path.getmtime(filename)
+	if not up_to_date:
+		raw_text = open(filename).read().lower()
+		encoded, chars = encode_text(raw_text)
+		# Written to temporary names first, so that an interrupted encoding is never used
+		rw.atomic_write(encoded_path, lambda f: np.save(f, encoded))
+		rw.atomic_write(vocab_path, lambda f: json.dump(chars, f), mode='w')
+
+	with open(vocab_path) as f:
+		chars = json.load(f)
+	encoded = np.load(encoded_path, mmap_mode='r')
+	return encoded, chars
+
+
+class SherlockSequence(keras.utils.Sequence):
+	""" A Keras Sequence of character prediction batches, built on the fly from the encoded text.
+	Only the current batch is normalized and one-hot encoded, so the memory does not grow with the text.
+
+	Attributes
+	----------
+	encoded : np array
+		The encoded text, typically memory-mapped (see encode_to_memmap).
+	start, stop : int
+		The range of the sequences (ie of their first character) in this dataset.
+	n_vocab : int
+		The size of the vocabulary.
+	sparse : bool
+		If True, the targets are the (batch, 1) character indices, to be used with the
+		sparse_categorical_crossentropy loss. Otherwise, they are one-hot encoded.
+	input_shape : int tuple
+		The shape of each input sequence : (seq_length, 1).
+
+	Example
+	-------
+	How to use this class
+
+			encoded, chars = encode_to_memmap()
+			seq = SherlockSequence(encoded, 0, 1000, len(chars))
+			model.fit_generator(seq, epochs=10)
+
+	"""
+
+	def __init__(self, encoded, start, stop, n_vocab, seq_length=100, batch_size=128, shuffle=True,
+				 sparse=False, seed=None):
+
+		self.encoded = encoded
+		self.start = start
+		self.stop = stop
+		self.n_vocab = n_vocab
+		self.seq_length = seq_length
+		self.batch_size = batch_size
+		self.shuffle = shuffle
+		self.sparse = sparse
+		self.input_shape = (seq_length, 1)
+		self.windows = sliding_windows(encoded, seq_length)
+		self.random = np.random.RandomState(seed)
+		self.order = np.arange(start, stop)
+		if self.shuffle:
+			self.random.shuffle(self.order)
+
+	def __len__(self):
+		return int(np.ceil((self.stop - self.start) / float(self.batch_size)))
+
+	def __getitem__(self, idx):
+		indices = np.sort(self.order[idx * self.batch_size:(idx + 1) * self.batch_size])
+		X = self.windows[indices].astype(np.float32) / self.n_vocab
+		X = np.reshape(X, (len(indices), self.seq_length, 1))
+		targets = np.asarray(self.encoded[indices + self.seq_length], dtype=np.int64)
+		if self.sparse:
+			return X, np.reshape(targets, (len(indices), 1))
+		y = np.zeros((len(indices), self.n_vocab), dtype=np.float32)
+		y[np.arange(len(indices)), targets] = 1
+		return X, y
+
+	def on_epoch_end(self):
+		if self.shuffle:
+			self.random.shuffle(self.order)
+
+
+def load_lazy(filename="code/lib/sherlock.txt", batch_size=128, sparse=False, seed=None):
+	""" Creates training and validation sequences streaming batches from the memory-mapped text.
+	The samples and the split are the same as in load, but nothing is expanded in memory beforehand.
+
+	Parameters
+	----------
+	filename : str
+		The location of Sherlock's text file.
+	batch_size : int
+		The number of sequences per batch.
+	sparse : bool
+		Whether to give the targets as character indices (sparse_categorical_crossentropy)
+		rather than one-hot vectors.
+	seed : int
+		The random seed of the shuffling of the training sequences.
+
+	Returns
+	-------
+	train_seq, val_seq : SherlockSequence
+		The training (shuffled at each epoch) and validation sequences.
+	n_vocab : int
+		The size of the vocabulary, ie of the output of the network.
+
+	"""
+
+	encoded, chars = encode_to_memmap(filename)
+	n_chars = len(encoded)
+	n_vocab = len(chars)
+	seq_length = 100
+	n_patterns = n_chars - seq_length
+	# Same split as in load
+	ratio = 0.7
+	idx_train = min(int(ratio * n_chars), n_patterns)
+	train_seq = SherlockSequence(encoded, 0, idx_train, n_vocab, seq_length, batch_size, True, sparse, seed)
+	val_seq = SherlockSequence(encoded, idx_train, n_patterns, n_vocab, seq_length, batch_size, False, sparse)
+	print("Total Characters: ", n_chars)
+	print("Total Vocab: ", n_vocab)
+	print("Total Patterns: ", n_patterns)
+	return train_seq, val_seq, n_vocab
@@ -13,11 +13,9 @@ How to use this code : first build the dataset, then execute the code.
 """
 
 import numpy as np
-import read_write_helpers as rw
+import model_registry as reg
 import matplotlib.pyplot as plt
-import training_helpers as tr
 import visualize_embedding as vis
-import keras.models
 
 # ~~~~~~~~~~~~  Exercise 2 : understanding Keras, RNNs and LSTMs
 
@@ -29,10 +27,10 @@ import keras.models
 #%% ~~~~~ In this first section, one can compare the several models trained for
 # text prediction.
 
-mLSTM = rw.load_pickled('code/models/minimalLSTM.pickle')
-nLSTM = rw.load_pickled('code/models/nativeLSTM.pickle')
-mRNN = rw.load_pickled('code/models/minimalRNN.pickle')
-nRNN = rw.load_pickled('code/models/nativeRNN.pickle')
+mLSTM = reg.models.history('minimalLSTM')
+nLSTM = reg.models.history('nativeLSTM')
+mRNN = reg.models.history('minimalRNN')
+nRNN = reg.models.history('nativeRNN')
 
 f, ((a1, a2), (a3, a4)) = plt.subplots(2, 2)
 
@@ -61,10 +59,10 @@ plt.show()
 #%%  ~~~~~ In this second section, one can compare the several models trained for
 # midi chords prediction.
 
-mLSTMmidi = rw.load_pickled('code/models/minimalLSTMmidi.pickle')
-nLSTMmidi = rw.load_pickled('code/models/nativeLSTMmidi.pickle')
-mRNNmidi = rw.load_pickled('code/models/minimalRNNmidi.pickle')
-nRNNmidi = rw.load_pickled('code/models/nativeRNNmidi.pickle')
+mLSTMmidi = reg.models.history('minimalLSTMmidi')
+nLSTMmidi = reg.models.history('nativeLSTMmidi')
+mRNNmidi = reg.models.history('minimalRNNmidi')
+nRNNmidi = reg.models.history('nativeRNNmidi')
 
 f, ((a1, a2), (a3, a4)) = plt.subplots(2, 2)
 
@@ -100,7 +98,7 @@ plt.show()
 
 # Here we visualize the training history of the CNN as presented in the tutorial.
 
-ImdbCNN = rw.load_pickled('code/models/ImdbCNN1.pickle')
+ImdbCNN = reg.models.history('ImdbCNN1')
 plt.plot(ImdbCNN['acc'])
 plt.title('CNN on IMDB')
 plt.plot(ImdbCNN['val_acc'])
@@ -111,8 +109,8 @@ plt.show()
 #%% ~~~~~ In this second section, we will show the behavior the same Convolutional Network
 # trained for midi chords prediction.
 
-MidiCNNbase = rw.load_pickled('code/models/MidiCNN.pickle')
-MidiCNNok = rw.load_pickled('code/models/MidiCNNmain.pickle')
+MidiCNNbase = reg.models.history('MidiCNN')
+MidiCNNok = reg.models.history('MidiCNNmain')
 
 f, (a1, a2) = plt.subplots(1, 2)
 
@@ -137,7 +135,7 @@ plt.show()
 # This example is a bit longer than the other ones, as it requires to load the data and perform a TSNE algorithm.
 
 (X, labels, sizes) = vis.load_midi_simple_visualisation('toy/dataset/progressions/', ['Eiffel', 't0'])
-model = keras.models.load_model('code/models/MidiCNNModel3.h5', custom_objects={'frame_loss': tr.frame_loss})
+model = reg.models.get('MidiCNNModel3')
 # This model (featuring TimeDistributed layers) needs some preliminary reshaping.
 X = np.reshape(X, (X.shape[0], X.shape[1], 1, X.shape[2]))
 vis.visualize_model_pattern(X, labels, sizes, model)
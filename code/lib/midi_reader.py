@@ -0,0 +1,229 @@
+"""Module midi_reader.
+
+A lightweight reader for Standard MIDI Files, used as an alternative engine to music21 in midi_to_data.
+It only decodes what our pianorolls need (note-on / note-off events), without building a score,
+which makes it much faster on our simple single-track files.
+
+Example
+-------
+How to use this code
+
+	import midi_reader as mr
+	all_parts = mr.read_pianorolls('toy/dataset/progressions/xEiffel_p0_t0.mid', 16)
+
+"""
+
+import numpy as np
+import struct
+
+
+def read_variable_length(data, pos):
+	# Variable-length quantities : 7 bits per byte, the highest bit tells if another byte follows
+	value = 0
+	while True:
+		byte = data[pos]
+		pos += 1
+		value = (value << 7) | (byte & 0x7F)
+		if byte < 0x80:
+			return value, pos
+
+
+def read_track(data, pos, end):
+	""" Reads the note events of one track chunk.
+
+	Parameters
+	----------
+	data : bytes
+		The content of the midi file.
+	pos, end : int
+		The boundaries of the track chunk data in the file.
+
+	Returns
+	-------
+	name : str
+		The track name, or None.
+	notes : np array
+		A (n_notes, 3) array of (pitch, start, end) triples, in ticks.
+
+	"""
+
+	name = None
+	notes = []
+	# Pending note-on events, per (channel, pitch), matched in order with the note-offs
+	pending = {}
+	tick = 0
+	status = None
+
+	while pos < end:
+		delta, pos = read_variable_length(data, pos)
+		tick += delta
+		byte = data[pos]
+		if byte >= 0x80:
+			status = byte
+			pos += 1
+		# Otherwise, running status : the previous status byte is reused
+
+		if status == 0xFF:
+			# Meta event
+			meta_type = data[pos]
+			length, pos = read_variable_length(data, pos + 1)
+			if meta_type == 0x03:
+				name = data[pos:pos + length].decode('latin-1')
+			pos += length
+			# Meta and sysex events cancel the running status
+			status = None
+		elif status in (0xF0, 0xF7):
+			# Sysex event
+			length, pos = read_variable_length(data, pos)
+			pos += length
+			status = None
+		else:
+			kind = status & 0xF0
+			channel = status & 0x0F
+			if kind in (0xC0, 0xD0):
+				pos += 1
+				continue
+			pitch = data[pos]
+			velocity = data[pos + 1]
+			pos += 2
+			if kind == 0x90 and velocity > 0:
+				pending.setdefault((channel, pitch), []).append(tick)
+			elif kind == 0x80 or kind == 0x90:
+				starts = pending.get((channel, pitch))
+				if starts:
+					notes.append((pitch, starts.pop(0), tick))
+
+	# Notes that are never released last until the end of the track
+	for (channel, pitch), starts in pending.items():
+		for start in starts:
+			notes.append((pitch, start, tick))
+
+	notes = np.array(notes, dtype=np.int64).reshape((len(notes), 3))
+	return name, notes
+
+
+def read_midi_notes(f):
+	""" Reads the notes of a Standard MIDI File. A malformed or truncated file raises a ValueError.
+
+	Parameters
+	----------
+	f : str or bytes
+		The path of the midi file, or its content.
+
+	Returns
+	-------
+	ticks_per_quarter : int
+		The time resolution of the file.
+	tracks : (str, np array) list
+		For each track, its name and its (n_notes, 3) array of (pitch, start, end) triples in ticks.
+
+	"""
+
+	if isinstance(f, bytes):
+		data = f
+		f = 'The midi data'
+	else:
+		with open(f, 'rb') as midi_file:
+			data = midi_file.read()
+
+	if data[:4] != b'MThd':
+		raise ValueError(f + ' is not a Standard MIDI File.')
+	if len(data) < 14:
+		raise ValueError(f + ' is truncated.')
+	header_length, midi_format, n_tracks, division = struct.unpack('>IHHH', data[4:14])
+	if division & 0x8000:
+		raise ValueError(f + ' uses SMPTE time division, which is not supported.')
+	ticks_per_quarter = division
+
+	tracks = []
+	pos = 8 + header_length
+	while pos + 8 <= len(data) and len(tracks) < n_tracks:
+		chunk_type = data[pos:pos + 4]
+		chunk_length = struct.unpack('>I', data[pos + 4:pos + 8])[0]
+		pos += 8
+		if chunk_type == b'MTrk':
+			try:
+				tracks.append(read_track(data, pos, min(pos + chunk_length, len(data))))
+			except IndexError:
+				raise ValueError(f + ' is truncated.')
+		pos += chunk_length
+
+	return ticks_per_quarter, tracks
+
+
+def quantize_music21(quarters):
+	# music21 snaps offsets and durations to the closest multiple of 1/4 or 1/3 of a quarter note
+	# (quarterLengthDivisors=(4, 3)). We do the same to give the same pianorolls.
+	by_4 = np.round(quarters * 4) / 4
+	by_3 = np.round(quarters * 3) / 3
+	return np.where(np.abs(by_3 - quarters) < np.abs(by_4 - quarters), by_3, by_4)
+
+
+def rasterize_notes(pitches, starts, ends, duration):
+	""" Draws notes in a binary pianoroll, in one vectorized pass.
+	The (pitch, column) cells covered by all the notes are enumerated at once,
+	using the cumulative sum of the note lengths, then set with a single fancy-indexed assignment.
+	The cost is thus proportional to the number of active cells, not to the number of Python-level slices.
+
+	Parameters
+	----------
+	pitches, starts, ends : int np arrays
+		The midi pitch, first column and end column (excluded) of each note.
+	duration : int
+		The number of columns of the pianoroll.
+
+	Returns
+	-------
+	piano_roll_part : np array
+		A (128, duration) array, equal to 1 where a note is played, 0 elsewhere.
+
+	"""
+
+	pitches = np.asarray(pitches, dtype=np.int64)
+	starts = np.clip(np.asarray(starts, dtype=np.int64), 0, duration)
+	ends = np.clip(np.asarray(ends, dtype=np.int64), 0, duration)
+	lengths = np.maximum(ends - starts, 0)
+
+	# For the k-th cell of a note : column = start + k,
+	# where k is the position of the cell minus the number of cells of the previous notes
+	first_cells = np.cumsum(lengths) - lengths
+	cells = np.arange(lengths.sum())
+	columns = np.repeat(starts - first_cells, lengths) + cells
+
+	piano_roll_part = np.zeros((128, duration))
+	piano_roll_part[np.repeat(pitches, lengths), columns] = 1
+	return piano_roll_part
+
+
+def read_pianorolls(f, quantization):
+	""" Reads a midi file into binary pianorolls, without music21.
+	The output is the same as the music21 engine of midi_to_data.importMIDI.
+
+	Parameters
+	----------
+	f : str or bytes
+		The path of the midi file, or its content.
+	quantization : int
+		The number of pianoroll columns per quarter note.
+
+	Returns
+	-------
+	all_parts : dict of str -> np array
+		For each track with notes, a (128, duration) pianoroll.
+		Like with music21, parts are named 'None' (our files carry no instrument name).
+
+	"""
+
+	ticks_per_quarter, tracks = read_midi_notes(f)
+	all_parts = {}
+	for name, notes in tracks:
+		if len(notes) == 0:
+			continue
+		start = quantize_music21(notes[:, 1] / float(ticks_per_quarter))
+		duration = quantize_music21((notes[:, 2] - notes[:, 1]) / float(ticks_per_quarter))
+		note_start = np.ceil(start * quantization).astype(int)
+		note_end = np.ceil((start + duration) * quantization).astype(int)
+		piano_roll_part = rasterize_notes(notes[:, 0], note_start, note_end, note_end.max())
+		if piano_roll_part.shape[1] > 0:
+			all_parts['None'] = piano_roll_part
+	return all_parts
@@ -0,0 +1,138 @@
+"""Module midi_sequence.
+
+This module streams the midi dataset to Keras, batch by batch, instead of loading it all in memory
+like midi_to_data.load_midi_prediction does. The midi files are decoded once, into the packed pianoroll cache
+of midi_to_data : only the samples of the current batches are then read from it, and converted to dense float32 arrays.
+fit_generator prepares the next batches in a background thread while the model trains.
+
+Example
+-------
+How to use this code
+
+	import midi_sequence as ms
+	(train_seq, val_seq) = ms.load_midi_sequences('toy/dataset/progressions/', batch_size=128)
+	model.fit_generator(train_seq, epochs=10, validation_data=val_seq)
+
+"""
+
+import numpy as np
+import keras
+
+import midi_to_data as md
+
+
+class MidiSequence(keras.utils.Sequence):
+	""" A Keras Sequence of (batch, 10, 128) chords and (batch, 128) labels, read lazily from the pianoroll cache
+	of a dataset directory. The samples must be decoded in the cache beforehand (see midi_to_data.load_pianorolls).
+
+	Attributes
+	----------
+	filenames : str list
+		The samples of the sequence, as returned by midi_to_data.list_samples.
+	batch_size : int
+		The number of samples per batch.
+	input_shape : int tuple
+		The shape of each sample given to the model. (10, 128) by default.
+		For instance, our TimeDistributed models take (1, 10, 128).
+
+	Example
+	-------
+	How to use this class
+
+			filenames = md.list_samples('toy/dataset/progressions/')
+			md.load_pianorolls('toy/dataset/progressions/', filenames, packed=True)
+			seq = MidiSequence('toy/dataset/progressions/', filenames)
+			model.fit_generator(seq, epochs=10)
+
+	"""
+
+	def __init__(self, directory, filenames, batch_size=128, shuffle=True, cache_path=None, input_shape=None,
+				 seed=None):
+
+		self.directory = directory
+		self.filenames = list(filenames)
+		self.batch_size = batch_size
+		self.shuffle = shuffle
+		self.input_shape = tuple(input_shape or (len(md.columns_to_keep), 128))
+		self.random = np.random.RandomState(seed)
+		self.order = np.arange(len(self.filenames))
+		if self.shuffle:
+			self.random.shuffle(self.order)
+
+		# The samples are read from the memory-mapped arrays of the cache
+		if cache_path is None:
+			cache_path = md.default_cache_path(directory)
+		self.cache = md.read_cache(cache_path)
+		if self.cache is None:
+			raise ValueError('No pianoroll cache in ' + cache_path + ' : fill it with midi_to_data.load_pianorolls.')
+		cached_names, cached_stats = self.cache[:2]
+		rows = dict((name, row) for row, name in enumerate(cached_names))
+		self.cache_rows = np.zeros(len(self.filenames), dtype=np.int64)
+		for i, f in enumerate(self.filenames):
+			row = rows.get(f)
+			if row is None or not np.array_equal(cached_stats[row], md.sample_stats(directory, f)):
+				raise ValueError('The sample ' + f + ' is missing from the pianoroll cache, or changed since : '
+								 'update it with midi_to_data.load_pianorolls.')
+			self.cache_rows[i] = row
+
+	def __len__(self):
+		return int(np.ceil(len(self.filenames) / float(self.batch_size)))
+
+	def __getitem__(self, idx):
+		indices = self.order[idx * self.batch_size:(idx + 1) * self.batch_size]
+		X = np.zeros((len(indices), len(md.columns_to_keep), 128), dtype=np.float32)
+		y = np.zeros((len(indices), 128), dtype=np.float32)
+
+		# Sorted rows make the reads from the memory-mapped cache sequential
+		rows = self.cache_rows[indices]
+		order = np.argsort(rows)
+		X[order] = md.unpack_rolls(self.cache[2][rows[order]])
+		y[order] = md.unpack_rolls(self.cache[3][rows[order]])
+
+		return np.reshape(X, (len(indices),) + self.input_shape), y
+
+	def on_epoch_end(self):
+		if self.shuffle:
+			self.random.shuffle(self.order)
+
+
+def load_midi_sequences(directory, batch_size=128, engine='music21', cache_path=None, input_shape=None, seed=None,
+						workers=1):
+	""" Creates the training and validation sequences of a midi dataset.
+	The split is the same as in midi_to_data.load_midi_prediction (70 / 30).
+	The new and modified midi files are first decoded into the pianoroll cache, once for all the epochs.
+
+	Parameters
+	----------
+	directory : str
+	  The location of the directory containing the midi files.
+	batch_size : int
+	  The number of samples per batch.
+	engine : str
+	  The midi decoder : 'music21' or 'native' (see midi_to_data.importMIDI).
+	cache_path : str
+	  The location of the pianoroll cache of midi_to_data. By default, it lies next to the dataset directory.
+	input_shape : int tuple
+	  The shape of each sample given to the model. (10, 128) by default.
+	seed : int
+	  The random seed of the shuffling of the training samples.
+	workers : int
+	  The number of processes decoding the files missing from the cache. None to use all the cores.
+
+	Returns
+	-------
+	train_seq, val_seq : MidiSequence
+	  The training (shuffled at each epoch) and validation sequences.
+
+	"""
+
+	filenames = md.list_samples(directory)
+	md.load_pianorolls(directory, filenames, cache_path, engine, workers, packed=True)
+	ratio = 0.7
+	idx_train = int(ratio * len(filenames))
+	train_seq = MidiSequence(directory, filenames[:idx_train], batch_size, True, cache_path, input_shape, seed)
+	val_seq = MidiSequence(directory, filenames[idx_train:], batch_size, False, cache_path, input_shape)
+	print(len(train_seq.filenames), 'training samples')
+	print(len(val_seq.filenames), 'validation samples')
+	return train_seq, val_seq
+
@@ -15,10 +15,17 @@ How to use this code
 import numpy as np
 import math
 import os
-from keras.utils import np_utils
+import re
+import functools
+from concurrent.futures import ProcessPoolExecutor
 from music21 import converter
+import midi_reader as mr
+import read_write_helpers as rw
 from matplotlib import pyplot as plt
 
+# 1 midi event = 16 channels -> Keep 1 column out of 16
+columns_to_keep = [16 * i for i in range(10)]
+
 # Utility functions used by importMIDI
 
 def get_start_time(el, measure_offset, quantization):
@@ -36,29 +43,38 @@ def get_end_time(el, measure_offset, quantization):
 def get_pianoroll_part(part, quantization):
 	# Gets the measure offsets
 	measure_offset = {None: 0}
+	pe = part.elements
 
 	# Gets the duration of the part
 	duration_max = 0
-	for el in part.elements:
+	for el in pe:
 		t_end = get_end_time(el, measure_offset, quantization)
 		if(t_end > duration_max):
 			duration_max = t_end
-	# Gets the pitch and offset+duration
-	piano_roll_part = np.zeros((128, int(math.ceil(duration_max))))
 
-	n_el = len(part.elements)
-	pe = part.elements
-	for i in range(1, n_el):
-		this_chord = pe[i]
+	# Gets the pitch and offset+duration of every note
+	pitches = []
+	note_starts = []
+	note_ends = []
+	for this_chord in pe[1:]:
 		note_start = get_start_time(this_chord, measure_offset, quantization)
 		note_end = get_end_time(this_chord, measure_offset, quantization)
 		for this_note in this_chord.pitches:
-			piano_roll_part[this_note.midi, note_start:note_end] = 1
-	return piano_roll_part
+			pitches.append(this_note.midi)
+			note_starts.append(note_start)
+			note_ends.append(note_end)
 
+	# Then draws all of them at once
+	return mr.rasterize_notes(pitches, note_starts, note_ends, int(math.ceil(duration_max)))
 
-def importMIDI(f):
-	# The important function that is used to read the midi files
+
+def importMIDI(f, engine='music21'):
+	# The important function that is used to read the midi files.
+	# engine='native' uses our own midi reader instead of music21 : same output, much faster.
+	if engine == 'native':
+		return mr.read_pianorolls(f, 16)
+	elif engine != 'music21':
+		raise ValueError('Unknown midi engine : ' + str(engine))
 	piece = converter.parse(f)
 	all_parts = {}
 	for part in piece.parts:
@@ -72,14 +88,270 @@ def importMIDI(f):
 	return all_parts
 
 
-def load_midi_prediction(directory):
+# Utility functions used to build and cache the dataset
+
+def list_samples(directory):
+	# Each sample is stored as a pair of files 'x<name>' (data) and 'y<name>' (label).
+	# Sorted, so that the training / validation split is the same on every run
+	filenames = os.listdir(directory)
+	filenames = [x[1:] for x in filenames]
+	return sorted(set(filenames))
+
+
+def decode_data(f, engine='music21'):
+	# Reads the (10, 128) chords of one midi file
+	Xall_parts = importMIDI(f, engine)
+	return np.transpose(Xall_parts['None'][:, columns_to_keep])
+
+
+def decode_sample(directory, f, engine='music21'):
+	# Reads the pair of midi files of one sample.
+	# Returns the (10, 128) data and the (128,) label.
+	x = decode_data(directory + 'x' + f, engine)
+	Yall_parts = importMIDI(directory + 'y' + f, engine)
+	y = Yall_parts['None'][:, 0]
+	return x, y
+
+
+def parallel_map(function, args, workers=1):
+	""" Applies a function to each element of a list, possibly over a pool of processes.
+	The results are yielded in the order of args, whatever the number of workers.
+
+	Parameters
+	----------
+	function : function
+		A module-level function (it is sent to the worker processes).
+	args : list
+		The arguments to apply the function to.
+	workers : int
+		The number of processes. 1 to stay in the current process, None to use all the cores.
+
+	Returns
+	-------
+	results : generator
+		The results of the function.
+
+	"""
+
+	if workers is None:
+		workers = os.cpu_count() or 1
+	workers = min(workers, len(args))
+	if workers <= 1:
+		for arg in args:
+			yield function(arg)
+		return
+	# Several files per task, so that the inter-process communication does not dominate
+	chunksize = max(1, len(args) // (4 * workers))
+	with ProcessPoolExecutor(workers) as pool:
+		for result in pool.map(function, args, chunksize=chunksize):
+			yield result
+
+
+def pack_rolls(rolls):
+	""" Bit-packs binary pianorolls along the pitch axis : 128 pitches fit in 16 bytes.
+	This is 64 times smaller than float64 arrays, and 8 times smaller than uint8 ones.
+
+	Parameters
+	----------
+	rolls : np array
+		Binary pianorolls of shape (..., 128).
+
+	Returns
+	-------
+	packed : np array
+		The uint8 packed pianorolls, of shape (..., 16).
+
+	"""
+
+	return np.packbits(np.asarray(rolls) > 0, axis=-1)
+
+
+def unpack_rolls(packed, dtype=np.float32):
+	""" Converts packed pianorolls back to dense ones, typically for one batch at a time.
+
+	Parameters
+	----------
+	packed : np array
+		The uint8 packed pianorolls, of shape (..., 16), as returned by pack_rolls.
+	dtype : numpy dtype
+		The type of the dense pianorolls. float32 is what Keras uses.
+
+	Returns
+	-------
+	rolls : np array
+		The dense pianorolls, of shape (..., 128).
+
+	"""
+
+	return np.unpackbits(np.asarray(packed), axis=-1).astype(dtype, copy=False)
+
+
+def default_cache_path(directory):
+	# The cache lies next to the dataset directory, so that it is never listed as a sample
+	return os.path.normpath(directory) + '.cache'
+
+
+def sample_stats(directory, f):
+	# What identifies the version of a sample on disk : mtime and size of both files
+	xstat = os.stat(directory + 'x' + f)
+	ystat = os.stat(directory + 'y' + f)
+	return [xstat.st_mtime_ns, xstat.st_size, ystat.st_mtime_ns, ystat.st_size]
+
+
+def read_cache(cache_path):
+	""" Opens the pianoroll cache of a dataset directory.
+	The arrays are memory-mapped, so that only the rows actually used are read from disk.
+
+	Parameters
+	----------
+	cache_path : str
+		The location of the cache directory.
+
+	Returns
+	-------
+	names, stats, X, y : np arrays
+		The cached sample names, their file stats and their (samples, 10, 16) / (samples, 16) packed pianorolls
+		(see pack_rolls). None if there is no valid cache at this location.
+
+	"""
+
+	try:
+		with np.load(os.path.join(cache_path, 'index.npz')) as index:
+			names = index['names']
+			stats = index['stats']
+		X = np.load(os.path.join(cache_path, 'X.npy'), mmap_mode='r')
+		y = np.load(os.path.join(cache_path, 'y.npy'), mmap_mode='r')
+	except (IOError, OSError, ValueError, KeyError):
+		return None
+	# A cache interrupted while being written, or in an older format, is simply ignored
+	if not (len(names) == len(stats) == len(X) == len(y)):
+		return None
+	if X.shape[-1] != 16 or y.shape[-1] != 16:
+		return None
+	return names, stats, X, y
+
+
+def write_cache(cache_path, names, stats, X, y):
+	""" Writes the pianoroll cache of a dataset directory.
+	Each file is first written to a temporary name then moved, so that readers never see a partial file.
+
+	Parameters
+	----------
+	cache_path : str
+		The location of the cache directory.
+	names, stats, X, y : np arrays
+		See read_cache.
+
+	Returns
+	-------
+	None.
+		Writes the cache to disk.
+
+	"""
+
+	for filename, arr in [('X.npy', X), ('y.npy', y)]:
+		rw.atomic_write(os.path.join(cache_path, filename), lambda f: np.save(f, arr))
+	# The index is written last : it validates the arrays
+	rw.atomic_write(os.path.join(cache_path, 'index.npz'),
+					lambda f: np.savez(f, names=np.array(names, dtype=str), stats=stats))
+
+
+def load_pianorolls(directory, filenames, cache_path=None, engine='music21', workers=1, packed=False):
+	""" Decodes the pianorolls of the given samples, using an on-disk cache.
+	Only the samples that are not cached yet, or whose files changed (mtime or size), are parsed again.
+	The cache is then rewritten with the given samples only : give all the samples of the directory.
+
+	Parameters
+	----------
+	directory : str
+	  The location of the directory containing the midi files.
+	filenames : str list
+	  The samples to load, as returned by list_samples.
+	cache_path : str
+	  The location of the cache directory. By default, it lies next to the dataset directory.
+	engine : str
+	  The midi decoder used by importMIDI : 'music21' or 'native'.
+	workers : int
+	  The number of processes decoding the files. None to use all the cores.
+	packed : bool
+	  Whether to return the packed pianorolls (see pack_rolls), which are what the cache stores.
+
+	Returns
+	-------
+	X, y : np arrays
+	  The (samples, 10, 128) data and (samples, 128) labels, as uint8, in the order of filenames.
+	  If packed, (samples, 10, 16) and (samples, 16) instead.
+
+	"""
+
+	if cache_path is None:
+		cache_path = default_cache_path(directory)
+	n_files = len(filenames)
+	stats = np.array([sample_stats(directory, f) for f in filenames], dtype=np.int64).reshape((n_files, 4))
+
+	X = np.zeros((n_files, len(columns_to_keep), 16), dtype=np.uint8)
+	y = np.zeros((n_files, 16), dtype=np.uint8)
+
+	# Look for the up-to-date samples in the cache
+	to_decode = list(range(n_files))
+	cache = read_cache(cache_path)
+	if cache is not None:
+		cached_names, cached_stats, cached_X, cached_y = cache
+		cached_rows = dict((name, row) for row, name in enumerate(cached_names))
+		hits = []
+		rows = []
+		to_decode = []
+		for i, f in enumerate(filenames):
+			row = cached_rows.get(f)
+			if row is not None and np.array_equal(cached_stats[row], stats[i]):
+				hits.append(i)
+				rows.append(row)
+			else:
+				to_decode.append(i)
+		if hits:
+			X[hits] = cached_X[rows]
+			y[hits] = cached_y[rows]
+		up_to_date = (not to_decode) and len(cached_names) == n_files
+		del cached_X, cached_y
+	else:
+		up_to_date = False
+
+	decode = functools.partial(decode_sample, directory, engine=engine)
+	samples = parallel_map(decode, [filenames[i] for i in to_decode], workers)
+	for i, (x_sample, y_sample) in zip(to_decode, samples):
+		X[i] = pack_rolls(x_sample)
+		y[i] = pack_rolls(y_sample)
+
+	if not up_to_date:
+		print(len(to_decode), 'midi samples decoded,', n_files - len(to_decode), 'read from cache.')
+		write_cache(cache_path, filenames, stats, X, y)
+
+	if packed:
+		return X, y
+	return unpack_rolls(X, np.uint8), unpack_rolls(y, np.uint8)
+
+
+def load_midi_prediction(directory, cache=True, cache_path=None, engine='music21', workers=1, packed=False):
 	""" Loads the midi files and creates a trainable dataset for prediction.
-	This may take a couple of seconds to complete.
+	This may take a couple of seconds to complete the first time.
+	The decoded pianorolls are then cached on disk, so that the next loads are near-instant.
 
 	Parameters
 	----------
 	directory : str
 	  The location of the directory containing the midi files.
+	cache : bool
+	  Whether to use the on-disk cache of the decoded pianorolls.
+	cache_path : str
+	  The location of the cache. By default, 'toy/dataset/progressions/' is cached in 'toy/dataset/progressions.cache'.
+	engine : str
+	  The midi decoder : 'music21', or 'native' for our faster reader (see midi_reader).
+	workers : int
+	  The number of processes decoding the files. None to use all the cores.
+	  The order of the samples, hence the training / validation split, does not depend on it.
+	packed : bool
+	  Whether to return bit-packed uint8 arrays (see pack_rolls) instead of float ones.
+	  They take 64 times less memory : batches can then be converted with unpack_rolls when needed.
 
 	Returns
 	-------
@@ -87,49 +359,263 @@ def load_midi_prediction(directory):
 	  The training and validation data for midi chords prediction on this file.
 	  X contains an array of 10 chords, y is the 11th chord to predict.
 	  These arrays contain, for each chord, a 128-long list indicating the activation of each midi note.
+	  If packed, this list is packed into 16 bytes.
 
 	"""
 
-	filenames = os.listdir(directory)
-	filenames = [x[1:] for x in filenames]
-	filenames = list(set(filenames))
+	filenames = list_samples(directory)
 	n_files = len(filenames)
 
-	dataX = []
-	dataY = []
-
 	# prepare to split the dataset into training and validation data
 	ratio = 0.7
 	idx_train = int(ratio * n_files)
 
-	# 1 midi event = 16 channels -> Keep 1 column out of 16
-	columns_to_keep = [16 * i for i in range(10)]
-
-	for f in filenames:
-		xfile = directory + 'x' + f
-		yfile = directory + 'y' + f
-		Xall_parts = importMIDI(xfile)
-		Yall_parts = importMIDI(yfile)
-		Xall_parts = Xall_parts['None'][:, columns_to_keep]
-		Yall_parts = Yall_parts['None'][:, 0]
-		dataX.append(Xall_parts)
-		dataY.append(Yall_parts)
+	if cache:
+		X, y = load_pianorolls(directory, filenames, cache_path, engine, workers, packed=True)
+	else:
+		X = np.zeros((n_files, len(columns_to_keep), 16), dtype=np.uint8)
+		y = np.zeros((n_files, 16), dtype=np.uint8)
+		decode = functools.partial(decode_sample, directory, engine=engine)
+		for i, (x_sample, y_sample) in enumerate(parallel_map(decode, filenames, workers)):
+			X[i] = pack_rolls(x_sample)
+			y[i] = pack_rolls(y_sample)
 
 	print("Midi data loaded.")
 
-	dataXtrain = dataX[:idx_train]
-	print(len(dataXtrain), 'training samples')
-	dataXval = dataX[idx_train:]
-	print(len(dataXval), 'validation samples')
-	dataYtrain = dataY[:idx_train]
-	dataYval = dataY[idx_train:]
-
 	# reshape data to be [samples, time steps, features] expected by an LSTM network.
 	# Here (samples, 10, 128) and (samples, 128)
+	if not packed:
+		X = unpack_rolls(X, float)
+		y = unpack_rolls(y, float)
+
+	return split_prediction(X, y, idx_train)
 
-	Xtrain = np.array([np.transpose(x) for x in dataXtrain])
-	Xval = np.array([np.transpose(x) for x in dataXval])
-	ytrain = np.array(dataYtrain)
-	yval = np.array(dataYval)
+
+def split_prediction(X, y, idx_train):
+	# Splits the dataset into training and validation data
+	Xtrain = X[:idx_train]
+	print(len(Xtrain), 'training samples')
+	Xval = X[idx_train:]
+	print(len(Xval), 'validation samples')
+	ytrain = y[:idx_train]
+	yval = y[idx_train:]
 
 	return Xtrain, ytrain, Xval, yval
+
+
+def load_arrays_prediction(filename, packed=False):
+	""" Loads the dataset built in memory by toy/scripts/main.py, without reading any midi file.
+	The samples are the same as with load_midi_prediction, but in the order of their generation :
+	the validation data are thus made of the last progressions of toy/scripts/progressions_list.py.
+
+	Parameters
+	----------
+	filename : str
+	  The location of the numpy arrays, typically 'toy/dataset/progressions.npz'.
+	packed : bool
+	  Whether to return bit-packed uint8 arrays (see pack_rolls) instead of float ones.
+
+	Returns
+	-------
+	Xtrain, ytrain, Xval, yval : np arrays
+	  The training and validation data, see load_midi_prediction.
+
+	"""
+
+	with np.load(filename) as dataset:
+		X = dataset['X']
+		y = dataset['y']
+
+	ratio = 0.7
+	idx_train = int(ratio * len(X))
+
+	if packed:
+		X = pack_rolls(X)
+		y = pack_rolls(y)
+	else:
+		X = X.astype(float)
+		y = y.astype(float)
+
+	return split_prediction(X, y, idx_train)
+
+
+# Index of the samples, by the fields of their names
+
+# The samples of generate_all_midi_progressions are named <progression>_p<permutation>_t<transposition>.mid
+sample_name_pattern = re.compile(r'^(.*)_p(\d+)_t(\d+)\.mid$')
+
+
+def parse_sample_names(filenames):
+	""" Parses the names of the samples of the progression dataset, e.g. 'Eiffel_p2_t4.mid'.
+
+	Parameters
+	----------
+	filenames : str list
+		The sample names, as returned by list_samples.
+
+	Returns
+	-------
+	progressions : str np array
+		The progression of each sample ('Eiffel'), or '' if the name does not follow the pattern.
+	permutations, transpositions : int np arrays
+		The permutation (2) and transposition (4) of each sample, or -1.
+
+	"""
+
+	matches = [sample_name_pattern.match(f) for f in filenames]
+	progressions = np.array([m.group(1) if m else '' for m in matches], dtype=str)
+	permutations = np.array([int(m.group(2)) if m else -1 for m in matches], dtype=int)
+	transpositions = np.array([int(m.group(3)) if m else -1 for m in matches], dtype=int)
+	return progressions, permutations, transpositions
+
+
+class SampleIndex:
+	""" The fields of the sample names of the progression dataset, parsed once for many queries.
+
+	Attributes
+	----------
+	names : str np array
+		The sample names, as returned by list_samples.
+	progressions, permutations, transpositions : np arrays
+		The fields of each name (see parse_sample_names).
+
+	Example
+	-------
+	How to use this class
+
+			index = SampleIndex(list_samples('toy/dataset/progressions/'))
+			rows = index.select(name='Eiffel', p=0)
+			rows = index.select(t=[1, 2])
+
+	"""
+
+	def __init__(self, filenames):
+		self.names = np.asarray(filenames, dtype=str)
+		self.progressions, self.permutations, self.transpositions = parse_sample_names(self.names)
+
+	def __len__(self):
+		return len(self.names)
+
+	def select(self, name=None, p=None, t=None):
+		""" Finds the samples of a progression, permutation and transposition, by exact match of the fields
+		of their names : t=1 selects 'Eiffel_p0_t1.mid', not 'Eiffel_p0_t10.mid'.
+
+		Parameters
+		----------
+		name : str or str list
+			The progression(s) to select, e.g. 'Eiffel'. All of them if None.
+		p : int or int list
+			The permutation(s) to select. All of them if None.
+		t : int or int list
+			The transposition(s) to select. All of them if None.
+
+		Returns
+		-------
+		rows : int np array
+			The positions of the selected samples in names.
+
+		"""
+
+		selected = np.ones(len(self.names), dtype=bool)
+		for values, wanted in [(self.progressions, name), (self.permutations, p), (self.transpositions, t)]:
+			if wanted is not None:
+				selected &= np.isin(values, np.atleast_1d(wanted))
+		return np.nonzero(selected)[0]
+
+
+def select_samples(filenames, name=None, p=None, t=None):
+	# The positions of the selected samples in filenames, see SampleIndex.select.
+	# Parses the names again : build a SampleIndex to run several queries on the same samples
+	return SampleIndex(filenames).select(name, p, t)
+
+
+def query_from_patterns(patterns):
+	""" Converts the patterns of visualize_embedding (e.g. ['Eiffel', 'p0']) to the fields of SampleIndex.select.
+	Several patterns of the same field select the samples matching any of them : ['t1', 't2'] gives t=[1, 2].
+
+	Parameters
+	----------
+	patterns : str list
+		Progression names, 'p<permutation>' and 't<transposition>' patterns.
+
+	Returns
+	-------
+	query : dict
+		The name, p and t lists to select, for the fields given.
+
+	"""
+
+	query = {}
+	for pattern in patterns:
+		match = re.match(r'^([pt])(\d+)$', pattern)
+		if match:
+			query.setdefault(match.group(1), []).append(int(match.group(2)))
+		else:
+			query.setdefault('name', []).append(pattern)
+	return query
+
+
+# The parsed names of the last cache read by load_samples, per cache path
+sample_indexes = {}
+
+
+def cached_sample_index(cache_path, names):
+	# The SampleIndex of the names of a cache, parsed again only when they changed
+	index = sample_indexes.get(cache_path)
+	if index is None or not np.array_equal(index.names, names):
+		index = SampleIndex(names)
+		sample_indexes[cache_path] = index
+	return index
+
+
+def load_samples(directory, name=None, p=None, t=None, cache_path=None, engine='music21', workers=1, packed=False):
+	""" Loads the samples of a progression, permutation and transposition (see SampleIndex.select),
+	reading only their rows of the memory-mapped pianoroll cache.
+	The cache is first completed if the directory changed, or if some selected samples changed.
+
+	Parameters
+	----------
+	directory : str
+	  The location of the directory containing the midi files.
+	name, p, t :
+	  The samples to select, see SampleIndex.select.
+	cache_path : str
+	  The location of the cache. By default, it lies next to the dataset directory.
+	engine, workers :
+	  The midi decoder and the number of processes decoding the files, when the cache has to be completed.
+	packed : bool
+	  Whether to return the packed pianorolls (see pack_rolls).
+
+	Returns
+	-------
+	names : str np array
+	  The names of the selected samples.
+	X, y : np arrays
+	  Their (samples, 10, 128) data and (samples, 128) labels, as uint8.
+	  If packed, (samples, 10, 16) and (samples, 16) instead.
+
+	"""
+
+	if cache_path is None:
+		cache_path = default_cache_path(directory)
+	cache = read_cache(cache_path)
+	filenames = list_samples(directory)
+	rows = None
+	if cache is not None and set(cache[0]) == set(filenames):
+		rows = cached_sample_index(cache_path, cache[0]).select(name, p, t)
+		if not all(np.array_equal(cache[1][row], sample_stats(directory, cache[0][row])) for row in rows):
+			rows = None
+	if rows is None:
+		# Decodes the new and modified samples
+		load_pianorolls(directory, filenames, cache_path, engine, workers, packed=True)
+		cache = read_cache(cache_path)
+		rows = cached_sample_index(cache_path, cache[0]).select(name, p, t)
+
+	names, stats, X, y = cache
+	# Sorted rows make the reads from the memory-mapped cache sequential
+	X = np.array(X[rows])
+	y = np.array(y[rows])
+	if packed:
+		return names[rows], X, y
+	return names[rows], unpack_rolls(X, np.uint8), unpack_rolls(y, np.uint8)
+
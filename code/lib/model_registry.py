@@ -0,0 +1,215 @@
+"""Module model_registry.
+
+A registry of our trained models and of their training histories, stored in 'code/models/'.
+Models are loaded on first use, then kept in memory : switching between models does not load them again.
+The number of models in memory, and the memory taken by their weights, are bounded :
+the least recently used models are dropped first.
+
+A model and its history share a name, up to the word 'Model' : MidiCNNModel3.h5 was trained
+with the history MidiCNN3.history.npz, nativeRNNmidiModel.h5 with nativeRNNmidi.history.npz.
+
+Example
+-------
+How to use this code
+
+	import model_registry as reg
+	print(reg.models.list_models())
+	model = reg.models.get('MidiCNNModel3')
+	history = reg.models.history('MidiCNNModel3')
+
+"""
+
+import collections
+import os
+import threading
+import numpy as np
+
+import numpy_rnn as nr
+import read_write_helpers as rw
+
+# The file extensions of the models : Keras models, and models exported for the numpy engine
+model_extensions = ('.h5', '.npz')
+
+
+def custom_objects():
+	# The custom objects needed to deserialize our Keras models.
+	# Keras (through training_helpers and custom_rnns) is only imported when a Keras model is loaded.
+	import training_helpers as tr
+	import custom_rnns as cr
+	return {'frame_loss': tr.frame_loss, 'MinimalRNNCell': cr.MinimalRNNCell,
+			'MinimalLSTMCell': cr.MinimalLSTMCell, 'ProjectedRNN': cr.ProjectedRNN}
+
+
+def model_size(model):
+	# The memory taken by the weights of a model, in bytes
+	if isinstance(model, nr.NumpyModel):
+		weights = [w for (spec, layer_weights) in model.layers for w in layer_weights]
+	else:
+		weights = model.get_weights()
+	return int(sum(np.asarray(w).nbytes for w in weights))
+
+
+class ModelRegistry:
+	""" The models of a directory, loaded lazily and kept in a least recently used cache.
+
+	Attributes
+	----------
+	directory : str
+		The directory containing the models ('.h5' or '.npz') and their histories ('.history.npz').
+	max_models : int
+		The maximum number of models kept in memory. None for no limit.
+	max_bytes : int
+		The maximum memory taken by the weights of the models kept in memory. None for no limit.
+		The last model loaded is always kept, even if it is bigger.
+
+	Example
+	-------
+	How to use this class
+
+			registry = ModelRegistry('code/models/', max_models=2)
+			cnn = registry.get('MidiCNNModel3')
+			rnn = registry.get('nativeRNNmidiModel')
+			cnn = registry.get('MidiCNNModel3')  # Already in memory
+
+	"""
+
+	def __init__(self, directory='code/models/', max_models=4, max_bytes=None):
+		self.directory = directory
+		self.max_models = max_models
+		self.max_bytes = max_bytes
+		# Model path -> (model, size), the most recently used last
+		self.cache = collections.OrderedDict()
+		self.histories = {}
+		self.lock = threading.RLock()
+
+	def list_models(self):
+		# The names of the models of the directory
+		return sorted(os.path.splitext(f)[0] for f in os.listdir(self.directory)
+					  if os.path.splitext(f)[1] in model_extensions and not f.endswith(rw.history_suffix))
+
+	def list_histories(self):
+		# The names of the training histories of the directory
+		return sorted(set(f[:-len(suffix)] for f in os.listdir(self.directory)
+						  for suffix in (rw.history_suffix, rw.epochs_suffix) if f.endswith(suffix)))
+
+	def model_path(self, name):
+		""" Finds the file of a model.
+
+		Parameters
+		----------
+		name : str
+			The name of the model (e.g. 'MidiCNNModel3'), or the path of its file.
+
+		Returns
+		-------
+		path : str
+			The path of the model file.
+
+		"""
+
+		if os.path.splitext(name)[1] in model_extensions:
+			return name
+		for extension in model_extensions:
+			path = os.path.join(self.directory, name + extension)
+			if os.path.exists(path):
+				return path
+		raise ValueError('No model named ' + name + ' in ' + self.directory)
+
+	def history_path(self, name):
+		""" Finds the training history of a model.
+
+		Parameters
+		----------
+		name : str
+			The name of the model (e.g. 'MidiCNNModel3') or of the history (e.g. 'MidiCNN3').
+
+		Returns
+		-------
+		path : str
+			The path of the history file.
+
+		"""
+
+		name = os.path.basename(name)
+		for suffix in (rw.history_suffix, rw.epochs_suffix) + model_extensions:
+			if name.endswith(suffix):
+				name = name[:-len(suffix)]
+		for history_name in (name, name.replace('Model', '', 1)):
+			# The saved history, or else the log of a training in progress
+			for suffix in (rw.history_suffix, rw.epochs_suffix):
+				path = os.path.join(self.directory, history_name + suffix)
+				if os.path.exists(path):
+					return path
+		raise ValueError('No training history for ' + name + ' in ' + self.directory)
+
+	def get(self, name):
+		""" Returns a model, loading it if it is not in memory yet.
+
+		Parameters
+		----------
+		name : str
+			The name of the model (e.g. 'MidiCNNModel3'), or the path of its file.
+
+		Returns
+		-------
+		model : keras.models.Model or numpy_rnn.NumpyModel
+			The model, with its custom objects (frame_loss, our cells).
+
+		"""
+
+		path = os.path.normpath(self.model_path(name))
+		with self.lock:
+			if path in self.cache:
+				self.cache.move_to_end(path)
+				return self.cache[path][0]
+			if path.endswith('.npz'):
+				model = nr.NumpyModel.load(path)
+			else:
+				import keras.models
+				model = keras.models.load_model(path, custom_objects=custom_objects())
+			self.cache[path] = (model, model_size(model))
+			self.evict()
+			return model
+
+	def history(self, name):
+		""" Returns the training history of a model (see read_write_helpers.save_history).
+
+		Parameters
+		----------
+		name : str
+			The name of the model (e.g. 'MidiCNNModel3') or of the history (e.g. 'MidiCNN3').
+
+		Returns
+		-------
+		history : dict of str -> np array
+			The metrics of each epoch, e.g. history['val_acc'].
+
+		"""
+
+		path = self.history_path(name)
+		with self.lock:
+			if path not in self.histories:
+				directory, filename = os.path.split(path)
+				self.histories[path] = rw.load_history(filename[:filename.index('.history.')], directory)
+			return self.histories[path]
+
+	def memory(self):
+		# The memory taken by the weights of the models in memory, in bytes
+		return sum(size for (model, size) in self.cache.values())
+
+	def evict(self):
+		# Drops the least recently used models until the limits are respected
+		with self.lock:
+			while len(self.cache) > 1 and (
+					(self.max_models is not None and len(self.cache) > self.max_models) or
+					(self.max_bytes is not None and self.memory() > self.max_bytes)):
+				self.cache.popitem(last=False)
+
+	def clear(self):
+		with self.lock:
+			self.cache.clear()
+			self.histories.clear()
+
+
+# The registry of 'code/models/', shared by our scripts
+models = ModelRegistry('code/models/')
@@ -0,0 +1,328 @@
+"""Module numpy_rnn.
+
+A pure numpy inference engine for our recurrent models : the custom cells (MinimalRNNCell, MinimalLSTMCell),
+Keras' SimpleRNN and LSTM, followed by Dense layers (typically the softmax head).
+Once exported, a model can be run without Keras nor TensorFlow, which makes it start in milliseconds
+and run on any CPU-only machine. Only numpy is imported.
+
+Example
+-------
+How to use this code
+
+	-- with Keras, once --
+	import numpy_rnn as nr
+	nr.export_model(model, 'code/models/minimalRNNmidi.npz')
+
+	-- then, without Keras --
+	import numpy_rnn as nr
+	model = nr.NumpyModel.load('code/models/minimalRNNmidi.npz')
+	y = model.predict(X)
+
+"""
+
+import json
+import numpy as np
+
+# The recurrent layers supported, named after the cell (or layer) class they come from
+recurrent_kinds = {'MinimalRNNCell': 'minimal_rnn', 'MinimalLSTMCell': 'minimal_lstm',
+				   'SimpleRNN': 'simple_rnn', 'SimpleRNNCell': 'simple_rnn',
+				   'LSTM': 'lstm', 'LSTMCell': 'lstm'}
+# Layers that do nothing at inference time
+skipped_layers = ['Dropout', 'InputLayer']
+
+
+def hard_sigmoid(x):
+	# Same definition as the Keras backend
+	return np.clip(0.2 * x + 0.5, 0., 1.)
+
+
+def softmax(x):
+	e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+	return e / np.sum(e, axis=-1, keepdims=True)
+
+
+def relu(x):
+	return np.maximum(x, 0.)
+
+
+def sigmoid(x):
+	return 1. / (1. + np.exp(-x))
+
+
+def linear(x):
+	return x
+
+
+activations = {'hard_sigmoid': hard_sigmoid, 'softmax': softmax, 'relu': relu,
+			   'sigmoid': sigmoid, 'tanh': np.tanh, 'linear': linear}
+
+
+def layer_spec(layer):
+	""" Describes a Keras layer for the numpy engine.
+
+	Parameters
+	----------
+	layer : keras.layers.Layer
+		A layer of the model to export.
+
+	Returns
+	-------
+	spec : dict
+		The kind of the layer and its parameters, or None for a layer that is skipped at inference.
+
+	"""
+
+	class_name = type(layer).__name__
+	if class_name in skipped_layers:
+		return None
+	config = layer.get_config()
+	if class_name == 'Dense':
+		return {'kind': 'dense', 'activation': config['activation']}
+	if class_name in ('RNN', 'ProjectedRNN'):
+		cell_name = type(layer.cell).__name__
+		cell_config = layer.cell.get_config()
+	else:
+		cell_name = class_name
+		cell_config = config
+	if cell_name not in recurrent_kinds:
+		raise ValueError('Layer not supported by the numpy engine : ' + class_name)
+	spec = {'kind': recurrent_kinds[cell_name],
+			'return_sequences': config.get('return_sequences', False)}
+	if spec['kind'] in ('simple_rnn', 'lstm'):
+		spec['activation'] = cell_config['activation']
+		spec['use_bias'] = cell_config['use_bias']
+	if spec['kind'] == 'lstm':
+		spec['recurrent_activation'] = cell_config['recurrent_activation']
+	return spec
+
+
+def convert_model(model):
+	""" Converts a Keras model to the numpy engine, in memory.
+
+	Parameters
+	----------
+	model : keras.models.Sequential
+		The trained model. Its layers must be supported (see recurrent_kinds, Dense and Dropout).
+
+	Returns
+	-------
+	numpy_model : NumpyModel
+		The same network, with the same weights.
+
+	"""
+
+	layers = []
+	for layer in model.layers:
+		spec = layer_spec(layer)
+		if spec is not None:
+			layers.append((spec, [np.asarray(w, dtype=np.float32) for w in layer.get_weights()]))
+	return NumpyModel(layers)
+
+
+def export_model(model, filename):
+	""" Extracts the weights of a Keras model and saves them for the numpy engine.
+
+	Parameters
+	----------
+	model : keras.models.Sequential
+		The trained model. Its layers must be supported (see recurrent_kinds, Dense and Dropout).
+	filename : str
+		The '.npz' file to write.
+
+	Returns
+	-------
+	numpy_model : NumpyModel
+		The exported model.
+
+	"""
+
+	numpy_model = convert_model(model)
+	numpy_model.save(filename)
+	return numpy_model
+
+
+class NumpyModel:
+
+	""" A stack of recurrent and dense layers, evaluated with numpy on whole batches.
+
+	Attributes
+	----------
+	layers : (dict, np array list) list
+		For each layer, its description (see layer_spec) and its weights, in the Keras order.
+
+	Example
+	-------
+	How to use this class
+
+			model = NumpyModel.load('code/models/minimalRNNmidi.npz')
+			y = model.predict(X)
+			# Or step by step, keeping the recurrent states :
+			(y, states) = model.run(X[:, :5])
+			(y, states) = model.run(X[:, 5:], states)
+
+	"""
+
+	def __init__(self, layers):
+		self.layers = layers
+
+	@classmethod
+	def load(cls, filename):
+		with np.load(filename, allow_pickle=False) as archive:
+			specs = json.loads(str(archive['specs']))
+			layers = [(spec, [archive['layer%d_%d' % (i, j)] for j in range(spec['n_weights'])])
+					  for i, spec in enumerate(specs)]
+		return cls(layers)
+
+	def save(self, filename):
+		specs = []
+		arrays = {}
+		for i, (spec, weights) in enumerate(self.layers):
+			spec = dict(spec, n_weights=len(weights))
+			specs.append(spec)
+			for j, w in enumerate(weights):
+				arrays['layer%d_%d' % (i, j)] = w
+		np.savez(filename, specs=np.array(json.dumps(specs)), **arrays)
+
+	def initial_states(self, batch_size):
+		""" The zero states of the recurrent layers, as used by Keras at the beginning of a sequence.
+
+		Parameters
+		----------
+		batch_size : int
+			The number of sequences.
+
+		Returns
+		-------
+		states : list
+			For each layer, the list of its state arrays ([h] or [h, c]), or None for a dense layer.
+
+		"""
+
+		states = []
+		for spec, weights in self.layers:
+			units = weights[1].shape[0] if spec['kind'] != 'dense' else 0
+			if spec['kind'] in ('minimal_lstm', 'lstm'):
+				states.append([np.zeros((batch_size, units), np.float32), np.zeros((batch_size, units), np.float32)])
+			elif spec['kind'] != 'dense':
+				states.append([np.zeros((batch_size, units), np.float32)])
+			else:
+				states.append(None)
+		return states
+
+	def run(self, X, states=None):
+		""" Runs the model on a batch of sequences, starting from the given recurrent states.
+		Calling it on a sequence cut in several parts gives the same result as on the whole sequence.
+
+		Parameters
+		----------
+		X : np array
+			The (batch, timesteps, features) inputs.
+		states : list
+			The states to start from, as returned by initial_states or by a previous call. Zero states by default.
+
+		Returns
+		-------
+		y : np array
+			The outputs of the last layer.
+		states : list
+			The recurrent states at the end of the sequences.
+
+		"""
+
+		X = np.asarray(X, dtype=np.float32)
+		if states is None:
+			states = self.initial_states(len(X))
+		new_states = []
+		for (spec, weights), state in zip(self.layers, states):
+			if spec['kind'] == 'dense':
+				bias = weights[1] if len(weights) > 1 else 0.
+				X = activations[spec['activation']](np.dot(X, weights[0]) + bias)
+				new_states.append(None)
+			else:
+				X, state = run_recurrent(spec, weights, X, state)
+				new_states.append(state)
+		return X, new_states
+
+	def predict(self, X, batch_size=None):
+		""" Predicts the outputs for whole sequences, like keras.models.Model.predict.
+
+		Parameters
+		----------
+		X : np array
+			The (samples, timesteps, features) inputs.
+		batch_size : int
+			The number of sequences processed at once, to bound the memory. All of them by default.
+
+		Returns
+		-------
+		y : np array
+			The outputs of the model.
+
+		"""
+
+		if batch_size is None:
+			return self.run(X)[0]
+		return np.concatenate([self.run(X[i:i + batch_size])[0] for i in range(0, len(X), batch_size)])
+
+
+def run_recurrent(spec, weights, X, state):
+	""" Runs one recurrent layer over a batch of sequences.
+	The input projection is computed for all the timesteps at once (as in ProjectedRNN) :
+	only the recurrent product stays in the loop.
+
+	Parameters
+	----------
+	spec : dict
+		The description of the layer (see layer_spec).
+	weights : np array list
+		kernel, recurrent_kernel and, for Keras' layers, bias.
+	X : np array
+		The (batch, timesteps, features) inputs.
+	state : np array list
+		The initial states of the layer ([h] or [h, c]).
+
+	Returns
+	-------
+	output : np array
+		The (batch, timesteps, units) outputs if the layer returns sequences, the last (batch, units) output otherwise.
+	state : np array list
+		The states after the last timestep.
+
+	"""
+
+	kind = spec['kind']
+	kernel, recurrent_kernel = weights[0], weights[1]
+	projected = np.dot(X, kernel)
+	if kind in ('simple_rnn', 'lstm') and spec['use_bias']:
+		projected += weights[2]
+
+	outputs = []
+	if kind in ('minimal_rnn', 'simple_rnn'):
+		activation = activations[spec['activation']] if kind == 'simple_rnn' else linear
+		h = state[0]
+		for t in range(X.shape[1]):
+			h = activation(projected[:, t] + np.dot(h, recurrent_kernel))
+			outputs.append(h)
+		state = [h]
+	else:
+		if kind == 'lstm':
+			activation = activations[spec['activation']]
+			recurrent_activation = activations[spec['recurrent_activation']]
+		else:
+			activation = np.tanh
+			recurrent_activation = hard_sigmoid
+		units = recurrent_kernel.shape[0]
+		h, c = state
+		for t in range(X.shape[1]):
+			z = projected[:, t] + np.dot(h, recurrent_kernel)
+			i = recurrent_activation(z[:, :units])
+			f = recurrent_activation(z[:, units: units * 2])
+			c = f * c + i * activation(z[:, units * 2: units * 3])
+			o = recurrent_activation(z[:, units * 3:])
+			h = o * activation(c)
+			outputs.append(h)
+		state = [h, c]
+
+	if spec['return_sequences']:
+		return np.stack(outputs, axis=1), state
+	return outputs[-1], state
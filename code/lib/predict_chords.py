@@ -19,14 +19,27 @@ How to use this code
 	$ timidity test_pred.mid
 	$ timidity test_real.mid
 
+	-- Or, to generate a whole progression with a recurrent model --
+	pr.generate_and_write(test_idx, 'code/models/nativeRNNmidiModel.h5', 32, 'test')
+	$ timidity test_gen.mid
+
+	-- Or, to predict many sequences at once (here the whole validation set) --
+	$ python code/lib/predict_chords.py code/models/MidiCNNModel2.h5 predictions/
+	$ python code/lib/predict_chords.py code/models/MidiCNNModel2.h5 predictions/ --indices 68 69 70
+	$ python code/lib/predict_chords.py code/models/MidiCNNModel2.h5 predictions/ --directory my_midi_files/
+
 """
 
 
-import keras.models
+import argparse
+import functools
+import os
+import time
 import numpy as np
 from midiutil.MidiFile import MIDIFile
 import midi_to_data as md
-import training_helpers as tr
+import model_registry as reg
+import numpy_rnn as nr
 
 
 def predict_and_write(test_idx, model_path, output_path):
@@ -52,9 +65,7 @@ def predict_and_write(test_idx, model_path, output_path):
 	"""
 
 	[X, y, Xval, yval] = md.load_midi_prediction('toy/dataset/progressions/')
-	model = keras.models.load_model(
-		model_path, custom_objects={
-			'frame_loss': tr.frame_loss})
+	model = load_model(model_path)
 	x = Xval[test_idx]
 	y = np.array(yval[test_idx])
 	x = np.reshape(x, (1, 10, 128))
@@ -67,6 +78,241 @@ def predict_and_write(test_idx, model_path, output_path):
 	data_to_midi(y, output_path + '_real' + '.mid')
 
 
+def chord_from_output(y_predicted, threshold=0.5, n_notes=None):
+	# Binarizes the output of a network : the pitches above the threshold,
+	# or the n_notes most probable ones if given.
+	chord = np.zeros(len(y_predicted), dtype=int)
+	if n_notes is None:
+		chord[y_predicted > threshold] = 1
+	else:
+		chord[np.argsort(y_predicted)[-n_notes:]] = 1
+	return chord
+
+
+def generate_progression(model, seed, n_chords, threshold=0.5, n_notes=None):
+	"""Generates a chord progression autoregressively : each predicted chord is fed back to the model.
+	The recurrent states (h, c) are kept between steps, so each new chord costs a single step of the cells,
+	instead of encoding the whole window again.
+
+	Parameters
+	----------
+	model : numpy_rnn.NumpyModel
+		A recurrent model converted for the numpy engine (see numpy_rnn.convert_model).
+	seed : numpy array
+		The (timesteps, 128) chords the progression starts with, typically 10 chords from Xval.
+	n_chords : int
+		The number of chords to generate.
+	threshold : float
+		The output value above which a pitch is played.
+	n_notes : int
+		If given, the number of pitches of each chord (the most probable ones), instead of the threshold.
+		It suits models trained with a softmax output, whose values are rarely above 0.5.
+
+	Returns
+	-------
+	chords : numpy array
+		The (n_chords, 128) generated chords.
+
+	"""
+
+	# The seed is encoded once, then the model only sees the last chord
+	(y_predicted, states) = model.run(np.reshape(seed, (1,) + np.shape(seed)))
+	chords = []
+	for _ in range(n_chords):
+		chord = chord_from_output(y_predicted[0], threshold, n_notes)
+		chords.append(chord)
+		(y_predicted, states) = model.run(np.reshape(chord, (1, 1, -1)), states)
+	return np.array(chords)
+
+
+def generate_and_write(test_idx, model_path, n_chords, output_path, threshold=0.5, n_notes=None):
+	"""Generates a progression from a sequence of the validation data, and writes it to a midi file.
+
+	Parameters
+	----------
+	test_idx : int
+			The index of the sequence of Xval used as the beginning of the progression.
+	model_path : str
+			The path of the recurrent model : a Keras '.h5' file, or a '.npz' file exported by numpy_rnn.
+	n_chords : int
+			The number of chords to generate.
+	output_path : str
+			The path where to write the generated midi file : the seed followed by the generated chords.
+	threshold, n_notes :
+			See generate_progression.
+
+	Returns
+	-------
+	None.
+		Writes generated sequence to disk.
+
+	"""
+
+	[X, y, Xval, yval] = md.load_midi_prediction('toy/dataset/progressions/')
+	model = load_model(model_path)
+	if not isinstance(model, nr.NumpyModel):
+		model = nr.convert_model(model)
+	seed = Xval[test_idx]
+	chords = generate_progression(model, seed, n_chords, threshold, n_notes)
+	data_to_midi(np.concatenate([seed, chords]), output_path + '_gen' + '.mid')
+
+
+def load_model(model_path):
+	# Loads a trained model : a Keras '.h5' file, or a '.npz' file exported by numpy_rnn.
+	# The registry keeps it in memory, so that the next calls do not load it again.
+	return reg.models.get(model_path)
+
+
+def reshape_for_model(X, model):
+	# Our models do not all take (10, 128) samples : e.g. the ones with TimeDistributed layers
+	# take an extra axis. The numpy engine takes (timesteps, 128) samples, like Keras' recurrent layers.
+	input_shape = getattr(model, 'input_shape', None)
+	if input_shape is None:
+		return X
+	return np.reshape(X, (len(X),) + tuple(input_shape[1:]))
+
+
+def load_directory(directory, engine='music21', workers=1):
+	"""Loads the sequences of a directory of midi files, as packed pianorolls (see midi_to_data.pack_rolls).
+
+	Parameters
+	----------
+	directory : str
+			Either a dataset directory, with pairs of 'x<name>' (data) and 'y<name>' (label) files,
+			or any directory of '.mid' files, whose first 10 chords are used as inputs.
+	engine : str
+			The midi decoder : 'music21' or 'native' (see midi_to_data.importMIDI).
+	workers : int
+			The number of processes decoding the files. None to use all the cores.
+
+	Returns
+	-------
+	names : str list
+			The name of each sequence.
+	X : numpy array
+			The (samples, 10, 16) packed inputs.
+	y : numpy array
+			The (samples, 16) packed labels, or None if the directory has no labels.
+
+	"""
+
+	filenames = sorted(f for f in os.listdir(directory) if f.endswith('.mid'))
+	samples = sorted(set(f[1:] for f in filenames))
+	if filenames and all(f[0] in 'xy' for f in filenames) and len(filenames) == 2 * len(samples):
+		# The decoded pianorolls are cached, as in load_midi_prediction.
+		# midi_to_data expects the directory to end with a separator
+		X, y = md.load_pianorolls(os.path.join(directory, ''), samples, engine=engine, workers=workers, packed=True)
+		return samples, X, y
+
+	paths = [os.path.join(directory, f) for f in filenames]
+	X = np.zeros((len(paths), len(md.columns_to_keep), 16), dtype=np.uint8)
+	decode = functools.partial(md.decode_data, engine=engine)
+	for i, x_sample in enumerate(md.parallel_map(decode, paths, workers)):
+		X[i] = md.pack_rolls(x_sample)
+	return filenames, X, None
+
+
+def predict_packed(model, X, batch_size=1024):
+	"""Predicts the outputs of a model on packed sequences (see midi_to_data.pack_rolls), by large batches.
+	The data stays packed : each batch is unpacked just before being predicted.
+
+	Parameters
+	----------
+	model : keras.models.Model or numpy_rnn.NumpyModel
+			The trained model.
+	X : numpy array
+			The (samples, 10, 16) packed sequences.
+	batch_size : int
+			The number of sequences predicted at once.
+
+	Returns
+	-------
+	y_predicted : numpy array
+			The (samples, 128) raw outputs of the model, as float32.
+
+	"""
+
+	y_predicted = np.zeros((len(X), 128), dtype=np.float32)
+	for i in range(0, len(X), batch_size):
+		x = reshape_for_model(md.unpack_rolls(X[i:i + batch_size]), model)
+		y_predicted[i:i + batch_size] = model.predict(x, batch_size=len(x))
+	return y_predicted
+
+
+def predict_batch_and_write(model_path, output_dir, indices=None, directory=None, batch_size=1024,
+							threshold=0.5, engine='music21', workers=1):
+	"""Predicts the next chord of many sequences, and writes the predicted and real chords to midi files.
+	The model and the data are loaded once, then the sequences are predicted by large batches.
+
+	Parameters
+	----------
+	model_path : str
+			The path of the trained model : a Keras '.h5' file, or a '.npz' file exported by numpy_rnn.
+	output_dir : str
+			The directory where to write the '<name>_pred.mid' and '<name>_real.mid' files.
+	indices : int list
+			The indices in Xval of the sequences to predict. All of them by default.
+	directory : str
+			A directory of midi files to predict instead of Xval (see load_directory).
+	batch_size : int
+			The number of sequences predicted at once.
+	threshold : float
+			The output value above which a pitch is played.
+	engine, workers :
+			The midi decoder and the number of processes decoding and writing the files
+			(see midi_to_data.load_midi_prediction).
+
+	Returns
+	-------
+	y_predicted : numpy array
+			The (samples, 128) predicted chords.
+		Writes generated sequences to disk.
+
+	"""
+
+	start = time.time()
+	model = load_model(model_path)
+	if directory is None:
+		[X, y, Xval, yval] = md.load_midi_prediction('toy/dataset/progressions/', engine=engine,
+													 workers=workers, packed=True)
+		if indices is None:
+			indices = range(len(Xval))
+		indices = list(indices)
+		names = [str(idx) for idx in indices]
+		X = Xval[indices]
+		y = yval[indices]
+	else:
+		names, X, y = load_directory(directory, engine, workers)
+	loaded = time.time()
+
+	y_predicted = (predict_packed(model, X, batch_size) > threshold).astype(int)
+	predicted = time.time()
+
+	if not os.path.exists(output_dir):
+		os.makedirs(output_dir)
+	files = []
+	for i, name in enumerate(names):
+		name = os.path.join(output_dir, os.path.splitext(name)[0])
+		files.append((name + '_pred' + '.mid', y_predicted[i]))
+		if y is not None:
+			files.append((name + '_real' + '.mid', md.unpack_rolls(y[i], int)))
+	for _ in md.parallel_map(write_chord, files, workers):
+		pass
+	written = time.time()
+
+	n = len(X)
+	print('%d sequences : loading %.2f s, prediction %.2f s (%.0f sequences/s), writing %.2f s' % (
+		n, loaded - start, predicted - loaded, n / max(predicted - loaded, 1e-9), written - predicted))
+	print('Overall : %.0f sequences/s' % (n / max(written - start, 1e-9)))
+	return y_predicted
+
+
+def write_chord(output_name_and_data):
+	# data_to_midi on a single (output_name, data) argument, for midi_to_data.parallel_map
+	(output_name, data) = output_name_and_data
+	data_to_midi(data, output_name)
+
+
 def data_to_midi(data, output_name):
 	"""Generates .mid chord sequences corresponding to the given array.
 	Writes the ouptut to midi files.
@@ -74,9 +320,10 @@ def data_to_midi(data, output_name):
 	Parameters
 	----------
 		data : numpy array
-			For each time step, a list of the Midi pitches of the corresponding chord.
+			A 128-long list indicating the activation of each midi note of a chord.
+			Or, for a sequence of chords lasting one beat each, a (timesteps, 128) array.
 		output_name : str
-			A name for this chord's file.
+			A name for this chord's file, or a file object opened in binary mode.
 
 	Returns
 	-------
@@ -95,14 +342,37 @@ def data_to_midi(data, output_name):
 	mf.addTrackName(track, time, "Sample Track")
 	mf.addTempo(track, time, global_tempo)
 
-	for idx, val in enumerate(data):
+	if np.ndim(data) == 1:
+		data = [data]
+
+	for time, chord in enumerate(data):
+
+		for idx, val in enumerate(chord):
 
-		if val == 1:
-			# add the note
-			# 1 is the duration of the note
-			# 100 is the volume
-			mf.addNote(track, channel, idx, time, 1, 100)
+			if val == 1:
+				# add the note
+				# 1 is the duration of the note
+				# 100 is the volume
+				mf.addNote(track, channel, idx, time, 1, 100)
 
 	# finally, write sequence to disk
+	if hasattr(output_name, 'write'):
+		mf.writeFile(output_name)
+		return
 	with open(output_name, 'wb') as outf:
 		mf.writeFile(outf)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Predicts the next chord of many sequences and writes them to midi files.')
+	parser.add_argument('model_path', help="a Keras '.h5' model, or a '.npz' model exported by numpy_rnn")
+	parser.add_argument('output_dir', help='the directory where to write the midi files')
+	parser.add_argument('--indices', type=int, nargs='+', help='the indices in Xval of the sequences (all by default)')
+	parser.add_argument('--directory', help='a directory of midi files to predict instead of Xval')
+	parser.add_argument('--batch-size', type=int, default=1024)
+	parser.add_argument('--threshold', type=float, default=0.5)
+	parser.add_argument('--engine', default='music21', choices=['music21', 'native'])
+	parser.add_argument('--workers', type=int, default=1)
+	args = parser.parse_args()
+	predict_batch_and_write(args.model_path, args.output_dir, args.indices, args.directory, args.batch_size,
+							args.threshold, args.engine, args.workers)
@@ -1,20 +1,269 @@
 """This module aims at helping saving and loading Python objects.
 It is typically used to save training history and avoid re-training the network each time.
 
+Training histories and other numeric artifacts are stored as columns of numpy arrays in '.npz' files,
+which load without pickle (hence safely), and from which some columns can be read without the other ones.
+Metrics can also be appended epoch by epoch, while training, to a '.jsonl' file (one JSON line per epoch).
+All writes are atomic : a file is written to a temporary name then renamed,
+so that an interrupted run never leaves a truncated file.
+
 Example
 -------
 How to use this code
 
 	import read_write_helpers as rw
+	rw.save_history(history.history, 'minimalLSTM')
+	history = rw.load_history('minimalLSTM')
+	val_acc = rw.load_history('minimalLSTM', keys=['val_acc'])['val_acc']
+
+	-- convert the histories saved with pickle by the previous versions --
+	$ python code/lib/read_write_helpers.py migrate code/models/
 
 """
 
+import contextlib
+import json
+import os
 import pickle
+import sys
+import numpy as np
+
+# The directory of the artifacts, when no other root is given
+default_root = 'code/models/'
+# The suffixes of the training histories, and of their epoch by epoch logs
+history_suffix = '.history.npz'
+epochs_suffix = '.history.jsonl'
+
+
+def artifact_path(name, suffix, root=None):
+	# The path of an artifact in the root directory
+	return os.path.join(default_root if root is None else root, name + suffix)
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+	""" Gives a temporary path to write a file to, which is renamed to the final path once the block completes.
+	If the block fails, the temporary file is removed and the previous file, if any, is left intact.
+
+	Parameters
+	----------
+	path : str
+		The path of the file.
+
+	Returns
+	-------
+	temporary_path : str
+		The path to write to, inside the with block.
+
+	"""
+
+	directory = os.path.dirname(path)
+	if directory and not os.path.isdir(directory):
+		os.makedirs(directory)
+	temporary_path = path + '.tmp'
+	try:
+		yield temporary_path
+	except BaseException:
+		if os.path.exists(temporary_path):
+			os.remove(temporary_path)
+		raise
+	os.replace(temporary_path, path)
+
+
+def atomic_write(path, write, mode='wb'):
+	""" Writes a file through a temporary file, renamed once complete (see atomic_path).
+
+	Parameters
+	----------
+	path : str
+		The path of the file.
+	write : function
+		Writes the content of the file to the file object it is given.
+	mode : str
+		The mode the file object is opened with : 'wb' for a binary file, 'w' for a text file.
+
+	Returns
+	-------
+	None.
+		Writes the file to disk.
+
+	"""
+
+	with atomic_path(path) as temporary_path:
+		with open(temporary_path, mode) as f:
+			write(f)
+
+
+def save_arrays(arrays, name, root=None, compress=False, suffix='.npz'):
+	"""Saves named numeric columns (e.g. the metrics of a training history) to a '.npz' file.
+
+	Parameters
+	----------
+	arrays : dict of str -> array-like
+		The columns to save. Each one must convert to a numeric or string numpy array.
+	name : str
+		The name of the file to write to, without extension.
+	root : str
+		The directory of the file. default_root by default.
+	compress : bool
+		Whether to compress the file (slower to write and read, but smaller).
+	suffix : str
+		The extension of the file.
+
+	Returns
+	-------
+		None.
+		Writes the '.npz' file to disk.
+
+	"""
+
+	columns = dict((key, np.asarray(value)) for key, value in arrays.items())
+	for key, column in columns.items():
+		if column.dtype == object:
+			raise ValueError('The column ' + key + ' is not numeric : it could only be saved with pickle.')
+	savez = np.savez_compressed if compress else np.savez
+	atomic_write(artifact_path(name, suffix, root), lambda f: savez(f, **columns))
+
+
+def load_arrays(name, root=None, keys=None, suffix='.npz'):
+	"""Loads named columns saved by save_arrays. Only the requested columns are read from the file.
+
+	Parameters
+	----------
+	name : str
+		The name of the file to read from, without extension.
+	root : str
+		The directory of the file. default_root by default.
+	keys : str list
+		The columns to read. All of them by default.
+	suffix : str
+		The extension of the file.
+
+	Returns
+	-------
+	arrays : dict of str -> np array
+		The columns.
+
+	"""
+
+	with np.load(artifact_path(name, suffix, root), allow_pickle=False) as archive:
+		return dict((key, archive[key]) for key in (archive.files if keys is None else keys))
+
+
+def save_history(history, name, root=None, compress=False):
+	"""Saves a training history (the history attribute of the object returned by model.fit).
+
+	Parameters
+	----------
+	history : dict of str -> float list
+		The metrics of each epoch.
+	name : str
+		The name of the history, e.g. 'minimalLSTM'.
+	root : str
+		The directory of the file. default_root by default.
+	compress : bool
+		Whether to compress the file.
+
+	Returns
+	-------
+		None.
+		Writes '<name>.history.npz' to disk.
+
+	"""
+
+	save_arrays(history, name, root, compress, history_suffix)
+
+
+def load_history(name, root=None, keys=None):
+	"""Loads a training history, saved by save_history, or logged epoch by epoch (see append_epoch).
+	The log is read instead of the saved history when it was written later.
+
+	Parameters
+	----------
+	name : str
+		The name of the history, e.g. 'minimalLSTM'.
+	root : str
+		The directory of the file. default_root by default.
+	keys : str list
+		The metrics to read. All of them by default.
+
+	Returns
+	-------
+	history : dict of str -> np array
+		The metrics of each epoch, e.g. history['val_acc'].
+
+	"""
+
+	saved = artifact_path(name, history_suffix, root)
+	logged = artifact_path(name, epochs_suffix, root)
+	# The log of a training still running, or interrupted, is newer than the history of the previous one
+	if os.path.exists(saved) and not (os.path.exists(logged) and os.path.getmtime(logged) > os.path.getmtime(saved)):
+		return load_arrays(name, root, keys, history_suffix)
+	epochs = load_epochs(name, root)
+	return dict((key, epochs[key]) for key in (epochs if keys is None else keys))
+
+
+def append_epoch(name, metrics, root=None):
+	"""Appends the metrics of one epoch to the log of a training, without rewriting it.
+
+	Parameters
+	----------
+	name : str
+		The name of the history, e.g. 'minimalLSTM'.
+	metrics : dict of str -> float
+		The metrics of the epoch, e.g. the logs given to the callbacks of Keras.
+	root : str
+		The directory of the file. default_root by default.
+
+	Returns
+	-------
+		None.
+		Appends a line to '<name>.history.jsonl'.
+
+	"""
+
+	path = artifact_path(name, epochs_suffix, root)
+	if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+		os.makedirs(os.path.dirname(path))
+	line = json.dumps(dict((key, float(value)) for key, value in metrics.items()), sort_keys=True) + '\n'
+	# A single write per line, so that a line is never interleaved with another one
+	with open(path, 'a') as f:
+		f.write(line)
+		f.flush()
+
+
+def load_epochs(name, root=None):
+	"""Reads the log written by append_epoch, as columns.
+	A last line cut by an interrupted training is ignored.
+
+	Parameters
+	----------
+	name : str
+		The name of the history, e.g. 'minimalLSTM'.
+	root : str
+		The directory of the file. default_root by default.
+
+	Returns
+	-------
+	history : dict of str -> np array
+		The metrics of each epoch. An epoch missing a metric has NaN for it.
+
+	"""
+
+	epochs = []
+	with open(artifact_path(name, epochs_suffix, root)) as f:
+		for line in f:
+			try:
+				epochs.append(json.loads(line))
+			except ValueError:
+				break
+	keys = sorted(set(key for epoch in epochs for key in epoch))
+	return dict((key, np.array([epoch.get(key, np.nan) for epoch in epochs])) for key in keys)
 
 
 def save(obj, name):
 	"""Saves training history (dict) and other python objects, serialized.
-	Writes '.pickle' files to disk.
+	Writes '.pickle' files to disk. Prefer save_history for training histories.
 
 	Parameters
 	----------
@@ -29,13 +278,12 @@ def save(obj, name):
 		Writes generated pickle to disk.
 
 	"""
-	filename = open("code/models/" + name + ".pickle", "wb")
-	pickle.dump(obj, filename)
-	filename.close()
+	atomic_write(artifact_path(name, '.pickle'), lambda f: pickle.dump(obj, f))
 
 
 def load_pickled(filename):
 	"""Loads serialized python objects from ".pickle" files.
+	Only load files you trust : unpickling can execute arbitrary code.
 
 	Parameters
 	----------
@@ -51,3 +299,50 @@ def load_pickled(filename):
 	with open(filename, 'rb') as pickle_file:
 		obj = pickle.load(pickle_file)
 	return obj
+
+
+def migrate_pickles(root=None, compress=False, remove=False):
+	"""Converts the training histories pickled in a directory to '.history.npz' files.
+
+	Parameters
+	----------
+	root : str
+		The directory of the histories. default_root by default.
+	compress : bool
+		Whether to compress the new files.
+	remove : bool
+		Whether to delete each pickle once converted and checked.
+
+	Returns
+	-------
+	names : str list
+		The names of the converted histories.
+
+	"""
+
+	root = default_root if root is None else root
+	names = []
+	for filename in sorted(os.listdir(root)):
+		if not filename.endswith('.pickle'):
+			continue
+		name = filename[:-len('.pickle')]
+		history = load_pickled(os.path.join(root, filename))
+		save_history(history, name, root, compress)
+		# The new file must give back the same values
+		converted = load_history(name, root)
+		if sorted(converted) != sorted(history) or not all(
+				np.array_equal(converted[key], np.asarray(history[key])) for key in history):
+			raise ValueError(filename + ' could not be converted without loss.')
+		if remove:
+			os.remove(os.path.join(root, filename))
+		names.append(name)
+		print(filename, '->', name + history_suffix)
+	return names
+
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+		print('Usage : python code/lib/read_write_helpers.py migrate [directory] [--compress] [--remove]')
+		sys.exit(1)
+	arguments = [a for a in sys.argv[2:] if not a.startswith('--')]
+	migrate_pickles(arguments[0] if arguments else None, '--compress' in sys.argv, '--remove' in sys.argv)
@@ -8,12 +8,16 @@ How to use this code
 	from keras.models import Sequential
 	model = Sequential()
 	model.compile(loss='mse', optimizer='rmsprop', metrics=[tr.frame_loss])
+	model.fit(X, y, epochs=10, callbacks=[tr.EpochLogger('myModel')])
 
 """
 
 import keras.backend as K
+import keras.callbacks
 import numpy as np 
 import tensorflow as tf
+import os
+import read_write_helpers as rw
 
 def frame_loss(y_true, y_pred):
 	""" A frame-wise loss measure more suitable to sparse data like Midi vectors.
@@ -43,3 +47,45 @@ def frame_loss(y_true, y_pred):
 	score = (falses+true_positives)/true_positives
 	return score
 
+
+class EpochLogger(keras.callbacks.Callback):
+	""" A Keras callback appending the metrics of each epoch to the log of the training (see read_write_helpers.append_epoch).
+	The history can thus be read while training, and is not lost if the training is interrupted.
+	When the training ends, the whole history is saved with read_write_helpers.save_history.
+
+	Attributes
+	----------
+	name : str
+		The name of the history, e.g. 'minimalLSTM'.
+	root : str
+		The directory of the files. read_write_helpers.default_root by default.
+	compress : bool
+		Whether to compress the saved history.
+	resume : bool
+		Whether to append to the log of a previous training, instead of starting a new one.
+
+	"""
+
+	def __init__(self, name, root=None, compress=False, resume=False):
+		super(EpochLogger, self).__init__()
+		self.name = name
+		self.root = root
+		self.compress = compress
+		self.resume = resume
+
+	def on_train_begin(self, logs=None):
+		# A new training replaces the log and the saved history of the previous one
+		if not self.resume:
+			for suffix in (rw.epochs_suffix, rw.history_suffix):
+				path = rw.artifact_path(self.name, suffix, self.root)
+				if os.path.exists(path):
+					os.remove(path)
+
+	def on_epoch_end(self, epoch, logs=None):
+		rw.append_epoch(self.name, dict(logs or {}, epoch=epoch), self.root)
+
+	def on_train_end(self, logs=None):
+		history = rw.load_epochs(self.name, self.root)
+		history.pop('epoch', None)
+		rw.save_history(history, self.name, self.root, self.compress)
+
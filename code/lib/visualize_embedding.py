@@ -1,68 +1,247 @@
 import keras
 import numpy as np
 import midi_to_data as md
+import read_write_helpers as rw
 import os
+import functools
+import hashlib
+import json
 
 from keras import models
 from keras import backend as K
 
 import matplotlib.pyplot as plt
-from sklearn.manifold import TSNE
 
 
-def load_midi_simple_visualisation(directory, patterns):
-	""" Loads the midi files and creates a trainable dataset for prediction
+def load_midi_simple_visualisation(directory, patterns, engine='music21', workers=1, subset_only=False):
+	""" Loads the midi files and creates a trainable dataset for prediction.
+	The pianorolls are read from the cache of the dataset (see midi_to_data.load_samples),
+	which is only completed with the files that are new or modified.
 
 	Parameters
 	----------
 	directory : str
 	  The location of the directory containing the midi files.
 	patterns : str list
-		The identification strings contained in the name of the subset of the data to visualize.
+		The fields of the name of the subset of the data to visualize : a progression name, 'p<permutation>'
+		and 't<transposition>', matched exactly (see midi_to_data.SampleIndex.select).
 		Examples : to visualize only the Eiffel65 progression, patterns = ['Eiffel'].
 		To visualize only the Eiffel65 progression with no permutations, patterns = ['Eiffel', 'p0']
+	engine : str
+		The midi decoder : 'music21' or 'native' (see midi_to_data.importMIDI).
+	workers : int
+		The number of processes decoding the files. None to use all the cores.
+	subset_only : bool
+		Whether to load only the subset, instead of the whole dataset with the subset highlighted.
 	
 	Returns
 	-------
 	X : np array
 	  X contains an array of the 10 chords of the given progression.
 	  This array contains, for each chord, a 128-long list indicating the activation of each midi note.
+	labels, sizes : list
+	  The color and size of each point, contrasting for the subset (see visualize_model_pattern).
 
 	"""
 
-	filenames = os.listdir(directory)
-	# Get only the files starting by "x" (data)
-	filenames = [directory + x for x in filenames if x[0] == 'x']
-	n_files = len(filenames)
+	query = md.query_from_patterns(patterns)
+	if subset_only:
+		(names, X, y) = md.load_samples(directory, engine=engine, workers=workers, **query)
+		highlighted = np.ones(len(names), dtype=bool)
+	else:
+		(names, X, y) = md.load_samples(directory, engine=engine, workers=workers)
+		highlighted = np.zeros(len(names), dtype=bool)
+		highlighted[md.SampleIndex(names).select(**query)] = True
 
-	dataX = []
-	labels = ['blue'] * n_files
-	sizes = [80]*n_files
+	# Data of shape [samples, time steps, features] expected by an LSTM network.
+	# Here (samples, 10, 128)
+	X = X.astype(float)
+	# Get the substructure we want to put forward
+	labels = ['red' if h else 'blue' for h in highlighted]
+	sizes = [400 if h else 80 for h in highlighted]
 
-	# 1 midi event = 16 channels -> Keep 1 column out of 16
-	columns_to_keep = [16 * i for i in range(10)]
+	print("Midi data loaded.")
 
-	for i, f in enumerate(filenames):
-		Xall_parts = md.importMIDI(f)
-		Xall_parts = Xall_parts['None'][:, columns_to_keep]
-		dataX.append(Xall_parts)
-		# Get the substructure we want to put forward
-		if all(pat in f for pat in patterns):
-			labels[i] = 'red'
-			sizes[i] = 400
+	return X, labels, sizes
 
-	print("Midi data loaded.")
 
-	# reshape data to be [samples, time steps, features] expected by an LSTM network.
-	# Here (samples, 10, 128)
-	X = np.array([np.transpose(x) for x in dataX])
+def embedding_function(model, layer=6):
+	# A function performing a forward pass of the data through the model, up to the given layer.
+	# Its inputs are [X, 0] for the output in test mode (no dropout), [X, 1] for training mode.
+	return K.function([model.layers[0].input, K.learning_phase()], [model.layers[layer].output])
 
-	return X, labels, sizes
 
+def extract_embeddings(X, model, output_path=None, batch_size=256, timesteps=(0,), layer=6, packed=False):
+	""" Computes the embeddings of the data by batches, and writes them incrementally to a memory-mapped .npy file.
+	Only one batch of data and of embeddings is in memory at once, whatever the number of progressions.
+
+	Parameters
+	----------
+	X : np array
+		The (samples, 10, 128) progressions, possibly memory-mapped.
+		Each batch is reshaped to the input shape of the model.
+	model : keras.models.Model
+		The model that defines the embedding space.
+	output_path : str
+		The '.npy' file where to write the embeddings. If None, they are returned in memory.
+	batch_size : int
+		The number of progressions embedded at once.
+	timesteps : int list
+		The chords of each progression whose embeddings are kept, or None to keep all of them.
+		Only used if the layer outputs sequences.
+	layer : int
+		The index of the layer whose output is the embedding.
+	packed : bool
+		Whether X holds packed pianorolls (see midi_to_data.pack_rolls), unpacked batch by batch.
+
+	Returns
+	-------
+	embeddings : np array
+		The (samples, timesteps, features) embeddings, or (samples, features) if the layer outputs no sequence.
+		Memory-mapped from output_path if given.
+
+	"""
+
+	get_embedded = embedding_function(model, layer)
+	input_shape = tuple(model.input_shape[1:])
+	n_samples = len(X)
+
+	def embed_batches(path):
+		# Fills the embeddings in memory, or in a memory-mapped file at path
+		embeddings = None
+		for i in range(0, n_samples, batch_size):
+			x = X[i:i + batch_size]
+			if packed:
+				x = md.unpack_rolls(x)
+			x = np.reshape(x, (len(x),) + input_shape)
+			embedded = get_embedded([x, 0])[0]
+			if embedded.ndim > 2 and timesteps is not None:
+				embedded = embedded[:, list(timesteps)]
+			if embeddings is None:
+				# The shape of the embeddings is only known after the first batch
+				shape = (n_samples,) + embedded.shape[1:]
+				if path is None:
+					embeddings = np.zeros(shape, dtype=np.float32)
+				else:
+					embeddings = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+			embeddings[i:i + len(x)] = embedded
+		return embeddings
+
+	if output_path is None:
+		return embed_batches(None)
+	# Written aside then renamed, so that an interrupted run leaves no truncated file
+	with rw.atomic_path(output_path) as temporary_path:
+		embeddings = embed_batches(temporary_path)
+		embeddings.flush()
+		del embeddings
+	return np.load(output_path, mmap_mode='r')
+
+
+def randomized_pca(X, n_components, seed=0, n_iter=4):
+	""" Projects the data on its principal components, with a randomized SVD (Halko et al.).
+	Only a few products with X are needed, instead of its whole SVD.
+
+	Parameters
+	----------
+	X : np array
+		The (samples, features) data.
+	n_components : int
+		The number of principal components.
+	seed : int
+		The random state of the initial projection.
+	n_iter : int
+		The number of power iterations, which make the result more accurate.
+
+	Returns
+	-------
+	X_proj : np array
+		The (samples, n_components) projection.
 
-def visualize_model_pattern(X, labels, sizes, model):
+	"""
+
+	X = X - X.mean(axis=0)
+	n_components = min(n_components, X.shape[1])
+	n_vectors = min(n_components + 10, min(X.shape))
+	Q = X.dot(np.random.RandomState(seed).normal(size=(X.shape[1], n_vectors)))
+	for _ in range(n_iter):
+		Q = np.linalg.qr(Q)[0]
+		Q = X.dot(X.T.dot(Q))
+	Q = np.linalg.qr(Q)[0]
+	components = np.linalg.svd(Q.T.dot(X), full_matrices=False)[2][:n_components]
+	return X.dot(components.T)
+
+
+def random_projection(X, n_components, seed=0):
+	# A gaussian random projection : distances are approximately preserved (Johnson-Lindenstrauss)
+	projection = np.random.RandomState(seed).normal(size=(X.shape[1], n_components)) / np.sqrt(n_components)
+	return (X - X.mean(axis=0)).dot(projection)
+
+
+def tsne(X, n_components, seed=0, pca_components=50, method='barnes_hut', perplexity=30.):
+	# The PCA first removes the noise and speeds up the distance computations of the T-SNE.
+	# The Barnes-Hut approximation makes it O(N log N) instead of O(N^2).
+	from sklearn.manifold import TSNE
+	if pca_components is not None and X.shape[1] > pca_components:
+		X = randomized_pca(X, pca_components, seed)
+	return TSNE(n_components, random_state=seed, method=method, perplexity=perplexity).fit_transform(X)
+
+
+# The dimensionality reductions of reduce_embeddings. Their parameters are passed by keyword.
+reducers = {'pca': randomized_pca,
+			'random_projection': random_projection,
+			'pca_tsne': tsne,
+			'tsne': functools.partial(tsne, pca_components=None)}
+
+
+def reduce_embeddings(embeddings, method='pca_tsne', n_components=3, seed=20150101,
+					  cache_dir='toy/dataset/projections.cache/', **params):
+	""" Reduces the dimensionality of embeddings to plot them. The projections are cached on disk,
+	keyed by the embeddings (hence the model and the data) and the parameters of the reduction.
+
+	Parameters
+	----------
+	embeddings : np array
+		The (samples, features) embeddings.
+	method : str
+		The reduction (see reducers) : 'pca_tsne' (PCA then Barnes-Hut T-SNE), 'tsne' (on the raw embeddings),
+		or 'pca' and 'random_projection', which only need numpy and take milliseconds. The T-SNE ones need sklearn.
+	n_components : int
+		The dimension of the projection.
+	seed : int
+		The random state of the reduction.
+	cache_dir : str
+		The directory of the cached projections. None to disable the cache.
+	params :
+		The other parameters of the reduction, e.g. perplexity=50 for the T-SNE.
+
+	Returns
+	-------
+	projection : np array
+		The (samples, n_components) projection.
+
+	"""
+
+	embeddings = np.ascontiguousarray(embeddings, dtype=np.float64)
+	if cache_dir is not None:
+		sha = hashlib.sha1(embeddings.data)
+		sha.update(str(embeddings.shape).encode('utf-8'))
+		sha.update(json.dumps([method, n_components, seed, sorted(params.items())]).encode('utf-8'))
+		cache_path = os.path.join(cache_dir, sha.hexdigest() + '.npy')
+		if os.path.exists(cache_path):
+			return np.load(cache_path)
+
+	print(method, "performing ...")
+	projection = reducers[method](embeddings, n_components, seed=seed, **params)
+	print("...", method, "performed.")
+
+	if cache_dir is not None:
+		rw.atomic_write(cache_path, lambda f: np.save(f, projection))
+	return projection
+
+
+def visualize_model_pattern(X, labels, sizes, model, method='pca_tsne', cache_dir='toy/dataset/projections.cache/'):
 	""" A tool to visualize given points in the embedding space.
-	A T-SNE algorithm is used to reduce the dimensionality of the data to be plotted.
+	A T-SNE algorithm is used by default to reduce the dimensionality of the data to be plotted.
 
 	Parameters
 	----------
@@ -75,6 +254,10 @@ def visualize_model_pattern(X, labels, sizes, model):
 		A subset of attention can be defined by setting its color in 'labels' to a contrasting one.
 	sizes : int list
 		Plays the same role as labels to enhance the visibility of the desired subset of points.
+	method : str
+		The dimensionality reduction (see reduce_embeddings). 'pca' is much faster than the T-SNE.
+	cache_dir : str
+		The directory of the cached projections : plotting the same data with other labels does not reduce it again.
 	
 	Returns
 	-------
@@ -83,25 +266,14 @@ def visualize_model_pattern(X, labels, sizes, model):
 
 	"""
 
-	# We define here a function that will perform a forward pass of the data through the model
-	get_embedded = K.function([model.layers[0].input, K.learning_phase()],
-	                                  [model.layers[6].output])
-
-	# Each element of embedded_chords is a 10*N numpy array representing each N embedding features
+	# The embedding of a progression is a 10*N numpy array representing each N embedding features
 	# of the 10 chords from the progression. Here N = 10 too.
-
-	# [X, 0] means that we want the output of the network for data X in test mode (no dropout).
-	# [X, 1] means training mode.
-	embedded_chords = get_embedded([X, 0])[0]
-
 	# Get only the first chord of each progression for visualisation
-	chords_to_visualize = np.array([sequence[0] for sequence in embedded_chords])
+	chords_to_visualize = extract_embeddings(X, model, timesteps=[0])[:, 0]
 
-	print("TSNE performing ...")
 	# Random state for TSNE.
 	RS = 20150101
-	chords_proj = TSNE(3, random_state=RS).fit_transform(chords_to_visualize)
-	print("... TSNE performed.")
+	chords_proj = reduce_embeddings(chords_to_visualize, method, 3, RS, cache_dir)
 
 	# We create a scatter plot.
 	f = plt.figure(figsize=(8, 8))
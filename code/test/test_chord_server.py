@@ -0,0 +1,117 @@
+import http.client
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+import numpy as np
+
+# The server imports its sibling modules directly, like the scripts of code/lib
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+import chord_server as cs
+from test.toy_models import toy_model
+
+
+class ChordServerTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.model = toy_model()
+        self.model_dir = tempfile.mkdtemp()
+        self.model.save(os.path.join(self.model_dir, 'toy.npz'))
+        self.server = cs.ChordServer(('127.0.0.1', 0), self.model_dir, ['toy'], max_delay=0.05)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.model_dir)
+
+    def post(self, body):
+        request = urllib.request.Request(self.url + '/predict', json.dumps(body).encode('utf-8'))
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def test_concurrent_requests_are_batched(self):
+        chords = [[[60 + (i + t) % 12, 64 + i % 5] for t in range(10)] for i in range(8)]
+        results = [None] * len(chords)
+
+        def call(i):
+            results[i] = self.post({'model': 'toy', 'chords': chords[i]})['pitches']
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(len(chords))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        X = np.array([cs.chords_from_pitches(c) for c in chords])
+        expected = self.model.predict(X) > 0.5
+        for i in range(len(chords)):
+            self.assertEqual(results[i], np.nonzero(expected[i])[0].tolist())
+        metrics = json.loads(urllib.request.urlopen(self.url + '/metrics').read().decode('utf-8'))
+        self.assertEqual(metrics['requests'], len(chords))
+        self.assertLess(metrics['models']['toy']['batches'], len(chords))
+
+    def test_invalid_requests(self):
+        for body in [{'model': 'toy', 'chords': [[60]]}, {'model': 'unknown', 'chords': [[60]] * 10},
+                     [1, 2], None, {'model': 1, 'chords': [[60]] * 10}, {'model': ['toy'], 'chords': [[60]] * 10}]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.post(body)
+            self.assertIn(context.exception.code, (400, 404))
+            context.exception.close()
+
+    def test_invalid_content_length(self):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1])
+        connection.putrequest('POST', '/predict')
+        connection.putheader('Content-Length', 'abc')
+        connection.endheaders()
+        self.assertEqual(connection.getresponse().status, 400)
+        connection.close()
+
+    def test_truncated_midi(self):
+        request = urllib.request.Request(self.url + '/predict?model=toy', b'MThd\x00\x00',
+                                         {'Content-Type': 'audio/midi'})
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen(request)
+        self.assertEqual(context.exception.code, 400)
+        context.exception.close()
+
+    def test_midi_output(self):
+        chords = [[60 + t, 64] for t in range(10)]
+        expected = self.post({'model': 'toy', 'chords': chords})['pitches']
+        request = urllib.request.Request(self.url + '/predict',
+                                         json.dumps({'model': 'toy', 'chords': chords, 'format': 'midi'}).encode('utf-8'))
+        with urllib.request.urlopen(request) as response:
+            self.assertEqual(response.headers['Content-Type'], 'audio/midi')
+            all_parts = cs.mr.read_pianorolls(response.read(), 16)
+        self.assertEqual(np.nonzero(all_parts['None'][:, 0])[0].tolist(), expected)
+
+    def test_failed_batch(self):
+        # Sequences that cannot be stacked together fail their batch, without stopping the worker
+        worker = cs.ModelWorker('toy', os.path.join(self.model_dir, 'toy.npz'), max_delay=0.5)
+        errors = []
+
+        def call(x):
+            try:
+                worker.predict(x)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call, args=(np.zeros((n, 128), np.float32),)) for n in (10, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(worker.predict(np.zeros((10, 128), np.float32)).shape, (128,))
+
+
+if __name__ == '__main__':
+	unittest.main()
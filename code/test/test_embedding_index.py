@@ -0,0 +1,79 @@
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+import numpy as np
+
+# The index imports its sibling modules directly, like the scripts of code/lib
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+import embedding_index as ei
+import midi_to_data as md
+
+progressions = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'toy', 'dataset', 'progressions')
+
+
+class EmbeddingIndexTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        self.embeddings = rs.randn(500, 10, 4)
+        self.names = ['progression%d' % i for i in range(500)]
+        self.queries = rs.randn(7, 10, 4)
+
+    def brute_force(self, k):
+        vectors = ei.normalize(self.embeddings.reshape(500, -1))
+        queries = ei.normalize(self.queries.reshape(7, -1))
+        similarities = queries.dot(vectors.T)
+        return np.argsort(-similarities, axis=1)[:, :k], np.sort(similarities, axis=1)[:, ::-1][:, :k]
+
+    def test_search_by_blocks(self):
+        index = ei.EmbeddingIndex(block_size=64)
+        index.add(self.embeddings, self.names)
+        rows, similarities = index.search(self.queries, k=5)
+        expected_rows, expected_similarities = self.brute_force(5)
+        np.testing.assert_array_equal(rows, expected_rows)
+        np.testing.assert_allclose(similarities, expected_similarities, rtol=1e-5)
+
+    def test_incremental_add_and_save(self):
+        index = ei.EmbeddingIndex(block_size=100)
+        for start in range(0, 500, 150):
+            index.add(self.embeddings[start:start + 150], self.names[start:start + 150])
+        self.assertEqual(len(index), 500)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'index.npz')
+            index.save(filename)
+            loaded = ei.EmbeddingIndex.load(filename)
+        names, similarities = loaded.query(self.queries, k=3)
+        expected_rows = self.brute_force(3)[0]
+        self.assertEqual(names.tolist(), [[self.names[r] for r in rows] for rows in expected_rows])
+
+    def test_incremental_build_keeps_the_cache(self):
+        # Keras is not needed : the embedding of a progression is its flattened pianoroll
+        visualize_embedding = types.ModuleType('visualize_embedding')
+        visualize_embedding.extract_embeddings = lambda X, model, **kwargs: md.unpack_rolls(X).reshape(len(X), -1)
+        samples = md.list_samples(progressions)[:4]
+        root = tempfile.mkdtemp()
+        try:
+            directory = os.path.join(root, 'progressions') + os.sep
+            os.makedirs(directory)
+
+            def copy_sample(f):
+                for prefix in 'xy':
+                    shutil.copy(os.path.join(progressions, prefix + f), directory + prefix + f)
+            for f in samples[:3]:
+                copy_sample(f)
+            with mock.patch.dict(sys.modules, {'visualize_embedding': visualize_embedding}):
+                index = ei.build_index(None, directory, engine='native')
+                copy_sample(samples[3])
+                index = ei.build_index(None, directory, engine='native', index=index)
+            self.assertEqual(index.names.tolist(), samples)
+            self.assertEqual(md.read_cache(md.default_cache_path(directory))[0].tolist(), samples)
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+	unittest.main()
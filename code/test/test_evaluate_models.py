@@ -0,0 +1,61 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+lib = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib')
+sys.path.insert(0, lib)
+import midi_to_data as md
+from test.toy_models import toy_model
+
+progressions = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'toy', 'dataset', 'progressions')
+
+# Evaluates the toy model in a new process, printing its frame metrics
+evaluate = '''
+import sys
+sys.path.insert(0, sys.argv[1])
+import evaluate_models as ev
+import model_registry as reg
+results = ev.evaluate_models(['toy'], directory=sys.argv[2], cache_dir=sys.argv[3], registry=reg.ModelRegistry(sys.argv[4]))
+print('f1', results['toy']['f1'][0])
+'''
+
+
+class EvaluateModelsTestSuite(unittest.TestCase):
+    """Cached model outputs test cases."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.directory = os.path.join(self.root, 'progressions') + os.sep
+        self.cache_dir = os.path.join(self.root, 'outputs.cache')
+        self.model_dir = os.path.join(self.root, 'models')
+        os.makedirs(self.directory)
+        os.makedirs(self.model_dir)
+        for f in md.list_samples(progressions)[:40]:
+            for prefix in 'xy':
+                shutil.copy(os.path.join(progressions, prefix + f), self.directory + prefix + f)
+        md.load_pianorolls(self.directory, md.list_samples(self.directory), engine='native')
+
+        toy_model().save(os.path.join(self.model_dir, 'toy.npz'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def run_evaluation(self, seed):
+        env = dict(os.environ, PYTHONHASHSEED=str(seed))
+        return subprocess.check_output([sys.executable, '-c', evaluate, lib, self.directory, self.cache_dir,
+                                        self.model_dir], env=env, universal_newlines=True)
+
+    def test_cache_hit_in_another_process(self):
+        first = self.run_evaluation(1)
+        self.assertIn('sequences predicted', first)
+        second = self.run_evaluation(2)
+        self.assertNotIn('sequences predicted', second)
+        self.assertEqual(first.split('\n')[-2], second.split('\n')[-2])
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+import lib.frame_metrics as fm
+
+
+def reference_frame_loss(y_true, y_pred, threshold):
+    # training_helpers.frame_loss, with numpy
+    y_pred = (y_pred > threshold).astype(float)
+    falses = np.sum(np.abs(y_true - y_pred))
+    true_positives = max(np.sum(y_pred * y_true), 0.1)
+    return (falses + true_positives) / true_positives
+
+
+class FrameMetricsTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        self.y_true = (rs.rand(50, 128) > 0.95).astype(float)
+        self.y_pred = np.clip(0.6 * self.y_true + 0.5 * rs.rand(50, 128), 0, 1)
+        self.thresholds = [0.2, 0.5, 0.8]
+
+    def test_frame_loss(self):
+        for threshold in self.thresholds:
+            self.assertAlmostEqual(fm.frame_loss(self.y_true, self.y_pred, threshold),
+                                   reference_frame_loss(self.y_true, self.y_pred, threshold))
+
+    def test_frame_loss_without_true_positives(self):
+        # No predicted pitch : the loss counts the 0.1 true positives, as training_helpers.frame_loss does
+        y_pred = np.zeros_like(self.y_pred)
+        self.assertAlmostEqual(fm.frame_loss(self.y_true, y_pred), reference_frame_loss(self.y_true, y_pred, 0.5))
+        per_sample = fm.frame_metrics(self.y_true, y_pred, [0.5], 'sample')['frame_loss'][0]
+        for y_true_sample, loss in zip(self.y_true, per_sample):
+            self.assertAlmostEqual(loss, reference_frame_loss(y_true_sample, np.zeros(128), 0.5))
+
+    def test_reductions(self):
+        for by, axis in [('sample', 1), ('pitch', 0)]:
+            metrics = fm.frame_metrics(self.y_true, self.y_pred, self.thresholds, by)
+            for k, threshold in enumerate(self.thresholds):
+                predicted = self.y_pred > threshold
+                tp = np.sum(predicted * self.y_true, axis=axis)
+                fp = np.sum(predicted * (1 - self.y_true), axis=axis)
+                fn = np.sum((1 - predicted) * self.y_true, axis=axis)
+                np.testing.assert_array_equal(metrics['tp'][k], tp)
+                np.testing.assert_array_equal(metrics['fp'][k], fp)
+                np.testing.assert_array_equal(metrics['fn'][k], fn)
+                defined = tp + fp > 0
+                np.testing.assert_allclose(metrics['precision'][k][defined], tp[defined] / (tp + fp)[defined])
+                np.testing.assert_array_equal(metrics['precision'][k][~defined], 0)
+                np.testing.assert_allclose(metrics['f1'][k], 2 * tp / np.maximum(2 * tp + fp + fn, 1))
+        overall = fm.frame_metrics(self.y_true, self.y_pred, self.thresholds)
+        per_sample = fm.frame_metrics(self.y_true, self.y_pred, self.thresholds, 'sample')
+        np.testing.assert_array_equal(overall['tp'], per_sample['tp'].sum(axis=1))
+        np.testing.assert_array_equal(overall['fn'], per_sample['fn'].sum(axis=1))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,107 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+import numpy as np
+
+# midi_to_data imports its sibling modules directly, like the scripts of code/lib
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+import midi_to_data as md
+
+progressions = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'toy', 'dataset', 'progressions')
+samples = ['Eiffel_p0_t0.mid', 'Eiffel_p0_t1.mid', 'Eiffel_p1_t0.mid', 'Eiffel_p1_t1.mid']
+
+
+class MidiCacheTestSuite(unittest.TestCase):
+    """Incremental pianoroll cache test cases, with the native midi reader."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.directory = os.path.join(self.root, 'progressions') + os.sep
+        self.cache_path = os.path.join(self.root, 'progressions.cache')
+        os.makedirs(self.directory)
+        for f in samples[:3]:
+            self.copy_sample(f)
+        # Records the samples actually parsed
+        self.decoded = []
+        self.decode_sample = md.decode_sample
+
+        def decode(directory, f, engine='music21'):
+            self.decoded.append(f)
+            return self.decode_sample(directory, f, engine)
+        md.decode_sample = decode
+
+    def tearDown(self):
+        md.decode_sample = self.decode_sample
+        shutil.rmtree(self.root)
+
+    def copy_sample(self, f):
+        for prefix in 'xy':
+            shutil.copy(os.path.join(progressions, prefix + f), self.directory + prefix + f)
+
+    def load(self):
+        self.decoded = []
+        return md.load_pianorolls(self.directory, md.list_samples(self.directory), self.cache_path, engine='native')
+
+    def expected(self):
+        decoded = [self.decode_sample(self.directory, f, 'native') for f in md.list_samples(self.directory)]
+        return np.array([x for x, y in decoded]), np.array([y for x, y in decoded])
+
+    def assertLoaded(self, X, y):
+        Xexp, yexp = self.expected()
+        self.assertTrue(np.array_equal(X, Xexp))
+        self.assertTrue(np.array_equal(y, yexp))
+
+    def test_cache_hit(self):
+        self.load()
+        self.assertEqual(sorted(self.decoded), samples[:3])
+        X, y = self.load()
+        self.assertEqual(self.decoded, [])
+        self.assertLoaded(X, y)
+
+    def test_modified_sample(self):
+        self.load()
+        # Another label for the first sample, with a later mtime
+        shutil.copy(os.path.join(progressions, 'y' + samples[3]), self.directory + 'y' + samples[0])
+        later = time.time() + 10
+        os.utime(self.directory + 'y' + samples[0], (later, later))
+        X, y = self.load()
+        self.assertEqual(self.decoded, [samples[0]])
+        self.assertLoaded(X, y)
+
+    def test_added_and_removed_samples(self):
+        self.load()
+        self.copy_sample(samples[3])
+        for prefix in 'xy':
+            os.remove(self.directory + prefix + samples[1])
+        X, y = self.load()
+        self.assertEqual(self.decoded, [samples[3]])
+        self.assertLoaded(X, y)
+        # The removed sample is dropped from the cache
+        names = md.read_cache(self.cache_path)[0]
+        self.assertEqual(list(names), [samples[0], samples[2], samples[3]])
+
+    def test_sample_order(self):
+        # The same order whatever the order of the directory listing
+        self.copy_sample(samples[3])
+        self.assertEqual(md.list_samples(self.directory), samples)
+
+    def test_old_dense_cache(self):
+        # A cache of (samples, 10, 128) pianorolls, written before they were packed, is decoded again
+        filenames = md.list_samples(self.directory)
+        stats = np.array([md.sample_stats(self.directory, f) for f in filenames], dtype=np.int64)
+        X, y = self.expected()
+        os.makedirs(self.cache_path)
+        np.save(os.path.join(self.cache_path, 'X.npy'), X)
+        np.save(os.path.join(self.cache_path, 'y.npy'), y)
+        np.savez(os.path.join(self.cache_path, 'index.npz'), names=np.array(filenames), stats=stats)
+        self.assertIsNone(md.read_cache(self.cache_path))
+        X, y = self.load()
+        self.assertEqual(sorted(self.decoded), samples[:3])
+        self.assertLoaded(X, y)
+
+
+if __name__ == '__main__':
+	unittest.main()
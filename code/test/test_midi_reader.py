@@ -0,0 +1,43 @@
+
+import os
+import unittest
+import numpy as np
+import lib.midi_reader as mr
+
+progressions = os.path.join(os.path.dirname(__file__), '..', '..', 'toy', 'dataset', 'progressions')
+
+
+class MidiReaderTestSuite(unittest.TestCase):
+    """Native midi reader test cases."""
+
+    def test_label_chord(self):
+        # yEiffel_p0_t0 contains a single chord (F A C) lasting one beat
+        all_parts = mr.read_pianorolls(os.path.join(progressions, 'yEiffel_p0_t0.mid'), 16)
+        self.assertEqual(list(all_parts), ['None'])
+        roll = all_parts['None']
+        self.assertEqual(roll.shape, (128, 16))
+        self.assertEqual(list(np.nonzero(roll[:, 0])[0]), [65, 69, 72])
+        self.assertTrue((roll[[65, 69, 72]] == 1).all())
+        self.assertEqual(roll.sum(), 3 * 16)
+
+    def test_data_sequence(self):
+        # 10 chords of one beat each, the first one being A C E
+        roll = mr.read_pianorolls(os.path.join(progressions, 'xEiffel_p0_t0.mid'), 16)['None']
+        self.assertEqual(roll.shape, (128, 160))
+        self.assertEqual(list(np.nonzero(roll[:, 0])[0]), [57, 60, 64])
+        self.assertEqual((roll.sum(axis=0) == 3).all(), True)
+
+    def test_rasterize_notes(self):
+        # Same result as drawing the notes one slice at a time, including overlapping and empty notes
+        rs = np.random.RandomState(0)
+        pitches = rs.randint(0, 128, size=500)
+        starts = rs.randint(0, 300, size=500)
+        ends = starts + rs.randint(-2, 40, size=500)
+        expected = np.zeros((128, 320))
+        for pitch, start, end in zip(pitches, starts, ends):
+            expected[pitch, start:end] = 1
+        self.assertTrue(np.array_equal(mr.rasterize_notes(pitches, starts, ends, 320), expected))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+# The registry imports its sibling modules directly, like the scripts of code/lib
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+import model_registry as reg
+import read_write_helpers as rw
+from test.toy_models import toy_model
+
+
+class ModelRegistryTestSuite(unittest.TestCase):
+    """Model registry test cases, with numpy engine models."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for k, name in enumerate(['aModel', 'bModel', 'cModel']):
+            toy_model(seed=k).save(os.path.join(self.directory, name + '.npz'))
+        self.history = {'loss': [0.5, 0.25], 'val_loss': [0.75, 0.5]}
+        rw.save_history(self.history, 'a', self.directory)
+        self.size = reg.model_size(reg.nr.NumpyModel.load(os.path.join(self.directory, 'aModel.npz')))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def cached(self, registry):
+        return [os.path.splitext(os.path.basename(path))[0] for path in registry.cache]
+
+    def test_listing(self):
+        registry = reg.ModelRegistry(self.directory)
+        self.assertEqual(registry.list_models(), ['aModel', 'bModel', 'cModel'])
+        self.assertEqual(registry.list_histories(), ['a'])
+
+    def test_eviction_by_number(self):
+        registry = reg.ModelRegistry(self.directory, max_models=2)
+        a = registry.get('aModel')
+        registry.get('bModel')
+        self.assertIs(registry.get('aModel'), a)
+        registry.get('cModel')
+        # b was the least recently used
+        self.assertEqual(self.cached(registry), ['aModel', 'cModel'])
+        self.assertIsNot(registry.get('bModel'), None)
+        self.assertEqual(self.cached(registry), ['cModel', 'bModel'])
+
+    def test_eviction_by_memory(self):
+        registry = reg.ModelRegistry(self.directory, max_models=None, max_bytes=2 * self.size)
+        for name in ['aModel', 'bModel', 'cModel']:
+            registry.get(name)
+        self.assertEqual(self.cached(registry), ['bModel', 'cModel'])
+        self.assertEqual(registry.memory(), 2 * self.size)
+        # The last model loaded is kept, even above the limit
+        registry.max_bytes = self.size // 2
+        registry.get('aModel')
+        self.assertEqual(self.cached(registry), ['aModel'])
+
+    def test_history_of_a_model(self):
+        registry = reg.ModelRegistry(self.directory)
+        # aModel was trained with the history 'a'
+        for name in ['aModel', 'a', os.path.join(self.directory, 'aModel.npz')]:
+            history = registry.history(name)
+            self.assertEqual(sorted(history), ['loss', 'val_loss'])
+            np.testing.assert_array_equal(history['val_loss'], self.history['val_loss'])
+        with self.assertRaises(ValueError):
+            registry.history('bModel')
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,71 @@
+
+import importlib.util
+import os
+import tempfile
+import unittest
+import numpy as np
+import lib.numpy_rnn as nr
+
+models = os.path.join(os.path.dirname(__file__), '..', 'models')
+
+
+def reference_lstm(x, kernel, recurrent_kernel):
+    # MinimalLSTMCell, one sample and one gate at a time
+    units = recurrent_kernel.shape[0]
+    h = np.zeros(units)
+    c = np.zeros(units)
+    gates = [slice(k * units, (k + 1) * units) for k in range(4)]
+    for x_t in x:
+        z = [x_t.dot(kernel[:, g]) + h.dot(recurrent_kernel[:, g]) for g in gates]
+        i, f, o = nr.hard_sigmoid(z[0]), nr.hard_sigmoid(z[1]), nr.hard_sigmoid(z[3])
+        c = f * c + i * np.tanh(z[2])
+        h = o * np.tanh(c)
+    return h
+
+
+class NumpyRNNTestSuite(unittest.TestCase):
+    """Numpy inference engine test cases."""
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        self.kernel = rs.uniform(-0.3, 0.3, (12, 32)).astype(np.float32)
+        self.recurrent_kernel = rs.uniform(-0.3, 0.3, (8, 32)).astype(np.float32)
+        self.dense = [rs.uniform(-1, 1, (8, 5)).astype(np.float32), rs.uniform(-1, 1, 5).astype(np.float32)]
+        self.model = nr.NumpyModel([
+            ({'kind': 'minimal_lstm', 'return_sequences': False}, [self.kernel, self.recurrent_kernel]),
+            ({'kind': 'dense', 'activation': 'softmax'}, self.dense)])
+        self.X = rs.rand(6, 10, 12).astype(np.float32)
+
+    def test_minimal_lstm(self):
+        y = self.model.predict(self.X)
+        for x, y_x in zip(self.X, y):
+            h = reference_lstm(x.astype(np.float64), self.kernel, self.recurrent_kernel)
+            expected = nr.softmax(h.dot(self.dense[0]) + self.dense[1])
+            self.assertTrue(np.allclose(y_x, expected, atol=1e-5))
+
+    def test_run_in_several_parts(self):
+        (y, states) = self.model.run(self.X[:, :4])
+        (y, states) = self.model.run(self.X[:, 4:], states)
+        self.assertTrue(np.allclose(y, self.model.predict(self.X), atol=1e-6))
+        self.assertTrue(np.allclose(self.model.predict(self.X, batch_size=4), self.model.predict(self.X)))
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, 'model.npz')
+            self.model.save(filename)
+            loaded = nr.NumpyModel.load(filename)
+        self.assertTrue(np.array_equal(loaded.predict(self.X), self.model.predict(self.X)))
+
+    @unittest.skipIf(importlib.util.find_spec('keras') is None, 'Keras is not installed')
+    def test_keras_parity(self):
+        # The converted model gives the outputs of the committed Keras one
+        import keras
+        model = keras.models.load_model(os.path.join(models, 'nativeRNNmidiModel.h5'))
+        rs = np.random.RandomState(0)
+        X = (rs.rand(16, *model.input_shape[1:]) < 0.05).astype(np.float32)
+        y = nr.convert_model(model).predict(X)
+        self.assertTrue(np.allclose(y, model.predict(X), atol=1e-5))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,53 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+# predict_chords imports its sibling modules directly, like the scripts of code/lib
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+import predict_chords as pc
+from test.toy_models import toy_model
+
+progressions = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'toy', 'dataset', 'progressions')
+
+
+class PredictChordsTestSuite(unittest.TestCase):
+    """Chord progression generation test cases."""
+
+    def setUp(self):
+        self.model = toy_model()
+        rs = np.random.RandomState(1)
+        self.seed = (rs.rand(10, 128) < 0.03).astype(np.float32)
+
+    def full_rerun(self, n_chords, threshold=0.5, n_notes=None):
+        # Encodes the whole history again for each new chord
+        history = list(self.seed)
+        for _ in range(n_chords):
+            y_predicted = self.model.predict(np.array(history)[None])[0]
+            history.append(pc.chord_from_output(y_predicted, threshold, n_notes))
+        return np.array(history[len(self.seed):])
+
+    def test_generation_keeps_the_states(self):
+        for threshold, n_notes in [(0.5, None), (0.5, 3)]:
+            chords = pc.generate_progression(self.model, self.seed, 12, threshold, n_notes)
+            self.assertEqual(chords.shape, (12, 128))
+            np.testing.assert_array_equal(chords, self.full_rerun(12, threshold, n_notes))
+
+    def test_load_directory_without_separator(self):
+        root = tempfile.mkdtemp()
+        try:
+            directory = os.path.join(root, 'progressions')
+            os.makedirs(directory)
+            for f in ['xEiffel_p0_t0.mid', 'yEiffel_p0_t0.mid']:
+                shutil.copy(os.path.join(progressions, f), os.path.join(directory, f))
+            names, X, y = pc.load_directory(directory, engine='native')
+            self.assertEqual(names, ['Eiffel_p0_t0.mid'])
+            self.assertEqual((X.shape, y.shape), ((1, 10, 16), (1, 16)))
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+	unittest.main()
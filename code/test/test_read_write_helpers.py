@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import lib.read_write_helpers as rw
+
+
+class ReadWriteHelpersTestSuite(unittest.TestCase):
+    """Training history storage test cases."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.history = {'loss': [0.9, 0.5, 0.25], 'val_loss': [1.0, 0.75, 0.5], 'acc': [0.1, 0.4, 0.8]}
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def assertHistoryEqual(self, loaded, history):
+        self.assertEqual(sorted(loaded), sorted(history))
+        for key in history:
+            np.testing.assert_array_equal(loaded[key], history[key])
+
+    def test_save_load_history(self):
+        for compress in (False, True):
+            rw.save_history(self.history, 'model', self.root, compress)
+            self.assertHistoryEqual(rw.load_history('model', self.root), self.history)
+        self.assertEqual(os.listdir(self.root), ['model' + rw.history_suffix])
+        val_loss = rw.load_history('model', self.root, keys=['val_loss'])
+        self.assertHistoryEqual(val_loss, {'val_loss': self.history['val_loss']})
+
+    def test_object_column(self):
+        with self.assertRaises(ValueError):
+            rw.save_history({'loss': [0.5, None, [1]]}, 'model', self.root)
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_failed_write(self):
+        # The previous file is left intact, without a temporary file
+        rw.save_history(self.history, 'model', self.root)
+
+        def write(f):
+            f.write(b'partial')
+            raise IOError('disk full')
+        with self.assertRaises(IOError):
+            rw.atomic_write(os.path.join(self.root, 'model' + rw.history_suffix), write)
+        self.assertEqual(os.listdir(self.root), ['model' + rw.history_suffix])
+        self.assertHistoryEqual(rw.load_history('model', self.root), self.history)
+
+    def test_epochs_log(self):
+        rw.append_epoch('model', {'loss': 0.9}, self.root)
+        rw.append_epoch('model', {'loss': np.float32(0.5), 'val_loss': 0.75}, self.root)
+        # A line cut by an interrupted training
+        with open(os.path.join(self.root, 'model' + rw.epochs_suffix), 'a') as f:
+            f.write('{"loss": 0.2')
+        history = rw.load_history('model', self.root)
+        self.assertHistoryEqual(history, {'loss': [0.9, 0.5], 'val_loss': [np.nan, 0.75]})
+
+    def test_newer_epochs_log(self):
+        # The history of a previous training does not hide the log of the current one
+        rw.save_history(self.history, 'model', self.root)
+        old = os.path.getmtime(os.path.join(self.root, 'model' + rw.history_suffix)) - 10
+        os.utime(os.path.join(self.root, 'model' + rw.history_suffix), (old, old))
+        rw.append_epoch('model', {'loss': 0.7}, self.root)
+        self.assertHistoryEqual(rw.load_history('model', self.root), {'loss': [0.7]})
+        # Then the history saved at the end of the training
+        rw.save_history({'loss': [0.7, 0.3]}, 'model', self.root)
+        self.assertHistoryEqual(rw.load_history('model', self.root), {'loss': [0.7, 0.3]})
+
+    def test_migrate_pickles(self):
+        rw.save(self.history, os.path.join(self.root, 'model'))
+        self.assertEqual(rw.migrate_pickles(self.root, remove=True), ['model'])
+        self.assertEqual(os.listdir(self.root), ['model' + rw.history_suffix])
+        self.assertHistoryEqual(rw.load_history('model', self.root), self.history)
+
+
+if __name__ == '__main__':
+	unittest.main()
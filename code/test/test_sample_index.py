@@ -0,0 +1,75 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+import midi_to_data as md
+
+progressions = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'toy', 'dataset', 'progressions')
+samples = ['Eiffel_p0_t1.mid', 'Eiffel_p0_t10.mid', 'Eiffel_p0_t11.mid', 'Eiffel_p1_t1.mid', 'Foo_p0_t1.mid']
+
+
+class SampleIndexTestSuite(unittest.TestCase):
+    """Selection of the samples by the fields of their names test cases."""
+
+    def test_parse_sample_names(self):
+        parsed = md.parse_sample_names(['Eiffel_p2_t10.mid', 'blues1_p0_t4.mid', 'other.mid'])
+        self.assertEqual(list(parsed[0]), ['Eiffel', 'blues1', ''])
+        self.assertEqual(list(parsed[1]), [2, 0, -1])
+        self.assertEqual(list(parsed[2]), [10, 4, -1])
+
+    def test_exact_fields(self):
+        # t=1 does not select the transpositions 10 and 11
+        index = md.SampleIndex(samples)
+        self.assertEqual(list(index.names[index.select(t=1)]), [samples[0], samples[3], samples[4]])
+        self.assertEqual(list(index.select(name='Eiffel', p=0, t=1)), [0])
+        self.assertEqual(list(index.select(name='Eif')), [])
+        self.assertEqual(list(index.select()), list(range(len(samples))))
+        self.assertEqual(list(md.select_samples(samples, p=0, t=[10, 11])), [1, 2])
+
+    def test_query_from_patterns(self):
+        query = md.query_from_patterns(['Eiffel', 'Foo', 't1', 't11', 'p0'])
+        self.assertEqual(query, {'name': ['Eiffel', 'Foo'], 't': [1, 11], 'p': [0]})
+        # Repeated names select the samples of any of them
+        self.assertEqual(list(md.select_samples(samples, **query)), [0, 2, 4])
+
+
+class LoadSamplesTestSuite(unittest.TestCase):
+    """Selected rows of the pianoroll cache test cases."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.directory = os.path.join(self.root, 'progressions') + os.sep
+        self.cache_path = os.path.join(self.root, 'progressions.cache')
+        os.makedirs(self.directory)
+        for f in samples:
+            for prefix in 'xy':
+                shutil.copy(os.path.join(progressions, prefix + f), self.directory + prefix + f)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def load(self, **query):
+        return md.load_samples(self.directory, cache_path=self.cache_path, engine='native', **query)
+
+    def test_load_samples(self):
+        # Decodes the whole directory the first time, then reads the selected rows of the cache
+        for _ in range(2):
+            names, X, y = self.load(name='Eiffel', t=1)
+            self.assertEqual(list(names), [samples[0], samples[3]])
+            for f, x_row, y_row in zip(names, X, y):
+                x_exp, y_exp = md.decode_sample(self.directory, f, 'native')
+                np.testing.assert_array_equal(x_row, x_exp)
+                np.testing.assert_array_equal(y_row, y_exp)
+            self.assertEqual(sorted(md.read_cache(self.cache_path)[0]), sorted(samples))
+        names, X, y = self.load(t=[10, 11])
+        self.assertEqual(list(names), [samples[1], samples[2]])
+        self.assertEqual(X.shape, (2, 10, 128))
+        self.assertEqual(y.shape, (2, 128))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,12 @@
+import numpy as np
+import lib.numpy_rnn as nr
+
+
+def toy_model(units=8, seed=0):
+    # A small random minimal_rnn + dense model of the numpy engine, taking (timesteps, 128) chords
+    rs = np.random.RandomState(seed)
+    layers = [({'kind': 'minimal_rnn', 'return_sequences': False},
+               [0.2 * rs.randn(128, units).astype(np.float32), 0.2 * rs.randn(units, units).astype(np.float32)]),
+              ({'kind': 'dense', 'activation': 'sigmoid'},
+               [rs.randn(units, 128).astype(np.float32), np.zeros(128, np.float32)])]
+    return nr.NumpyModel(layers)
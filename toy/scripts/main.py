@@ -1,17 +1,25 @@
 """Main file.
 
 Automatically builds the toy dataset.
+The dataset is built in memory and saved as numpy arrays in 'toy/dataset/progressions.npz',
+then exported to midi files in 'toy/dataset/progressions/'. The --no-midi option skips this export.
 
 Example
 -------
 How to use this code
 
 	$ python toy/scripts/main.py
+	$ python toy/scripts/main.py --no-midi
 
 """
 
+import sys
+import numpy as np
 import progressions_list as pr
 import progressions_to_midi as gen
 
 prog_list = pr.progressions_list()
-gen.generate_all_midi_progressions(prog_list, 'toy/dataset/progressions/')
\ No newline at end of file
+(names, X, y) = gen.progressions_to_arrays(prog_list)
+np.savez('toy/dataset/progressions.npz', names=names, X=X, y=y)
+if '--no-midi' not in sys.argv:
+	gen.generate_all_midi_progressions(prog_list, 'toy/dataset/progressions/')
\ No newline at end of file
@@ -7,6 +7,8 @@ The output is written to the specified directory (by default, 'toy/dataset/progr
 
 Each sequence contains nb_notes chords, including one for labeling.
 Transpositions and circular permutations enhance the dataset size.
+The same dataset can also be built directly as numpy arrays (progressions_to_arrays),
+the midi files being then only an optional export.
 
 Example
 -------
@@ -19,6 +21,10 @@ How to use this code
 from midiutil.MidiFile import MIDIFile
 import numpy as np
 import itertools
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 
 
 # tempo : 60 bpm
@@ -71,8 +77,116 @@ def generate_midi_progression(pitches, output_name):
 		mf.writeFile(outf)
 
 
-def generate_all_midi_progressions(progressions_list, folder):
-	"""Generates parameters for generate_midi_progression by.
+def progression_pitches(prog, p, transpo):
+	"""Computes the chords of one permutation and transposition of a progression.
+
+	Parameters
+	----------
+	prog : Progression
+			The progression, as described in the file progressions_list.py.
+	p : int
+			The circular permutation, ie the index of the first chord.
+	transpo : int
+			The transposition, in semitones.
+
+	Returns
+	-------
+	pitches_data, pitches_label : int list list
+			The midi pitches of the nb_chords - 1 chords of data, and of the label chord.
+	"""
+
+	nb_permut = len(prog.chords)
+	len_base = len(prog.base)
+	pitches = []
+
+	for i in prog.chords:
+
+		# Put together the midi notes required for this chord
+		degree = i[0]
+		chord_type = i[1]
+		
+		low = prog.base[degree] + transpo
+		d2 = degree + 2
+		low2 = prog.base[d2 % len_base] + \
+			transpo + (d2 // len_base) * 12
+		d4 = degree + 4
+		low4 = prog.base[d4 % len_base] + \
+			transpo + (d4 // len_base) * 12
+		d6 = degree + 6
+		low6 = prog.base[d6 % len_base] + \
+			transpo + (d6 // len_base) * 12
+
+		if chord_type == 'ap':
+			pitches.append([low, low2, low4])
+		elif chord_type == '7th':
+			pitches.append([low, low2, low4, low6])
+
+	pitches = pitches * \
+		int((nb_chords + nb_permut) / nb_permut + 1)
+	# the first chords represent the data
+	pitches_data = pitches[p:p + nb_chords - 1]
+	# the last one is the label
+	pitches_label = [pitches[p + nb_chords - 1]]
+	return pitches_data, pitches_label
+
+
+def progression_hash(prog):
+	# Identifies the definition of a progression, along with the parameters of its files
+	definition = repr((prog.name, prog.base, prog.chords, nb_chords, global_tempo))
+	return hashlib.sha1(definition.encode('utf-8')).hexdigest()
+
+
+def progression_files(prog):
+	# The names of the files generated for a progression
+	names = []
+	for p in range(len(prog.chords)):
+		for transpo in range(12):
+			# Adding the number of the permutation and of the transposition
+			# to the file name
+			output_name = prog.name + '_p' + \
+				str(p) + '_t' + str(transpo) + '.mid'
+			names += ['x' + output_name, 'y' + output_name]
+	return names
+
+
+def generate_progression_files(prog, folder):
+	"""Writes all the permutations and transpositions of one progression.
+
+	Parameters
+	----------
+	prog : Progression
+			The progression, as described in the file progressions_list.py.
+	folder : str
+			The base name of the folder where to write the midi files.
+
+	Returns
+	-------
+	None
+			Writes generated sequences to disk.
+	"""
+
+	for p in range(len(prog.chords)):
+
+		for transpo in range(12):
+
+			output_name = prog.name + '_p' + \
+				str(p) + '_t' + str(transpo) + '.mid'
+			pitches_data, pitches_label = progression_pitches(prog, p, transpo)
+			generate_midi_progression(
+				pitches_data, folder + 'x' + output_name)
+			generate_midi_progression(
+				pitches_label, folder + 'y' + output_name)
+
+
+def default_manifest_path(folder):
+	# The manifest lies next to the dataset folder, so that it is never listed as a sample
+	return os.path.normpath(folder) + '.manifest.json'
+
+
+def generate_all_midi_progressions(progressions_list, folder, workers=None, manifest_path=None):
+	"""Generates the midi files of all the progressions, over a pool of processes.
+	A manifest records which files were generated from which progression definition :
+	only the new or modified progressions are written again, and the files of the removed ones are deleted.
 
 	Parameters
 	----------
@@ -80,59 +194,118 @@ def generate_all_midi_progressions(progressions_list, folder):
 			Progressions are custom data structures described in the file progressions_list.py.
 	folder : str
 			The base name of the folder where to write the midi files.
+	workers : int
+			The number of processes writing the files. None to use all the cores, 1 to stay in this process.
+	manifest_path : str
+			The location of the manifest. By default, 'toy/dataset/progressions.manifest.json'
+			for the folder 'toy/dataset/progressions/'.
 
 	Returns
 	-------
 	None
 	"""
 
+	if manifest_path is None:
+		manifest_path = default_manifest_path(folder)
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+
+	# The manifest maps the hash of each progression definition to its files
+	try:
+		with open(manifest_path) as f:
+			manifest = json.load(f)
+	except (IOError, OSError, ValueError):
+		manifest = {}
+
+	new_manifest = {}
+	to_generate = []
 	for prog in progressions_list:
+		key = progression_hash(prog)
+		files = progression_files(prog)
+		new_manifest[key] = files
+		up_to_date = manifest.get(key) == files and \
+			all(os.path.exists(folder + name) for name in files)
+		if not up_to_date:
+			to_generate.append(prog)
+
+	# Files of progressions that were removed or renamed
+	kept = set(name for files in new_manifest.values() for name in files)
+	removed = set(name for files in manifest.values() for name in files if name not in kept)
+	for name in removed:
+		if os.path.exists(folder + name):
+			os.remove(folder + name)
+
+	if workers is None:
+		workers = os.cpu_count() or 1
+	workers = min(workers, len(to_generate))
+	if workers > 1:
+		with ProcessPoolExecutor(workers) as pool:
+			list(pool.map(generate_progression_files, to_generate, [folder] * len(to_generate)))
+	else:
+		for prog in to_generate:
+			generate_progression_files(prog, folder)
+
+	print(len(to_generate), 'progressions written,', len(progressions_list) - len(to_generate),
+		  'up to date,', len(removed), 'files removed.')
+
+	with open(manifest_path + '.tmp', 'w') as f:
+		json.dump(new_manifest, f, indent=1, sort_keys=True)
+	os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def progressions_to_arrays(progressions_list):
+	"""Builds the dataset directly as numpy arrays, without writing and reading back midi files.
+	The samples are the same as the ones of generate_all_midi_progressions (same permutations and
+	transpositions), in the layout of midi_to_data : one 128-long activation vector per chord.
 
-		nb_permut = len(prog.chords)
-		prog_name = prog.name
-		len_base = len(prog.base)
-
-		for p in range(nb_permut):
-
-			for transpo in range(12):
-
-				# Adding the number of the permutation and of the transposition
-				# to the file name
-				output_name = prog_name + '_p' + \
-					str(p) + '_t' + str(transpo) + '.mid'
-				pitches = []
-
-				for i in prog.chords:
-
-					# Put together the midi notes required for this chord
-					degree = i[0]
-					chord_type = i[1]
-					
-					low = prog.base[degree] + transpo
-					d2 = degree + 2
-					low2 = prog.base[d2 % len_base] + \
-						transpo + (d2 // len_base) * 12
-					d4 = degree + 4
-					low4 = prog.base[d4 % len_base] + \
-						transpo + (d4 // len_base) * 12
-					d6 = degree + 6
-					low6 = prog.base[d6 % len_base] + \
-						transpo + (d6 // len_base) * 12
-
-					if chord_type == 'ap':
-						pitches.append([low, low2, low4])
-					elif chord_type == '7th':
-						pitches.append([low, low2, low4, low6])
-
-				pitches = pitches * \
-					int((nb_chords + nb_permut) / nb_permut + 1)
-				# the first chords represent the data
-				pitches_data = pitches[p:p + nb_chords - 1]
-				# the last one is the label
-				pitches_label = [pitches[p + nb_chords - 1]]
-				generate_midi_progression(
-					pitches_data, folder + 'x' + output_name)
-				generate_midi_progression(
-					pitches_label, folder + 'y' + output_name)
+	Parameters
+	----------
+	progressions_list : Progression list
+			Progressions are custom data structures described in the file progressions_list.py.
 
+	Returns
+	-------
+	names : str np array
+			The name of each sample, as in the midi files without their 'x' / 'y' prefix (eg 'Eiffel_p0_t0.mid').
+	X : np array
+			The (samples, nb_chords - 1, 128) uint8 chords of data.
+	y : np array
+			The (samples, 128) uint8 label chords.
+	"""
 
+	names = []
+	all_X = []
+	all_y = []
+	transpos = np.arange(12)
+
+	for prog in progressions_list:
+
+		base = np.array(prog.base)
+		len_base = len(base)
+		nb_permut = len(prog.chords)
+		degrees = np.array([i[0] for i in prog.chords])
+
+		# Notes of each chord (rows) : the degree, then every other degree of the scale,
+		# one octave higher when going past the end of the scale
+		steps = degrees[:, None] + np.array([0, 2, 4, 6])
+		chord_pitches = base[steps % len_base] + (steps // len_base) * 12
+		# Triads ('ap') do not use the 4th note
+		is_played = np.array([[True, True, True, i[1] == '7th'] for i in prog.chords])
+
+		# Circular permutations : chord indices of each sequence of nb_chords chords
+		sequences = (np.arange(nb_permut)[:, None] + np.arange(nb_chords)) % nb_permut
+		# (permutation, transposition, chord, note)
+		pitches = chord_pitches[sequences][:, None] + transpos[:, None, None]
+		played = np.broadcast_to(is_played[sequences][:, None], pitches.shape)
+
+		rolls = np.zeros(pitches.shape[:3] + (128,), dtype=np.uint8)
+		p, t, c, n = np.nonzero(played)
+		rolls[p, t, c, pitches[p, t, c, n]] = 1
+		rolls = rolls.reshape((nb_permut * 12, nb_chords, 128))
+
+		all_X.append(rolls[:, :nb_chords - 1])
+		all_y.append(rolls[:, nb_chords - 1])
+		names += [prog.name + '_p' + str(p) + '_t' + str(transpo) + '.mid'
+				  for p in range(nb_permut) for transpo in range(12)]
+
+	return np.array(names), np.concatenate(all_X), np.concatenate(all_y)